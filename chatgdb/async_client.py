@@ -0,0 +1,427 @@
+import asyncio
+import base64
+import json
+import socket
+import ssl
+import threading
+import time
+from urllib.parse import unquote, urlsplit
+from urllib.request import getproxies, proxy_bypass
+
+# Maximum number of requests streaming at the same time. Further requests
+# wait for a free slot.
+DEFAULT_MAX_CONCURRENCY = 4
+
+# Seconds a whole request (connect, send, stream the response) may take
+DEFAULT_DEADLINE = 120
+
+# Seconds allowed for the TCP/TLS connection to be established
+CONNECT_TIMEOUT = 10
+
+# Upper bound of an error response body that is read for the error message
+_MAX_ERROR_BODY = 64 * 1024
+
+# Idle keep-alive connections kept per host, and how long one stays usable.
+# Servers drop idle connections after a while, so older ones are not reused.
+MAX_IDLE_CONNECTIONS = 2
+IDLE_TIMEOUT = 30
+
+# Seconds allowed, after the "[DONE]" event, for the rest of the response
+# to arrive so the connection can be reused
+_DRAIN_TIMEOUT = 1.0
+
+
+class HTTPStatusError(Exception):
+    """The API answered with a non-200 status."""
+
+    def __init__(self, status, reason, body=""):
+        super(HTTPStatusError, self).__init__(f"{status} {reason}")
+        self.status = status
+        self.reason = reason
+        self.body = body
+
+
+def _split_url(api_url):
+    parts = urlsplit(api_url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError(f"Unsupported API URL: {api_url}")
+    use_ssl = parts.scheme == "https"
+    port = parts.port or (443 if use_ssl else 80)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    return parts.hostname, port, use_ssl, path
+
+
+async def _read_response_head(reader):
+    status_line = (await reader.readline()).decode("latin-1")
+    parts = status_line.split(" ", 2)
+    if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+        raise ConnectionError(f"Malformed HTTP status line: {status_line.strip()!r}")
+    status = int(parts[1])
+    reason = parts[2].strip() if len(parts) > 2 else ""
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return status, reason, headers
+
+
+async def _iter_body(reader, headers):
+    """Yields the raw response body in pieces, undoing chunked encoding."""
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        while True:
+            size_line = await reader.readline()
+            if not size_line:
+                return
+            size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+            if size == 0:
+                # Skip trailers up to the final blank line
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return
+            data = await reader.readexactly(size)
+            await reader.readexactly(2)
+            yield data
+    elif "content-length" in headers:
+        remaining = int(headers["content-length"])
+        while remaining > 0:
+            data = await reader.read(min(remaining, 65536))
+            if not data:
+                return
+            remaining -= len(data)
+            yield data
+    else:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            yield data
+
+
+def _proxy_for(scheme, host):
+    """Returns the split proxy URL from the environment for host, or None."""
+    proxy = getproxies().get(scheme)
+    if not proxy or proxy_bypass(host):
+        return None
+    return urlsplit(proxy if "://" in proxy else "http://" + proxy)
+
+
+def _proxy_auth_header(proxy):
+    if not proxy.username:
+        return ""
+    credentials = f"{unquote(proxy.username)}:{unquote(proxy.password or '')}"
+    return "Proxy-Authorization: Basic " + base64.b64encode(credentials.encode()).decode() + "\r\n"
+
+
+def _connect_tunnel(proxy, host, port):
+    """Opens a CONNECT tunnel through an HTTP proxy (blocking)."""
+    sock = socket.create_connection((proxy.hostname, proxy.port or 80), CONNECT_TIMEOUT)
+    try:
+        sock.sendall((f"CONNECT {host}:{port} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+                      + _proxy_auth_header(proxy) + "\r\n").encode("latin-1"))
+        response = b""
+        while b"\r\n\r\n" not in response:
+            data = sock.recv(4096)
+            if not data:
+                raise ConnectionError("Proxy closed the connection during CONNECT")
+            response += data
+        status_line = response.split(b"\r\n", 1)[0].decode("latin-1")
+        if len(status_line.split()) < 2 or status_line.split()[1] != "200":
+            raise ConnectionError(f"Proxy refused CONNECT: {status_line}")
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+async def _open(host, port, use_ssl):
+    """Opens a connection to host, through the environment's proxy if any.
+
+    Returns: (tuple) reader, writer and whether the request must use the
+    absolute URL because it goes to a plain HTTP proxy
+    """
+    ssl_context = ssl.create_default_context() if use_ssl else None
+    proxy = _proxy_for("https" if use_ssl else "http", host)
+    if proxy is None:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=ssl_context,
+                                    server_hostname=host if use_ssl else None),
+            CONNECT_TIMEOUT)
+        return reader, writer, False
+    if not use_ssl:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(proxy.hostname, proxy.port or 80), CONNECT_TIMEOUT)
+        return reader, writer, True
+    sock = await asyncio.get_running_loop().run_in_executor(None, _connect_tunnel, proxy, host, port)
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(ssl=ssl_context, sock=sock, server_hostname=host),
+        CONNECT_TIMEOUT)
+    return reader, writer, False
+
+
+class _StaleConnection(Exception):
+    """A reused keep-alive connection was closed by the server before answering."""
+
+
+class ConnectionPool:
+    """Idle keep-alive connections, keyed by (host, port, use_ssl).
+
+    Only used from the event-loop thread, so it needs no locking.
+    """
+
+    def __init__(self, max_idle=MAX_IDLE_CONNECTIONS, idle_timeout=IDLE_TIMEOUT):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self._idle = {}
+        self.stats = {"opened": 0, "reused": 0, "stale": 0, "prewarmed": 0}
+
+    def acquire(self, key):
+        """Returns (reader, writer) of an idle connection to key, or None."""
+        connections = self._idle.get(key)
+        now = time.monotonic()
+        while connections:
+            reader, writer, since = connections.pop()
+            if now - since < self.idle_timeout and not writer.is_closing() and not reader.at_eof():
+                self.stats["reused"] += 1
+                return reader, writer
+            writer.close()
+        return None
+
+    def release(self, key, reader, writer):
+        """Keeps a connection whose response was read completely for reuse."""
+        connections = self._idle.setdefault(key, [])
+        if len(connections) >= self.max_idle:
+            writer.close()
+            return
+        connections.append((reader, writer, time.monotonic()))
+
+    async def open(self, host, port, use_ssl):
+        self.stats["opened"] += 1
+        return await _open(host, port, use_ssl)
+
+    async def prewarm(self, api_url):
+        """Opens a connection to the API host (TCP, proxy tunnel, TLS) ahead of the first request.
+
+        Returns: (bool) False if the connection cannot be pooled (plain HTTP proxy)
+        """
+        host, port, use_ssl, _ = _split_url(api_url)
+        reader, writer, absolute_target = await self.open(host, port, use_ssl)
+        if absolute_target:
+            writer.close()
+            return False
+        self.release((host, port, use_ssl), reader, writer)
+        self.stats["prewarmed"] += 1
+        return True
+
+    def idle_count(self):
+        return sum(len(connections) for connections in self._idle.values())
+
+
+async def stream_events(api_url, headers, data, on_event, pool=None):
+    """Posts data as JSON and passes every server-sent event payload on.
+
+    Params:
+    api_url (str): http(s) URL of the chat completions endpoint
+    headers (dict): request headers, e.g. Authorization
+    data (dict): JSON request body
+    on_event (callable): called with the text after "data:" of each event,
+        up to but not including the "[DONE]" marker
+    pool (ConnectionPool, optional): keep-alive connections to reuse; without
+        one every request opens and closes its own connection
+
+    Raises: HTTPStatusError for non-200 answers, OSError for network errors
+    """
+    host, port, use_ssl, path = _split_url(api_url)
+    key = (host, port, use_ssl)
+    body = json.dumps(data).encode("utf-8")
+    request_headers = {
+        "Host": host if port in (80, 443) else f"{host}:{port}",
+        "Accept": "text/event-stream",
+        "Accept-Encoding": "identity",
+        "Connection": "keep-alive" if pool is not None else "close",
+    }
+    request_headers.update(headers or {})
+    request_headers["Content-Length"] = str(len(body))
+
+    if pool is not None:
+        connection = pool.acquire(key)
+        if connection is not None:
+            try:
+                return await _exchange(connection[0], connection[1], False, True, api_url, path,
+                                       request_headers, body, on_event, pool, key)
+            except _StaleConnection:
+                # Nothing was answered, so the request is sent again on a new connection
+                pool.stats["stale"] += 1
+        reader, writer, absolute_target = await pool.open(host, port, use_ssl)
+    else:
+        reader, writer, absolute_target = await _open(host, port, use_ssl)
+    await _exchange(reader, writer, absolute_target, False, api_url, path,
+                    request_headers, body, on_event, pool, key)
+
+
+async def _exchange(reader, writer, absolute_target, reused, api_url, path, request_headers, body,
+                    on_event, pool, key):
+    """Sends one request on an open connection and streams its events.
+
+    The connection is returned to pool when the response was read to its
+    end and the server keeps it open; otherwise it is closed.
+
+    Raises: _StaleConnection if a reused connection fails before the status line
+    """
+    reusable = False
+    try:
+        target = api_url if absolute_target else path
+        if absolute_target:
+            request_headers = dict(request_headers, Connection="close")
+            proxy = _proxy_for("http", key[0])
+            auth = _proxy_auth_header(proxy).strip()
+            if auth:
+                name, _, value = auth.partition(": ")
+                request_headers[name] = value
+        head = f"POST {target} HTTP/1.1\r\n" + "".join(
+            f"{name}: {value}\r\n" for name, value in request_headers.items()) + "\r\n"
+        try:
+            writer.write(head.encode("latin-1") + body)
+            await writer.drain()
+            status, reason, response_headers = await _read_response_head(reader)
+        except (OSError, asyncio.IncompleteReadError) as e:
+            if reused:
+                raise _StaleConnection() from e
+            raise
+
+        if status != 200:
+            error_body = b""
+            async for piece in _iter_body(reader, response_headers):
+                error_body += piece
+                if len(error_body) >= _MAX_ERROR_BODY:
+                    break
+            raise HTTPStatusError(status, reason, error_body.decode("utf-8", "replace"))
+
+        # Split on bytes first so multi-byte characters are never cut in half
+        pending = b""
+        pieces = _iter_body(reader, response_headers)
+        done = False
+        async for piece in pieces:
+            pending += piece
+            while b"\n" in pending:
+                raw_line, pending = pending.split(b"\n", 1)
+                line = raw_line.decode("utf-8", "replace").strip()
+                if not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    done = True
+                    break
+                on_event(payload)
+            if done:
+                break
+        if pool is not None and not absolute_target:
+            reusable = await _finish_body(pieces, reader, response_headers)
+    finally:
+        if reusable:
+            pool.release(key, reader, writer)
+        else:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                # The connection is being discarded anyway
+                pass
+
+
+async def _finish_body(pieces, reader, response_headers):
+    """Reads what is left of a response body.
+
+    Returns: (bool) True if the connection can carry another request
+    """
+    framed = ("chunked" in response_headers.get("transfer-encoding", "").lower()
+              or "content-length" in response_headers)
+    if not framed or response_headers.get("connection", "").lower() == "close":
+        return False
+
+    async def drain():
+        async for _ in pieces:
+            pass
+
+    try:
+        await asyncio.wait_for(drain(), _DRAIN_TIMEOUT)
+    except (asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError):
+        return False
+    return not reader.at_eof()
+
+
+class AsyncLLMClient:
+    """Streaming LLM client running on its own event-loop thread.
+
+    GDB and LLDB own the main thread, so all network I/O happens on a daemon
+    thread with a private asyncio loop. Requests can be submitted from any
+    thread; at most max_concurrency of them stream at the same time and each
+    one is bounded by a deadline. utils.RequestCoordinator submits stream()
+    and hands the events to the caller's thread, so callbacks may safely
+    call into the debugger.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, deadline=DEFAULT_DEADLINE):
+        self.max_concurrency = max_concurrency
+        self.deadline = deadline
+        self._loop = None
+        self._thread = None
+        self._semaphore = None
+        self._start_lock = threading.Lock()
+        self.pool = ConnectionPool()
+
+    def start(self):
+        """Starts the event-loop thread if it is not running yet."""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(ready,),
+                                            name="chatgdb-llm-loop", daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def _run_loop(self, ready):
+        asyncio.set_event_loop(self._loop)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        ready.set()
+        self._loop.run_forever()
+
+    def submit(self, coroutine):
+        """Schedules a coroutine on the loop thread.
+
+        Returns: (concurrent.futures.Future) cancelling it cancels the task
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    async def stream(self, api_url, headers, data, on_event, deadline=None):
+        """Streams one request inside the concurrency limit and deadline."""
+        async with self._semaphore:
+            await asyncio.wait_for(stream_events(api_url, headers, data, on_event, self.pool),
+                                   deadline or self.deadline)
+
+    def prewarm(self, api_url):
+        """Opens a keep-alive connection to the API host in the background.
+
+        Returns: (concurrent.futures.Future) resolves to ConnectionPool.prewarm's result
+        """
+        return self.submit(asyncio.wait_for(self.pool.prewarm(api_url), CONNECT_TIMEOUT * 2))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Returns the process-wide client, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = AsyncLLMClient()
+        return _client
@@ -4,6 +4,7 @@ from inspect import getfile, currentframe
 from urllib.request import Request, urlopen
 import json
 import sys # Import sys for stderr
+from chatgdb import fast_path
 
 PATH = dirname(abspath(getfile(currentframe())))
 
@@ -24,6 +25,15 @@ def set_url(url):
     with open(PATH + "/.url.txt", "w") as f:
         f.write("URL=\"" + url + "\"")
 
+def set_rules(rules_path):
+    """Install a fast-path rules file for ChatGDB"""
+    # Validated first, so a broken file is reported here and not at load time
+    fast_path.load_user_rules(rules_path)
+    with open(rules_path) as f:
+        rules = f.read()
+    with open(fast_path.RULES_FILE, "w") as f:
+        f.write(rules)
+
 def version():
     """Return version information"""
     with urlopen(Request("https://pypi.org/pypi/chatgdb/json"), timeout=10) as f:
@@ -54,6 +64,11 @@ def main():
         help="Provide a API url for ChatGDB",
         default="https://api.openai.com/v1/chat/completions"
     )
+    parser.add_argument(
+        '-r',
+        "--rules",
+        type=str,
+        help="Provide a JSON file of fast-path rules for ChatGDB")
     parser.add_argument(
         '-v',
         "--version",
@@ -76,6 +91,10 @@ def main():
             set_url(args.url)
             print(f"URL set to {args.url}. Stored in {PATH}/.url.txt")
 
+        if args.rules:
+            set_rules(args.rules)
+            print(f"Fast-path rules installed. Stored in {fast_path.RULES_FILE}")
+
         # Display current configuration if no arguments are passed
         if not any(vars(args).values()): # Check if any arguments were passed
             print("Current ChatGDB Configuration:")
@@ -96,7 +115,7 @@ def main():
                 print(f"  URL: Not set ({e})")
             print("\nUse 'chatgdb -h' for options to set or update these values.")
 
-    except FileNotFoundError as e:
+    except (FileNotFoundError, ValueError) as e:
         print(f"Error: {e}", file=sys.stderr) # Print to stderr
         sys.exit(1) # Exit with a non-zero status to indicate an error
     except Exception as e:
@@ -0,0 +1,192 @@
+import difflib
+import json
+import sys
+from collections import namedtuple
+
+from chatgdb import prompt_budget
+
+# Local ranking of the commands of a "help <class>" listing against the
+# query, used to skip the Stage 3 LLM call when one command clearly wins and
+# to send only the top candidates to the LLM otherwise.
+
+# Minimum score of the best command for Stage 3 to be skipped
+CONFIDENT_SCORE = 0.8
+
+# Minimum distance between the best and the second best command
+CONFIDENT_MARGIN = 0.25
+
+# Number of commands sent to the LLM when the match is not clear
+TOP_K = 15
+
+# Set to False to always ask the LLM
+ENABLED = True
+
+# Path of a JSONL file that Stage 3 decisions are appended to, or None
+SESSION_LOG = None
+
+STATS = {"queries": 0, "skipped": 0, "llm": 0}
+
+HelpEntry = namedtuple("HelpEntry", ["name", "aliases", "description", "line"])
+
+
+def parse_help_listing(help_text):
+    """Parses the command lines of a "help <class>" listing.
+
+    Lines look like "break, brea, bre, br, b -- Set breakpoint at ...". The
+    first name is the canonical one. Continuation lines without " -- " are
+    ignored.
+
+    Returns: (list) HelpEntry per command, in listing order
+    """
+    entries = []
+    for line in help_text.split("\n"):
+        names, separator, description = line.partition(" -- ")
+        if not separator:
+            continue
+        aliases = [n.strip() for n in names.split(",") if n.strip()]
+        if not aliases:
+            continue
+        entries.append(HelpEntry(aliases[0], aliases[1:], description.strip(), line))
+    return entries
+
+
+def _name_score(entry, words, word_list):
+    """Scores how directly the query names the command or one of its aliases."""
+    best = 0.0
+    for index, name in enumerate([entry.name] + entry.aliases):
+        # One and two letter aliases ("b", "bt") are only trusted as whole query words
+        parts = name.split()
+        if all(part in words for part in parts):
+            best = max(best, 1.0 if index == 0 or len(name) > 2 else 0.9)
+        elif len(name) >= 4:
+            close = difflib.get_close_matches(name, word_list, n=1, cutoff=0.85)
+            if close:
+                best = max(best, 0.6)
+    return best
+
+
+def rank_commands(query, entries, summary=""):
+    """Ranks help entries by lexical similarity to the query.
+
+    The score mixes BM25 over the names, aliases and description (normalized
+    to the best match) with a bonus when the query names the command itself.
+
+    Params:
+    query (str): the user query
+    entries (list): HelpEntry items from parse_help_listing
+    summary (str, optional): the Stage 1 summary, which uses GDB vocabulary
+
+    Returns: (list) (score, HelpEntry) pairs, best first
+    """
+    if not entries:
+        return []
+    text = f"{query} {summary}"
+    documents = [f"{e.name} {' '.join(e.aliases)} {e.description}" for e in entries]
+    bm25_scores = {index: score for score, index in prompt_budget.bm25_rank(text, documents)}
+    best_bm25 = max(bm25_scores.values()) or 1.0
+    word_list = prompt_budget.tokenize(text)
+    words = set(word_list)
+    ranked = []
+    for index, entry in enumerate(entries):
+        score = 0.6 * bm25_scores[index] / best_bm25 + 0.4 * _name_score(entry, words, word_list)
+        ranked.append((score, entry))
+    ranked.sort(key=lambda pair: -pair[0])
+    return ranked
+
+
+def is_confident(ranked):
+    """Returns True if the best ranked command is clearly ahead of the rest."""
+    if not ranked:
+        return False
+    top = ranked[0][0]
+    second = ranked[1][0] if len(ranked) > 1 else 0.0
+    return top >= CONFIDENT_SCORE and top - second >= CONFIDENT_MARGIN
+
+
+def top_k_listing(entries, ranked, k=TOP_K):
+    """Returns the help lines of the k best commands, in listing order."""
+    best = {entry.name for _, entry in ranked[:k]}
+    return "\n".join(entry.line for entry in entries if entry.name in best)
+
+
+def select_command(query, help_text, summary=""):
+    """Decides locally whether Stage 3 can be skipped.
+
+    Returns: (tuple) (selected command name or None, help text to send to
+    the LLM when no command was selected)
+    """
+    STATS["queries"] += 1
+    entries = parse_help_listing(help_text)
+    if not ENABLED or not entries:
+        STATS["llm"] += 1
+        return None, help_text
+    ranked = rank_commands(query, entries, summary)
+    if is_confident(ranked):
+        STATS["skipped"] += 1
+        return ranked[0][1].name, help_text
+    STATS["llm"] += 1
+    return None, top_k_listing(entries, ranked)
+
+
+def record_session(query, summary, command_class, help_text, selected, selected_by):
+    """Appends one Stage 3 decision to SESSION_LOG, if recording is on.
+
+    Records selected by the LLM serve as the reference when evaluating the
+    matcher with evaluate_sessions().
+    """
+    if not SESSION_LOG:
+        return
+    record = {
+        "query": query,
+        "summary": summary,
+        "command_class": command_class,
+        "help": help_text,
+        "selected": selected,
+        "selected_by": selected_by,
+    }
+    try:
+        with open(SESSION_LOG, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        sys.stderr.write(f"[CommandMatcher] Could not record session to {SESSION_LOG}: {e}\n")
+
+
+def evaluate_sessions(path):
+    """Replays recorded Stage 3 decisions through the local matcher.
+
+    Only records whose command was chosen by the LLM are used, since those
+    are the reference answers.
+
+    Returns: (dict) "records", "skip_rate" (share the matcher would decide
+    alone), "accuracy" (share of those decisions matching the LLM) and
+    "top_k_recall" (share where the LLM's choice is among the top-k sent)
+    """
+    records = skipped = correct = recalled = 0
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("selected_by") != "llm" or not record.get("selected"):
+                continue
+            entries = parse_help_listing(record["help"])
+            if not entries:
+                continue
+            records += 1
+            ranked = rank_commands(record["query"], entries, record.get("summary", ""))
+            expected = record["selected"].strip()
+            if is_confident(ranked):
+                skipped += 1
+                correct += int(ranked[0][1].name == expected)
+            top_names = set()
+            for _, entry in ranked[:TOP_K]:
+                top_names.add(entry.name)
+                top_names.update(entry.aliases)
+            recalled += int(expected in top_names)
+    return {
+        "records": records,
+        "skip_rate": skipped / records if records else 0.0,
+        "accuracy": correct / skipped if skipped else 0.0,
+        "top_k_recall": recalled / records if records else 0.0,
+    }
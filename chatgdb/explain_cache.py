@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import sys
+import time
+
+# Persistent cache of "explain" answers. Explaining "bt full" gives the same
+# answer every time for a given debugger and model, so answers are stored
+# on disk, one JSON file per entry, and replayed instead of re-requested.
+# Entries are evicted least recently used first once the cache grows past
+# MAX_ENTRIES or MAX_BYTES.
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "chatgdb", "explain")
+
+MAX_ENTRIES = 500
+MAX_BYTES = 4 * 1024 * 1024
+
+# Set to False to always ask the API
+ENABLED = True
+
+# Bumped when the entry format changes, so old entries are not read
+_FORMAT_VERSION = 1
+
+STATS = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+
+def normalize_text(text):
+    """Collapses whitespace, so "bt  full" and "bt full\n" share an entry."""
+    return " ".join(text.split())
+
+
+def make_key(kind, text, debugger, model, prompt=""):
+    """Builds the cache key of an explanation.
+
+    Params:
+    kind (str): "command" for explaining the previous command, "query" for
+        a free-form question
+    text (str): the command or question
+    debugger (str): debugger flavor and version, e.g. "gdb 14.2"
+    model (str): the model answering
+    prompt (str, optional): the instructions sent with the text
+
+    Returns: (str) hex digest, or None if there is nothing to cache
+    """
+    text = normalize_text(text)
+    if not text:
+        return None
+    material = json.dumps([_FORMAT_VERSION, kind, text, debugger, model, prompt])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(CACHE_DIR, key + ".json")
+
+
+def get(key):
+    """Returns the cached answer for key, or None.
+
+    A hit refreshes the entry's modification time, which is what eviction
+    orders by.
+    """
+    if not ENABLED or key is None:
+        return None
+    path = _entry_path(key)
+    try:
+        with open(path) as f:
+            entry = json.load(f)
+        os.utime(path)
+    except (OSError, ValueError):
+        STATS["misses"] += 1
+        return None
+    STATS["hits"] += 1
+    return entry.get("answer")
+
+
+def put(key, answer, description=""):
+    """Stores answer under key and evicts old entries if over the limits."""
+    if not ENABLED or key is None or not answer:
+        return
+    path = _entry_path(key)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump({"description": description, "answer": answer, "created": time.time()}, f)
+        os.replace(temporary, path)
+        STATS["stores"] += 1
+        _evict()
+    except OSError as e:
+        sys.stderr.write(f"[ExplainCache] Could not write {path}: {e}\n")
+
+
+def _entries():
+    """Returns (mtime, size, path) of every entry, oldest first."""
+    entries = []
+    try:
+        names = os.listdir(CACHE_DIR)
+    except OSError:
+        return entries
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    entries.sort()
+    return entries
+
+
+def _evict():
+    entries = _entries()
+    total = sum(size for _, size, _ in entries)
+    while entries and (len(entries) > MAX_ENTRIES or total > MAX_BYTES):
+        _, size, path = entries.pop(0)
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        STATS["evictions"] += 1
+
+
+def clear():
+    """Removes all entries. Returns: (int) number removed"""
+    removed = 0
+    for _, _, path in _entries():
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def format_stats():
+    """Returns the cache state and counters as text."""
+    entries = _entries()
+    total = sum(size for _, size, _ in entries)
+    return (f"Explain cache: {'on' if ENABLED else 'off'}, {len(entries)} entries, "
+            f"{total / 1024:.1f} KiB (limits {MAX_ENTRIES} entries, {MAX_BYTES // 1024} KiB) in {CACHE_DIR}\n"
+            f"Hits: {STATS['hits']}, misses: {STATS['misses']}, stored: {STATS['stores']}, "
+            f"evicted: {STATS['evictions']}\n")
@@ -0,0 +1,288 @@
+import json
+import re
+import sys
+import time
+from os.path import abspath, dirname
+from inspect import getfile, currentframe
+
+# Table-driven fast path for trivial chat queries ("break at line 42",
+# "print x", "step 5 times"). A query that fully matches a rule is turned
+# into the debugger command directly, without any LLM call.
+#
+# A rule is a dict:
+#   name     unique name, shown in statistics
+#   pattern  regular expression, matched case-insensitively against the
+#            whole normalized query; named groups are template fields
+#   gdb      GDB command template, or a list of alternatives: the first one
+#            whose fields all matched is used
+#   lldb     same for LLDB; a flavor without a template falls through to
+#            the LLM
+#   repeat   optional {flavor: group} for debuggers without a count
+#            argument: the command is emitted that many times
+# Rules that would discard state, like deleting every breakpoint, are left
+# out: a loose match must not cost the user their setup without a prompt.
+# User rules are read from .rules.json in this directory (a JSON list of
+# such dicts) and are tried before the built-in ones, so they can override
+# them by matching the same queries.
+
+RULES_FILE = dirname(abspath(getfile(currentframe()))) + "/.rules.json"
+
+# Set to False to send every query through the LLM
+ENABLED = True
+
+# Upper bound for "repeat", so "step 1000 times" cannot flood the debugger;
+# larger counts are capped with a note. Debuggers with a count argument get
+# the full count.
+MAX_REPEAT = 20
+
+_IDENT = r"[A-Za-z_][\w:]*"
+# Variables, members, array elements and dereferences: x, s.a, p->next, *p, a[3]
+_EXPR = r"[*&]?[A-Za-z_][\w.\[\]>-]*(?<![.>-])"
+_LOCATION = r"[\w./+-]+"
+
+BUILTIN_RULES = [
+    {"name": "break-line",
+     "pattern": rf"(?:set |add |put |insert )?(?:a )?(?:breakpoint|break|bp) (?:at |on )?line (?P<line>\d+)"
+                rf"(?: (?:in|of) (?:file )?(?P<file>{_LOCATION}))?",
+     "gdb": ["break {file}:{line}", "break {line}"],
+     "lldb": ["breakpoint set --file {file} --line {line}", "breakpoint set --line {line}"]},
+    {"name": "break-file-line",
+     "pattern": rf"(?:set |add |put |insert )?(?:a )?(?:breakpoint|break|bp) (?:at |on )?(?P<file>{_LOCATION}):(?P<line>\d+)",
+     "gdb": "break {file}:{line}",
+     "lldb": "breakpoint set --file {file} --line {line}"},
+    {"name": "break-function",
+     "pattern": rf"(?:set |add |put |insert )?(?:a )?(?:breakpoint|break|bp) (?:(?:at |on |in )(?:the )?(?:function )?"
+                rf"|function )?(?!(?:here|there|it|this|that|line)\b)(?P<function>{_IDENT})(?:\(\))?(?: function)?",
+     "gdb": "break {function}",
+     "lldb": "breakpoint set --name {function}"},
+    {"name": "delete-breakpoint",
+     "pattern": r"(?:delete|remove|clear) breakpoint (?:number )?#?(?P<number>\d+)",
+     "gdb": "delete {number}",
+     "lldb": "breakpoint delete {number}"},
+    {"name": "list-breakpoints",
+     "pattern": r"(?:list|show|info|display) (?:all )?(?:the )?breakpoints",
+     "gdb": "info breakpoints",
+     "lldb": "breakpoint list"},
+    {"name": "watch",
+     "pattern": rf"(?:set |add )?(?:a )?(?:watch|watchpoint (?:on|for)) (?P<expr>{_EXPR})",
+     "gdb": "watch {expr}",
+     "lldb": "watchpoint set variable {expr}"},
+    {"name": "backtrace-all-threads",
+     "pattern": r"(?:show |print |display |get )?(?:the )?(?:backtrace|stack trace|call stack|bt)s? "
+                r"(?:of|for|in) all threads",
+     "gdb": "thread apply all backtrace",
+     "lldb": "thread backtrace all"},
+    {"name": "backtrace",
+     "pattern": r"(?:show |print |display |get )?(?:me )?(?:the )?(?:backtrace|stack trace|call stack|stack|bt)",
+     "gdb": "backtrace",
+     "lldb": "thread backtrace"},
+    {"name": "run",
+     "pattern": r"run(?: the)?(?: program| process| executable)?|(?:start|launch) the (?:program|process|executable)",
+     "gdb": "run",
+     "lldb": "process launch"},
+    {"name": "continue",
+     "pattern": r"(?:continue|cont|c|resume|keep going)(?: execution| running| the program)?",
+     "gdb": "continue",
+     "lldb": "process continue"},
+    {"name": "step",
+     "pattern": r"step(?: in| into)?(?: (?P<count>\d+)(?: times?| lines?)?)?",
+     "gdb": ["step {count}", "step"],
+     "lldb": "thread step-in",
+     "repeat": {"lldb": "count"}},
+    {"name": "next",
+     "pattern": r"(?:next|step over)(?: (?P<count>\d+)(?: times?| lines?)?)?",
+     "gdb": ["next {count}", "next"],
+     "lldb": "thread step-over",
+     "repeat": {"lldb": "count"}},
+    {"name": "finish",
+     "pattern": r"finish|step out|(?:run until the )?(?:current )?function returns?|return to (?:the )?caller",
+     "gdb": "finish",
+     "lldb": "thread step-out"},
+    {"name": "frame-up",
+     "pattern": r"(?:go |move )?up(?: (?P<count>\d+))?(?: (?:a |one )?(?:stack )?frames?)?",
+     "gdb": ["up {count}", "up"],
+     "lldb": ["up {count}", "up"]},
+    {"name": "frame-down",
+     "pattern": r"(?:go |move )?down(?: (?P<count>\d+))?(?: (?:a |one )?(?:stack )?frames?)?",
+     "gdb": ["down {count}", "down"],
+     "lldb": ["down {count}", "down"]},
+    {"name": "select-frame",
+     "pattern": r"(?:select |switch to |go to )?(?:stack )?frame (?:number )?#?(?P<number>\d+)",
+     "gdb": "frame {number}",
+     "lldb": "frame select {number}"},
+    {"name": "locals",
+     "pattern": r"(?:show|list|print|display|info) (?:all )?(?:the )?(?:locals|local variables)",
+     "gdb": "info locals",
+     "lldb": "frame variable"},
+    {"name": "args",
+     "pattern": r"(?:show|list|print|display|info) (?:all )?(?:the )?(?:function )?(?:args|arguments)",
+     "gdb": "info args",
+     "lldb": "frame variable --no-locals"},
+    {"name": "registers",
+     "pattern": r"(?:show|list|print|display|info) (?:all )?(?:the )?(?:cpu )?registers",
+     "gdb": "info registers",
+     "lldb": "register read"},
+    {"name": "threads",
+     "pattern": r"(?:show|list|display|info) (?:all )?(?:the )?threads",
+     "gdb": "info threads",
+     "lldb": "thread list"},
+    {"name": "list-source",
+     "pattern": r"(?:show|list|display) (?:the )?(?:source|source code|code)(?: here| around here)?",
+     "gdb": "list",
+     "lldb": "source list"},
+    {"name": "print",
+     "pattern": rf"(?:print|p|show the value of|what is the value of|what's the value of|value of) (?P<expr>{_EXPR})",
+     "gdb": "print {expr}",
+     "lldb": "expression -- {expr}"},
+]
+
+# Spelled-out counts, only rewritten in front of a unit so names like "one"
+# in "print one" are left alone
+_NUMBER_WORDS = {"one": "1", "two": "2", "three": "3", "four": "4", "five": "5",
+                 "six": "6", "seven": "7", "eight": "8", "nine": "9", "ten": "10"}
+_NUMBER_RE = re.compile(r"\b(" + "|".join(_NUMBER_WORDS) + r")\b(?= (?:times?|lines?|frames?)\b)", re.IGNORECASE)
+_POLITE_PREFIX_RE = re.compile(r"^(?:(?:please|can you|could you|now|then|just|ok|okay),? )+", re.IGNORECASE)
+_POLITE_SUFFIX_RE = re.compile(r"(?:,? please| for me| now)+$", re.IGNORECASE)
+
+STATS = {"queries": 0, "hits": 0, "match_time": 0.0}
+
+
+class Rule:
+    """One compiled fast-path rule and its hit counter."""
+
+    def __init__(self, spec, source):
+        self.name = spec["name"]
+        self.pattern = re.compile(spec["pattern"], re.IGNORECASE)
+        self.templates = {}
+        for flavor in ("gdb", "lldb"):
+            template = spec.get(flavor)
+            if template:
+                self.templates[flavor] = [template] if isinstance(template, str) else list(template)
+        self.repeat = dict(spec.get("repeat", {}))
+        self.source = source
+        self.hits = 0
+
+    def render(self, match, flavor):
+        """Fills the first template of flavor whose fields all matched.
+
+        Returns: (str) the command(s), one per line, or None
+        """
+        fields = {k: v for k, v in match.groupdict().items() if v is not None}
+        for template in self.templates.get(flavor, []):
+            try:
+                command = template.format(**fields)
+            except (KeyError, IndexError):
+                continue
+            group = self.repeat.get(flavor)
+            count = int(fields.get(group, 1)) if group else 1
+            if count > MAX_REPEAT:
+                sys.stderr.write(f"[FastPath] Repeating '{command}' only {MAX_REPEAT} of {count} times\n")
+            return "\n".join([command] * max(1, min(count, MAX_REPEAT)))
+        return None
+
+
+def normalize_query(query):
+    """Collapses whitespace and drops politeness and trailing punctuation.
+
+    Case is kept, since expressions and file names are copied into the
+    command.
+    """
+    text = " ".join(query.split()).rstrip(".!?")
+    text = _POLITE_PREFIX_RE.sub("", text)
+    text = _POLITE_SUFFIX_RE.sub("", text)
+    text = re.sub(r"\btwice\b", "2 times", text, flags=re.IGNORECASE)
+    text = re.sub(r"\bonce\b", "1 time", text, flags=re.IGNORECASE)
+    return _NUMBER_RE.sub(lambda m: _NUMBER_WORDS[m.group(1).lower()], text)
+
+
+def load_user_rules(path=RULES_FILE):
+    """Reads the user rules file.
+
+    Returns: (list) Rule objects, empty if the file does not exist
+    Raises: ValueError if the file is not a list of valid rules
+    """
+    try:
+        with open(path) as f:
+            specs = json.load(f)
+    except FileNotFoundError:
+        return []
+    if not isinstance(specs, list):
+        raise ValueError(f"{path} must contain a JSON list of rules")
+    rules = []
+    for spec in specs:
+        if not isinstance(spec, dict) or "name" not in spec or "pattern" not in spec:
+            raise ValueError(f"Every rule in {path} needs a 'name' and a 'pattern': {spec!r}")
+        try:
+            rules.append(Rule(spec, "user"))
+        except re.error as e:
+            raise ValueError(f"Invalid pattern in rule '{spec['name']}': {e}")
+    return rules
+
+
+RULES = []
+
+
+def reload_rules(path=RULES_FILE):
+    """Rebuilds RULES from the user rules file and the built-in rules.
+
+    Hit counters of rules that still exist are kept. A broken rules file is
+    reported and skipped, so the built-in rules keep working.
+
+    Returns: (int) number of user rules loaded
+    """
+    global RULES
+    hits = {(rule.source, rule.name): rule.hits for rule in RULES}
+    try:
+        user_rules = load_user_rules(path)
+    except (OSError, ValueError) as e:
+        sys.stderr.write(f"[FastPath] Ignoring user rules: {e}\n")
+        user_rules = []
+    rules = user_rules + [Rule(spec, "builtin") for spec in BUILTIN_RULES]
+    for rule in rules:
+        rule.hits = hits.get((rule.source, rule.name), 0)
+    RULES = rules
+    return len(user_rules)
+
+
+def match_query(query, flavor):
+    """Turns a trivial query into a debugger command without the LLM.
+
+    Params:
+    query (str): the user's chat query
+    flavor (str): "gdb" or "lldb"
+
+    Returns: (tuple) (command, rule) on a match, where command may contain
+    several lines, or (None, None)
+    """
+    if not ENABLED:
+        return None, None
+    start = time.perf_counter()
+    STATS["queries"] += 1
+    text = normalize_query(query)
+    try:
+        for rule in RULES:
+            match = rule.pattern.fullmatch(text)
+            if not match:
+                continue
+            command = rule.render(match, flavor)
+            if command:
+                rule.hits += 1
+                STATS["hits"] += 1
+                return command, rule
+        return None, None
+    finally:
+        STATS["match_time"] += time.perf_counter() - start
+
+
+def format_stats():
+    """Returns the fast-path state and per-rule hit counts as text."""
+    queries = STATS["queries"]
+    average = STATS["match_time"] / queries * 1e6 if queries else 0.0
+    lines = [f"Fast path: {'on' if ENABLED else 'off'}, {STATS['hits']} of {queries} queries "
+             f"answered without the LLM (average match time {average:.1f}us)"]
+    for rule in RULES:
+        lines.append(f"  {rule.hits:6d}  {rule.name} ({rule.source})")
+    return "\n".join(lines) + "\n"
+
+
+reload_rules()
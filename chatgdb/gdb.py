@@ -1,8 +1,23 @@
 import gdb
 import sys # Added
+import time
 from chatgdb import utils
 from chatgdb import gdb_explorer # Added import
 from chatgdb import multi_stage_processor # Added
+from chatgdb import stream_executor
+from chatgdb import prompt_budget
+from chatgdb import command_matcher
+from chatgdb import fast_path
+from chatgdb import explain_cache
+from chatgdb import stop_policy
+from chatgdb import thread_snapshot
+from chatgdb import memory_digest
+from chatgdb import profiler
+from chatgdb import value_summary
+from chatgdb import source_window
+from chatgdb import watch_condition
+from chatgdb import symbol_index
+from chatgdb import warmup
 
 prev_command = ""
 chatgdb_ask_mode = False # Added global variable
@@ -14,6 +29,10 @@ COMMAND_PROMPT = (
     "User query: "
 )
 EXPLANATION_PROMPT = "Give me an explanation for this GDB command: "
+STOP_PROMPT_INSTRUCTIONS = (
+    "What are 1-2 brief, general suggestions or common next debugging steps a developer might take based on this? "
+    "Focus on actionable GDB commands or areas to investigate. Example: 'Consider `step` / `next`. Examine variable X if its value seems off.'"
+)
 
 
 class GDBCommand(gdb.Command):
@@ -28,6 +47,7 @@ class GDBCommand(gdb.Command):
         super(GDBCommand, self).__init__("chat", gdb.COMMAND_DATA)
 
     # creates api request on command invocation
+    @profiler.profiled("chat")
     def invoke(self, arg, from_tty):
         """Invokes custom GDB command and sends API request
 
@@ -45,11 +65,30 @@ class GDBCommand(gdb.Command):
             sys.stdout.write(text_chunk)
             sys.stdout.flush()
 
+        global chatgdb_ask_mode # Ensure global is used if it's a module-level variable
+
+        # Stage 5 output is executed line by line while it streams in: in agent
+        # mode each complete line runs as soon as its newline arrives, in ask
+        # mode lines are queued and confirmed one at a time afterwards.
+        executor = stream_executor.StreamedCommandExecutor(ask_mode=chatgdb_ask_mode)
+
+        # Trivial intents ("break at line 42", "step 5 times") are mapped to
+        # commands by the rule table, without any LLM round trip.
+        fast_command, rule = fast_path.match_query(arg, "gdb")
+        if fast_command:
+            gdb_printer(f"[FastPath] Rule '{rule.name}':\n{fast_command}\n")
+            for line in fast_command.split("\n"):
+                executor.feed_line(line)
+            globals()['prev_command'] = fast_command
+            executor.finish()
+            return
+
         # Call the multi-stage processor
         # The multi_stage_processor.generate_gdb_command_multi_stage function
         # will use the gdb_printer callback for any streaming output.
         # It's expected to handle its own newlines for streamed content.
-        generated_cmd_to_execute = multi_stage_processor.generate_gdb_command_multi_stage(arg, gdb_printer)
+        generated_cmd_to_execute = multi_stage_processor.generate_gdb_command_multi_stage(
+            arg, gdb_printer, line_callback=executor.feed_line)
         
         # If the multi-stage processor returns a command, it's already printed (streamed).
         # If it's a stub or has errors, it might print messages via the callback.
@@ -60,26 +99,12 @@ class GDBCommand(gdb.Command):
 
 
         globals()['prev_command'] = generated_cmd_to_execute # Update prev_command
-        
-        global chatgdb_ask_mode # Ensure global is used if it's a module-level variable
 
-        # Ask mode logic uses generated_cmd_to_execute
-        if generated_cmd_to_execute: # Check if command is not empty
-            if chatgdb_ask_mode: 
-                try:
-                    # The command has already been printed by the streaming callback.
-                    response_str = gdb.execute(f'pi print(input("Execute? (y/n): "))', to_string=True)
-                    response = response_str.strip().lower().replace('"', '').replace("'", "")
-                    if response in ["y", "yes"]:
-                        gdb.execute(generated_cmd_to_execute)
-                    else:
-                        gdb.write("Command not executed.\n")
-                except Exception as e:
-                    gdb.write(f"Error during confirmation: {e}\n")
-                    gdb.write("Command not executed due to error.\n")
-            else: # agent mode
-                gdb.execute(generated_cmd_to_execute)
-        elif not arg == "help": # Don't print error for 'chat help' if it results in empty command
+        # Lines already run in agent mode are reported even if the pipeline failed
+        # afterwards; queued lines are only offered when a command was produced.
+        executor.finish(execute_queued=bool(generated_cmd_to_execute))
+
+        if not generated_cmd_to_execute and not executor.results and not arg == "help":
              # The multi-stage processor should have printed an error message via the callback
              # if it failed to generate a command. If it returned empty without printing,
              # this message is a fallback.
@@ -97,6 +122,7 @@ class ExplainCommand(gdb.Command):
         super(ExplainCommand, self).__init__("explain", gdb.COMMAND_DATA)
 
     # creates api request on command invocation
+    @profiler.profiled("explain")
     def invoke(self, arg, from_tty):
         """Invokes custom GDB command and sends API request
 
@@ -109,7 +135,8 @@ class ExplainCommand(gdb.Command):
             sys.stdout.flush()
         
         # Use globals().get to safely access prev_command
-        utils.explain_helper(globals().get('prev_command', ''), arg, EXPLANATION_PROMPT, gdb_explain_printer)
+        utils.explain_helper(globals().get('prev_command', ''), arg, EXPLANATION_PROMPT, gdb_explain_printer,
+                             debugger=f"gdb {gdb.VERSION}")
         sys.stdout.write("\n") # Ensure a final newline after streaming
         sys.stdout.flush()
 
@@ -145,17 +172,399 @@ class ChatExploreCommand(gdb.Command):
         super(ChatExploreCommand, self).__init__("chat-explore", gdb.COMMAND_DATA, gdb.COMPLETE_SYMBOL)
         # COMPLETE_SYMBOL allows for symbol completion for arguments, which might be useful.
 
+    @profiler.profiled("chat-explore")
     def invoke(self, arg, from_tty):
+        # "--branches[=N]" tests N hypotheses from the same checkpoint instead
+        # of following a single chain of commands
+        branches = 0
+        if arg.startswith("--branches"):
+            option, _, arg = arg.partition(" ")
+            count = option.partition("=")[2]
+            branches = int(count) if count.isdigit() else 3
         if not arg:
-            gdb.write("Usage: chat-explore <your query or initial variable/command to explore>\n")
+            gdb.write("Usage: chat-explore [--branches[=N]] <your query or initial variable/command to explore>\n")
             return
         
         # Directly call gdb_explorer.explore_state.
         # explore_state will use gdb.execute and gdb.write directly.
-        gdb_explorer.explore_state(arg)
+        if branches:
+            gdb_explorer.explore_branches(arg, max_branches=branches)
+        else:
+            gdb_explorer.explore_state(arg)
 
 ChatExploreCommand() # Register the new explore command
 
+class ChatBudgetCommand(gdb.Command):
+    """Custom GDB command - chat-budget
+
+    Shows the per-stage input token budgets and the estimated size of recent
+    LLM calls, or sets a budget with 'chat-budget <stage> <tokens>'.
+    """
+    def __init__(self):
+        super(ChatBudgetCommand, self).__init__("chat-budget", gdb.COMMAND_SUPPORT)
+
+    def invoke(self, arg, from_tty):
+        args = arg.split()
+        if len(args) == 2:
+            try:
+                prompt_budget.set_budget(args[0], args[1])
+            except ValueError as e:
+                gdb.write(f"Invalid budget: {e}\n")
+                return
+            gdb.write(f"Token budget for '{args[0]}' set to {args[1]}\n")
+            return
+        if args:
+            gdb.write("Usage: chat-budget [<stage> <tokens>]\n")
+            return
+        gdb.write("Token budgets:\n")
+        for stage, tokens in sorted(prompt_budget.STAGE_BUDGETS.items()):
+            gdb.write(f"  {stage}: {tokens}\n")
+        if prompt_budget.CALL_LOG:
+            gdb.write("Recent calls (estimated input tokens / budget):\n")
+            for entry in prompt_budget.CALL_LOG:
+                usage = ""
+                if "prompt_tokens" in entry:
+                    usage = (f" (API: {entry['prompt_tokens']} input, {entry.get('cached_tokens', 0)} cached, "
+                             f"{entry.get('completion_tokens', 0)} output)")
+                gdb.write(f"  {entry['stage']}: {entry['estimated']} / {entry['budget']}{usage}\n")
+
+ChatBudgetCommand()
+
+class ChatRateCommand(gdb.Command):
+    """Custom GDB command - chat-rate
+
+    Shows the client-side rate limits and request queueing statistics, or
+    sets the limits with 'chat-rate <requests/s> <tokens/s>' ('off' disables
+    a limit).
+    """
+    def __init__(self):
+        super(ChatRateCommand, self).__init__("chat-rate", gdb.COMMAND_SUPPORT)
+
+    def invoke(self, arg, from_tty):
+        args = arg.split()
+        if len(args) == 2:
+            try:
+                limits = [None if a.lower() == "off" else float(a) for a in args]
+            except ValueError:
+                gdb.write("Usage: chat-rate [<requests/s|off> <tokens/s|off>]\n")
+                return
+            utils.COORDINATOR.configure(*limits)
+        elif args:
+            gdb.write("Usage: chat-rate [<requests/s|off> <tokens/s|off>]\n")
+            return
+        stats = utils.COORDINATOR.stats()
+        gdb.write(f"Limits: {stats['requests_per_second'] or 'off'} requests/s, "
+                  f"{stats['tokens_per_second'] or 'off'} tokens/s\n")
+        gdb.write(f"Requests sent: {stats['requests']}, shared with an identical in-flight request: {stats['coalesced']}\n")
+        gdb.write(f"Rate limited: {stats['rate_limited']} (waited {stats['total_wait']:.2f}s in total, "
+                  f"max {stats['max_wait']:.2f}s), queued now: {stats['queued']}, in flight: {stats['in_flight']}\n")
+        gdb.write(f"Ended early: {stats['stopped_early']} with a complete answer, {stats['interrupted']} by Ctrl-C; "
+                  f"{stats['cancelled_upstream']} requests cancelled at the API\n")
+
+ChatRateCommand()
+
+class ChatMatcherCommand(gdb.Command):
+    """Custom GDB command - chat-matcher
+
+    Controls the local command matcher that lets the multi-stage pipeline skip
+    its Stage 3 LLM call.
+    chat-matcher [on|off]        enable or disable it, then show statistics
+    chat-matcher record <file>   append Stage 3 decisions to a JSONL file
+    chat-matcher record off      stop recording
+    chat-matcher evaluate <file> replay recorded LLM decisions locally
+    """
+    def __init__(self):
+        super(ChatMatcherCommand, self).__init__("chat-matcher", gdb.COMMAND_SUPPORT)
+
+    def invoke(self, arg, from_tty):
+        args = arg.split(None, 1)
+        usage = "Usage: chat-matcher [on|off|record <file>|record off|evaluate <file>]\n"
+        if args and args[0] in ("on", "off") and len(args) == 1:
+            command_matcher.ENABLED = args[0] == "on"
+        elif args and args[0] == "record" and len(args) == 2:
+            command_matcher.SESSION_LOG = None if args[1] == "off" else args[1]
+        elif args and args[0] == "evaluate" and len(args) == 2:
+            try:
+                result = command_matcher.evaluate_sessions(args[1])
+            except (OSError, ValueError) as e:
+                gdb.write(f"Could not evaluate {args[1]}: {e}\n")
+                return
+            gdb.write(f"Records: {result['records']}, would skip Stage 3: {result['skip_rate']:.0%}, "
+                      f"agreeing with the LLM: {result['accuracy']:.0%}, "
+                      f"LLM choice in top {command_matcher.TOP_K}: {result['top_k_recall']:.0%}\n")
+            return
+        elif args:
+            gdb.write(usage)
+            return
+        stats = command_matcher.STATS
+        skip_rate = stats["skipped"] / stats["queries"] if stats["queries"] else 0.0
+        gdb.write(f"Matcher: {'on' if command_matcher.ENABLED else 'off'}, "
+                  f"recording to: {command_matcher.SESSION_LOG or 'off'}\n")
+        gdb.write(f"Stage 3 queries: {stats['queries']}, decided locally: {stats['skipped']} "
+                  f"({skip_rate:.0%}), sent to the LLM: {stats['llm']}\n")
+
+ChatMatcherCommand()
+
+class ChatRulesCommand(gdb.Command):
+    """Custom GDB command - chat-rules
+
+    Lists the fast-path rules with their hit counts. 'chat-rules on|off'
+    enables or disables the fast path, 'chat-rules reload' re-reads the user
+    rules file.
+    """
+    def __init__(self):
+        super(ChatRulesCommand, self).__init__("chat-rules", gdb.COMMAND_SUPPORT)
+
+    def invoke(self, arg, from_tty):
+        arg = arg.strip()
+        if arg in ("on", "off"):
+            fast_path.ENABLED = arg == "on"
+        elif arg == "reload":
+            gdb.write(f"Loaded {fast_path.reload_rules()} user rules from {fast_path.RULES_FILE}\n")
+        elif arg:
+            gdb.write("Usage: chat-rules [on|off|reload]\n")
+            return
+        gdb.write(fast_path.format_stats())
+
+ChatRulesCommand()
+
+class ChatCacheCommand(gdb.Command):
+    """Custom GDB command - chat-cache
+
+    Shows the explanation cache. 'chat-cache on|off' enables or disables it,
+    'chat-cache clear' removes all cached explanations.
+    """
+    def __init__(self):
+        super(ChatCacheCommand, self).__init__("chat-cache", gdb.COMMAND_SUPPORT)
+
+    def invoke(self, arg, from_tty):
+        arg = arg.strip()
+        if arg in ("on", "off"):
+            explain_cache.ENABLED = arg == "on"
+        elif arg == "clear":
+            gdb.write(f"Removed {explain_cache.clear()} cached explanations\n")
+        elif arg:
+            gdb.write("Usage: chat-cache [on|off|clear]\n")
+            return
+        gdb.write(explain_cache.format_stats())
+
+ChatCacheCommand()
+
+class ChatThreadsCommand(gdb.Command):
+    """Custom GDB command - chat-threads
+
+    Shows all threads grouped by identical stacks, the same snapshot the
+    assistant sees. 'chat-threads <N>' lists up to N distinct stacks.
+    """
+    def __init__(self):
+        super(ChatThreadsCommand, self).__init__("chat-threads", gdb.COMMAND_STACK)
+
+    def invoke(self, arg, from_tty):
+        try:
+            max_groups = int(arg) if arg.strip() else thread_snapshot.MAX_GROUPS
+        except ValueError:
+            gdb.write("Usage: chat-threads [max stacks]\n")
+            return
+        snapshot = thread_snapshot.ThreadSnapshot().collect()
+        gdb.write(snapshot.summary(max_groups=max_groups) + "\n")
+
+ChatThreadsCommand()
+
+class ChatDigestCommand(gdb.Command):
+    """Custom GDB command - chat-digest
+
+    Summarizes a memory region instead of dumping it: zero runs, repeated
+    patterns, poison values and canaries, pointers and strings.
+    Usage: chat-digest <address expression> [length in bytes, default 256]
+    """
+    def __init__(self):
+        super(ChatDigestCommand, self).__init__("chat-digest", gdb.COMMAND_DATA)
+
+    def invoke(self, arg, from_tty):
+        address, _, length = arg.strip().rpartition(" ")
+        if not address or not length.isdigit():
+            address, length = arg.strip(), "256"
+        if not address:
+            gdb.write("Usage: chat-digest <address expression> [length in bytes]\n")
+            return
+        gdb.write(memory_digest.digest_expression(address, int(length)) + "\n")
+
+ChatDigestCommand()
+
+class ChatProfileCommand(gdb.Command):
+    """Custom GDB command - chat-profile
+
+    Profiles the plugin's own overhead in GDB.
+    chat-profile start          start a new profile of chat, explain, chat-explore and stop assistance
+    chat-profile stop           stop profiling, keeping the data
+    chat-profile report [file]  show the report, or write it to file (raw data to file.pstats)
+    """
+    def __init__(self):
+        super(ChatProfileCommand, self).__init__("chat-profile", gdb.COMMAND_SUPPORT)
+
+    def invoke(self, arg, from_tty):
+        args = arg.split(None, 1)
+        if args == ["start"]:
+            gdb.write("Profiling started.\n" if profiler.start() else "Profiling is already running.\n")
+        elif args == ["stop"]:
+            gdb.write("Profiling stopped.\n" if profiler.stop() else "Profiling is not running.\n")
+        elif args and args[0] == "report":
+            if len(args) == 2:
+                try:
+                    profiler.dump(args[1])
+                except OSError as e:
+                    gdb.write(f"Could not write {args[1]}: {e}\n")
+                    return
+                gdb.write(f"Profile written to {args[1]} and {args[1]}.pstats\n")
+            else:
+                gdb.write(profiler.report())
+        else:
+            gdb.write("Usage: chat-profile start|stop|report [file]\n")
+
+ChatProfileCommand()
+
+class ChatWatchCommand(gdb.Command):
+    """Custom GDB command - chat-watch
+
+    Sets a breakpoint that only stops when a condition described in plain
+    English holds. The model writes the condition as a Python expression,
+    which is validated and compiled once and then evaluated locally at
+    every hit.
+    chat-watch <location> <description>   e.g. chat-watch parse.c:120 stop when len exceeds 1000
+    chat-watch <location> = <expression>  use a condition expression directly
+    chat-watch [list]                     list watch breakpoints with hit counts and timing
+    """
+    def __init__(self):
+        super(ChatWatchCommand, self).__init__("chat-watch", gdb.COMMAND_BREAKPOINTS, gdb.COMPLETE_LOCATION)
+
+    def invoke(self, arg, from_tty):
+        location, _, description = arg.strip().partition(" ")
+        description = description.strip()
+        if not location or location == "list":
+            gdb.write(watch_condition.format_watches())
+            return
+        if not description:
+            gdb.write("Usage: chat-watch <location> <condition in words> | <location> = <expression> | list\n")
+            return
+        try:
+            symbols = watch_condition.scope_symbols(location)
+        except gdb.error as e:
+            gdb.write(f"Cannot resolve location {location}: {e}\n")
+            return
+        def gdb_watch_printer(text_chunk):
+            sys.stdout.write(text_chunk)
+            sys.stdout.flush()
+
+        if description.startswith("="):
+            condition = description[1:].strip()
+        else:
+            gdb_watch_printer("ChatGDB condition: ")
+            condition = watch_condition.generate_condition(location, description, symbols, gdb_watch_printer)
+            sys.stdout.write("\n")
+            sys.stdout.flush()
+            if condition.startswith("ERROR:"):
+                return
+        try:
+            breakpoint = watch_condition.WatchBreakpoint(
+                location, description, condition, [name for name, _ in symbols] if symbols else None)
+        except ValueError as e:
+            gdb.write(f"Condition '{condition}' rejected: {e}\n")
+            return
+        gdb.write(f"chat-watch {breakpoint.number}: stops at {location} only if {condition}\n")
+
+ChatWatchCommand()
+
+class ChatBatchCommand(gdb.Command):
+    """Custom GDB command - chat-batch
+
+    Runs the chat pipeline for every query in a file, one query per line
+    (blank lines and lines starting with # are skipped). The LLM stages of
+    several queries overlap; the generated commands are printed and run in
+    file order on the GDB thread.
+    chat-batch [-j N] [--dry-run] [-v] <file>
+        -j N       queries in progress at the same time (default 4)
+        --dry-run  print the commands without running them
+        -v         also print each query's stage output
+    """
+    def __init__(self):
+        super(ChatBatchCommand, self).__init__("chat-batch", gdb.COMMAND_SUPPORT, gdb.COMPLETE_FILENAME)
+
+    @profiler.profiled("chat-batch")
+    def invoke(self, arg, from_tty):
+        args = gdb.string_to_argv(arg)
+        concurrency = multi_stage_processor.BATCH_CONCURRENCY
+        dry_run = verbose = False
+        path = None
+        try:
+            while args:
+                option = args.pop(0)
+                if option == "-j":
+                    concurrency = max(1, int(args.pop(0)))
+                elif option == "--dry-run":
+                    dry_run = True
+                elif option == "-v":
+                    verbose = True
+                elif path is None:
+                    path = option
+                else:
+                    raise ValueError(option)
+        except (IndexError, ValueError):
+            path = None
+        if path is None:
+            gdb.write("Usage: chat-batch [-j N] [--dry-run] [-v] <file>\n")
+            return
+        try:
+            with open(path) as f:
+                queries = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+        except OSError as e:
+            gdb.write(f"Could not read {path}: {e}\n")
+            return
+        if not queries:
+            gdb.write(f"No queries in {path}.\n")
+            return
+
+        totals = {"commands": 0, "failed": 0, "empty": 0}
+
+        def on_result(index, result):
+            gdb.write(f"[{index + 1}/{len(queries)}] {result.query} ({result.seconds:.2f}s)\n")
+            if verbose and result.log:
+                gdb.write(result.log if result.log.endswith("\n") else result.log + "\n")
+            if not result.command:
+                totals["empty"] += 1
+                gdb.write("  no command generated\n")
+                return
+            for line in result.command.split("\n"):
+                gdb.write(f"  {line}\n")
+            globals()['prev_command'] = result.command
+            if dry_run:
+                return
+            executor = stream_executor.StreamedCommandExecutor(ask_mode=chatgdb_ask_mode)
+            with stop_policy.suppressed():
+                for line in result.command.split("\n"):
+                    executor.feed_line(line)
+                if not executor.finish():
+                    totals["failed"] += 1
+            totals["commands"] += len(executor.results)
+
+        start = time.monotonic()
+        try:
+            multi_stage_processor.generate_batch(
+                queries, concurrency, on_result, shortcut=lambda query: fast_path.match_query(query, "gdb")[0])
+        except KeyboardInterrupt:
+            gdb.write("\n[Batch cancelled]\n")
+            return
+        elapsed = time.monotonic() - start
+        rate = len(queries) / elapsed * 60 if elapsed > 0 else 0.0
+        gdb.write(f"--- {len(queries)} queries in {elapsed:.2f}s ({rate:.1f} queries/min, {concurrency} at a time) ---\n")
+        if not dry_run:
+            gdb.write(f"Commands run: {totals['commands']}, queries with a failing command: {totals['failed']}, "
+                      f"without a command: {totals['empty']}\n")
+        elif totals["empty"]:
+            gdb.write(f"Queries without a command: {totals['empty']}\n")
+
+ChatBatchCommand()
+
+@profiler.profiled("stop")
 def on_gdb_stop(event):
     # Check if the stop event is something we want to react to.
     # For example, avoid reacting to temporary internal stops if possible.
@@ -183,34 +592,56 @@ def on_gdb_stop(event):
 
         frame_info = "Stopped at: " + ", ".join(frame_info_parts) + "\n"
         
-        locals_str = ""
-        try:
-            locals_output = gdb.execute("info locals", to_string=True)
-            if locals_output and locals_output.strip() and "No locals." not in locals_output:
-               locals_str = f"Locals:\n{locals_output.strip()}\n"
-            else:
-               locals_str = "Locals: No locals found or info locals failed.\n"
-        except Exception as e:
-            locals_str = f"Error fetching locals: {str(e)}\n"
-
-        args_str = ""
-        try:
-            args_output = gdb.execute("info args", to_string=True)
-            if args_output and args_output.strip() and "No arguments." not in args_output:
-                args_str = f"Arguments:\n{args_output.strip()}\n"
-            else:
-                args_str = "Arguments: No arguments found or info args failed.\n"
-        except Exception as e:
-            args_str = f"Error fetching arguments: {str(e)}\n"
-
-        context_summary = frame_info + args_str + locals_str
+        # Values are formatted from cached type layouts, so the same structs
+        # are not re-resolved at every stop. Frames without debug info fall
+        # back to "info locals" / "info args".
+        frame_values = value_summary.summarize_frame(current_frame)
+        if frame_values is not None:
+            arguments, local_vars = frame_values
+            args_str = ("Arguments:\n" + "\n".join(arguments) + "\n" if arguments
+                        else "Arguments: No arguments found or info args failed.\n")
+            locals_str = ("Locals:\n" + "\n".join(local_vars) + "\n" if local_vars
+                          else "Locals: No locals found or info locals failed.\n")
+        else:
+            locals_str = ""
+            try:
+                locals_output = gdb.execute("info locals", to_string=True)
+                if locals_output and locals_output.strip() and "No locals." not in locals_output:
+                   locals_str = f"Locals:\n{locals_output.strip()}\n"
+                else:
+                   locals_str = "Locals: No locals found or info locals failed.\n"
+            except Exception as e:
+                locals_str = f"Error fetching locals: {str(e)}\n"
+
+            args_str = ""
+            try:
+                args_output = gdb.execute("info args", to_string=True)
+                if args_output and args_output.strip() and "No arguments." not in args_output:
+                    args_str = f"Arguments:\n{args_output.strip()}\n"
+                else:
+                    args_str = "Arguments: No arguments found or info args failed.\n"
+            except Exception as e:
+                args_str = f"Error fetching arguments: {str(e)}\n"
+
+        # With many threads, deadlocks and contention only show up across
+        # stacks, so a grouped all-threads snapshot goes right after the frame.
+        threads_str = thread_snapshot.collect_summary()
+        if threads_str:
+            threads_str += "\n"
+
+        # Locals of big structs can be huge; what is shown to the user is not
+        # truncated, only what goes into the prompt.
+        context_summary = frame_info + threads_str + args_str + locals_str
         gdb.write(context_summary)
-
-        prompt = (
-            f"GDB has stopped. Here's the current context:\n{context_summary}\n"
-            "What are 1-2 brief, general suggestions or common next debugging steps a developer might take based on this? "
-            "Focus on actionable GDB commands or areas to investigate. Example: 'Consider `step` / `next`. Examine variable X if its value seems off.'"
-        )
+        # GDB already printed the current line for the user; the model gets
+        # the code around it, read from the mapped source file.
+        source_str = source_window.window_for_frame(current_frame)
+        if source_str:
+            context_summary = frame_info + source_str + "\n" + threads_str + args_str + locals_str
+        context_summary = prompt_budget.truncate_to_budget(
+            context_summary, prompt_budget.content_budget("stop", STOP_PROMPT_INSTRUCTIONS), keep="head")
+
+        prompt = f"GDB has stopped. Here's the current context:\n{context_summary}\n"
         
         def gdb_stop_event_printer(text_chunk):
             # Can't use gdb.write for streaming as it appends newlines.
@@ -221,7 +652,8 @@ def on_gdb_stop(event):
         # get_llm_response now handles streaming via the callback
         # and returns the full response or an "ERROR:" string.
         # The callback handles printing, so no need to print llm_suggestion directly.
-        llm_suggestion = utils.get_llm_response(prompt, gdb_stop_event_printer)
+        llm_suggestion = utils.get_llm_response(prompt, gdb_stop_event_printer, stage="stop",
+                                                system_prompt=STOP_PROMPT_INSTRUCTIONS)
         sys.stdout.write("\n") # Ensure a final newline
         sys.stdout.flush()
         
@@ -229,6 +661,9 @@ def on_gdb_stop(event):
         # via the callback and to sys.stderr. Nothing more needed here for that case.
         # The old gdb.write(f"ChatGDB Suggestion: {llm_suggestion}\n") is removed.
 
+    except KeyboardInterrupt:
+        # Ctrl-C cancelled the request; the stop itself is not affected
+        pass
     except Exception as e:
         # This will catch errors from within on_gdb_stop itself, 
         # or if get_llm_response (or underlying functions) re-raise an exception
@@ -237,8 +672,116 @@ def on_gdb_stop(event):
     finally:
         gdb.write("--- End Contextual Assistance ---\n")
 
-# Register the event handler
-gdb.events.stop.connect(on_gdb_stop)
+# Register the event handler. The policy decides which stops reach it.
+stop_policy.install(on_gdb_stop)
+
+class ChatAssistCommand(gdb.Command):
+    """Custom GDB command - chat-assist
+
+    Configures which stops get contextual assistance.
+    chat-assist [on|off]                   turn assistance on or off, then show settings
+    chat-assist enable|disable <reason>... reasons: breakpoint, watchpoint, signal, step
+    chat-assist sample <N>                 assist every Nth stop at the same PC
+    chat-assist interval <seconds>         minimum time between assists at the same PC
+    chat-assist reset                      forget per-PC history
+    """
+    def __init__(self):
+        super(ChatAssistCommand, self).__init__("chat-assist", gdb.COMMAND_SUPPORT)
+
+    def invoke(self, arg, from_tty):
+        args = arg.split()
+        usage = ("Usage: chat-assist [on|off|reset|enable <reason>...|disable <reason>...|"
+                 "sample <N>|interval <seconds>]\n")
+        if len(args) == 1 and args[0] in ("on", "off"):
+            stop_policy.ENABLED = args[0] == "on"
+        elif args == ["reset"]:
+            stop_policy.reset()
+        elif len(args) > 1 and args[0] in ("enable", "disable"):
+            unknown = [r for r in args[1:] if r not in stop_policy.REASONS]
+            if unknown:
+                gdb.write(f"Unknown stop reason(s): {', '.join(unknown)}. "
+                          f"Known: {', '.join(stop_policy.REASONS)}\n")
+                return
+            for reason in args[1:]:
+                stop_policy.REASONS[reason] = args[0] == "enable"
+        elif len(args) == 2 and args[0] in ("sample", "interval"):
+            try:
+                if args[0] == "sample":
+                    stop_policy.SAMPLE_EVERY = max(1, int(args[1]))
+                else:
+                    stop_policy.MIN_INTERVAL = max(0.0, float(args[1]))
+            except ValueError:
+                gdb.write(usage)
+                return
+        elif args:
+            gdb.write(usage)
+            return
+        gdb.write(stop_policy.format_stats())
+
+ChatAssistCommand()
+
+def _warm_prompts():
+    if not multi_stage_processor.load_prompts():
+        raise RuntimeError("prompt files could not be read")
+    return f"{len(multi_stage_processor.COMPILED_PROMPTS)} stage prompts compiled"
+
+def _warm_help():
+    # One posted event per class, so the prompt is never held up for long
+    classes = multi_stage_processor.SUPPORTED_COMMAND_CLASSES
+    for command_class in classes:
+        output = warmup.run_posted(
+            gdb.post_event, lambda c=command_class: multi_stage_processor.get_help_text(f"help {c}"))
+        if output.startswith("GDB_EXECUTION_ERROR:") or output.startswith("PYTHON_EXECUTION_ERROR:"):
+            raise RuntimeError(output.strip())
+    return f"help of {len(classes)} command classes read"
+
+def _warm_symbols():
+    # gdb.objfiles() must be read on the GDB thread; the index builds on its own thread
+    warmup.run_posted(gdb.post_event, symbol_index.INDEX.schedule)
+    ready = warmup.wait_for(symbol_index.INDEX.is_ready)
+    stats = symbol_index.INDEX.stats
+    return (f"{stats['objfiles']} objfiles, {stats['symbols']} symbols"
+            + ("" if ready else ", still building"))
+
+WARMUP_STEPS = [("connection", warmup.connect_step), ("prompts", _warm_prompts),
+                ("help", _warm_help), ("symbols", _warm_symbols)]
+
+class ChatWarmupCommand(gdb.Command):
+    """Custom GDB command - chat-warmup
+
+    Shows what the background warm-up at load did, or controls it.
+    chat-warmup [status]   show the steps, their timing and the connection pool
+    chat-warmup run        run the warm-up again now
+    chat-warmup cancel     stop a running warm-up
+    chat-warmup on|off     turn the warm-up at load on or off (saved for future sessions)
+    """
+    def __init__(self):
+        super(ChatWarmupCommand, self).__init__("chat-warmup", gdb.COMMAND_SUPPORT)
+
+    def invoke(self, arg, from_tty):
+        arg = arg.strip()
+        if arg == "run":
+            if not warmup.start(WARMUP_STEPS):
+                gdb.write("A warm-up is already running.\n")
+        elif arg == "cancel":
+            gdb.write("Warm-up cancelled.\n" if warmup.cancel() else "No warm-up is running.\n")
+        elif arg in ("on", "off"):
+            try:
+                warmup.set_enabled(arg == "on")
+            except OSError as e:
+                gdb.write(f"Could not save the setting: {e}\n")
+                return
+        elif arg not in ("", "status"):
+            gdb.write("Usage: chat-warmup [status|run|cancel|on|off]\n")
+            return
+        gdb.write(warmup.format_stats())
+
+ChatWarmupCommand()
+
+# The first chat would otherwise pay for the TLS handshake, prompt loading
+# and help/symbol indexing; do that in the background while GDB starts up.
+if warmup.is_enabled():
+    warmup.start(WARMUP_STEPS)
 
 def main():
     print("ChatGDB loaded successfully. Type 'chat help' for information "
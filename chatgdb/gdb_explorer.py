@@ -1,7 +1,98 @@
 import gdb
 import json # Ensure json is imported
+import re
 import sys # Added
 from chatgdb import utils # Assuming utils.py contains get_model, get_key, etc.
+from chatgdb import prompt_budget
+from chatgdb import symbol_index
+from chatgdb import stop_policy
+from chatgdb import thread_snapshot
+from chatgdb import memory_digest
+from chatgdb import value_summary
+from chatgdb import source_window
+from chatgdb import output_capture
+
+# Static instructions, sent as the system prompt so providers can cache them.
+# Only the query and the history change between calls.
+INITIAL_COMMAND_INSTRUCTIONS = (
+    "The user wants to start a debugging exploration related to their query. "
+    "Based on this query, what single, directly executable GDB command is the best first step to investigate? "
+    "Respond with ONLY the GDB command itself, without any explanation, preceding text, or surrounding quotes/markdown. "
+    + "To inspect a memory region, you may instead respond with 'DIGEST: <address expression> <length in bytes>' "
+    "to get a compact summary (zero runs, repeated patterns, poison values, pointers, strings) instead of a hex dump."
+)
+NEXT_STEP_INSTRUCTIONS = (
+    "Based on this history and the initial query, what is the single BEST next GDB command to execute to investigate further? "
+    "Or, if you have a strong hypothesis, state it prefixed with 'HYPOTHESIS: '. "
+    "If no more useful commands can be run or the issue is likely found, state 'DONE: ' followed by a summary. "
+    "If suggesting a GDB command, provide ONLY the command itself, without any additional explanation or formatting. "
+    "If the previous command resulted in an error, consider what might have caused it (e.g., invalid syntax, non-existent variable) and suggest a corrected command or a different approach. "
+    "To inspect a memory region, prefer 'DIGEST: <address expression> <length in bytes>' over large x/ commands; "
+    "it returns a compact summary (zero runs, repeated patterns, poison values, pointers, strings) instead of a hex dump."
+)
+
+# Branching mode: the model proposes several hypotheses with commands to
+# test each, and every branch runs from the same checkpoint of the inferior.
+BRANCH_PROPOSAL_INSTRUCTIONS = (
+    "The program is stopped and its state will be snapshotted, so several investigations can each start from this exact state. "
+    "Propose up to {branches} distinct hypotheses about the user's problem. For each one, write a line 'BRANCH: <hypothesis>' "
+    "followed by up to {steps} GDB commands, one per line, that test it from the current state. "
+    "Commands may move execution (next, step, finish, until, advance, continue). "
+    "Besides those, only inspection commands (print, x, info, backtrace, frame, list, ptype, whatis, display), "
+    "breakpoints and 'set var' are run; run, start, kill, checkpoint, restart, delete and the like are skipped. "
+    "Breakpoints and watchpoints a branch sets are removed before the next one. "
+    "To inspect a memory region, use 'DIGEST: <address expression> <length in bytes>'. Write nothing else."
+)
+BRANCH_CONCLUSION_INSTRUCTIONS = (
+    "Each hypothesis was tested separately, starting from the same snapshot of the program state. "
+    "Based on the results, respond with 'HYPOTHESIS: ' followed by the most likely explanation and the evidence for it, "
+    "or 'DONE: ' followed by a summary if the issue is found."
+)
+
+# Token budget of the selected frame's arguments and locals in the context
+FRAME_CONTEXT_TOKENS = 600
+
+# Commands a branch may run: inspection and moving execution forward. Anything
+# else (run, kill, checkpoint, restart, delete, detach, file, quit, ...) could
+# break the checkpoint bookkeeping or end the session. GDB accepts any
+# unambiguous prefix of a command name, so names are resolved before the
+# check instead of comparing the first word.
+_BRANCH_ALLOWED = ("print", "output", "printf", "echo", "x", "info", "backtrace", "where", "frame", "up", "down",
+                   "select-frame", "list", "ptype", "whatis", "display", "disassemble", "thread",
+                   "next", "step", "nexti", "stepi", "finish", "continue", "until", "advance",
+                   "break", "tbreak", "watch", "rwatch", "awatch", "set")
+
+# GDB's predefined short aliases; they win over prefix matching ("r" is run, not a prefix of return)
+_GDB_ALIASES = {"p": "print", "inspect": "print", "i": "info", "bt": "backtrace", "f": "frame", "l": "list",
+                "n": "next", "s": "step", "ni": "nexti", "si": "stepi", "fin": "finish", "c": "continue",
+                "fg": "continue", "u": "until", "b": "break", "r": "run", "k": "kill", "q": "quit",
+                "d": "delete", "j": "jump", "e": "edit", "h": "help"}
+
+def _allowed_in_branch(command):
+    """Whether a model-written branch may run command."""
+    if command.startswith("DIGEST:"):
+        return True
+    match = re.match(r"\s*([A-Za-z][\w-]*)(.*)", command)
+    if not match:
+        return False
+    word, rest = match.groups()
+    name = _GDB_ALIASES.get(word)
+    if name is None:
+        # A prefix that could mean more than one allowed command is refused
+        candidates = [allowed for allowed in _BRANCH_ALLOWED if allowed.startswith(word)]
+        if word in candidates:
+            name = word
+        elif len(candidates) == 1:
+            name = candidates[0]
+    if name not in _BRANCH_ALLOWED:
+        return False
+    args = rest.split()
+    if args and len(args[0]) >= 2 and "apply".startswith(args[0]):
+        # frame apply / thread apply run arbitrary commands
+        return False
+    if name == "set":
+        return bool(args) and args[0] in ("var", "variable")
+    return True
 
 def _explorer_printer(text_chunk):
     # Using sys.stdout for direct printing in GDB context, as gdb.write adds newlines
@@ -9,20 +100,19 @@ def _explorer_printer(text_chunk):
     sys.stdout.flush()
 
 # Placeholder for initial command generation - can be improved later
-def _generate_initial_command(query):
+def _generate_initial_command(query, symbol_context=""):
     # Construct a prompt to ask the LLM for the best initial GDB command.
-    initial_command_prompt = (
-        f"The user wants to start a debugging exploration related to the query: '{query}'. "
-        "Based on this query, what single, directly executable GDB command is the best first step to investigate? "
-        "Respond with ONLY the GDB command itself, without any explanation, preceding text, or surrounding quotes/markdown."
-    )
+    initial_command_prompt = f"User query: '{query}'"
+    if symbol_context:
+        initial_command_prompt += "\n" + symbol_context
     
     # Call the LLM to get the suggested initial command.
     # utils.get_llm_response is assumed to handle the API call and return the text response.
     # The callback will handle printing the streamed response.
     sys.stdout.write("ChatGDB Explorer (Initial Command Suggestion): ") # Prefix for clarity
     sys.stdout.flush()
-    suggested_command = utils.get_llm_response(initial_command_prompt, _explorer_printer)
+    suggested_command = utils.get_llm_response(initial_command_prompt, _explorer_printer, stage="explorer",
+                                               system_prompt=INITIAL_COMMAND_INSTRUCTIONS)
     sys.stdout.write("\n") # Ensure a final newline after streaming
     sys.stdout.flush()
     
@@ -34,9 +124,76 @@ def _generate_initial_command(query):
         
     return suggested_command.strip()
 
+def _digest_request(command):
+    """Returns (address expression, length) if command should run as a memory digest, else None.
+
+    That is the case for an explicit "DIGEST: <address> <length>" and for
+    "x/" commands large enough that their hex dump would flood the prompt.
+    """
+    if command.startswith("DIGEST:"):
+        address, _, length = command[len("DIGEST:"):].strip().rpartition(" ")
+        if address and length.isdigit():
+            return address.strip(), int(length)
+        return command[len("DIGEST:"):].strip(), 256
+    return memory_digest.parse_examine(command)
+
+def _exploration_context(query):
+    """Symbols named by the query, the source around the stop point, the
+    grouped thread stacks of multithreaded programs and the frame's values."""
+    symbol_context = symbol_index.context_for_query(query)
+    # Code around the selected frame's line, from the mapped source file
+    try:
+        source_context = source_window.window_for_frame(gdb.selected_frame())
+    except gdb.error:
+        source_context = ""
+    symbol_context = "\n".join(filter(None, [symbol_context, source_context]))
+    # Grouped stacks of all threads, so hangs and lock contention are visible
+    thread_context = thread_snapshot.collect_summary()
+    if thread_context:
+        symbol_context = "\n".join(filter(None, [
+            symbol_context, "All threads at the start of the exploration:\n" + thread_context]))
+    # Arguments and locals of the selected frame, formatted from cached type layouts
+    try:
+        frame_values = value_summary.summarize_frame(gdb.selected_frame())
+    except gdb.error:
+        frame_values = None
+    if frame_values and (frame_values[0] or frame_values[1]):
+        frame_text = prompt_budget.truncate_to_budget(
+            "\n".join(frame_values[0] + frame_values[1]), FRAME_CONTEXT_TOKENS, keep="head")
+        symbol_context = "\n".join(filter(None, [
+            symbol_context, "Arguments and locals of the selected frame:\n" + frame_text]))
+    return symbol_context
+
+def _execute_step(command):
+    """Runs one explorer command and prints it with its output.
+
+    Returns: (tuple) (output, failed)
+    """
+    digest_request = _digest_request(command)
+    try:
+        if digest_request:
+            gdb.write(f"Executing: {command} (as a {digest_request[1]}-byte memory digest)\n")
+            command_output = memory_digest.digest_expression(*digest_request)
+        else:
+            gdb.write(f"Executing: {command}\n")
+            # The explorer reasons about the stop itself; no stop assistance
+            with stop_policy.suppressed():
+                command_output = output_capture.capture(command)
+        if command_output is None: command_output = "<no output>"
+        # Strip trailing newlines that gdb.execute might add, but keep internal ones
+        command_output = command_output.rstrip('\n')
+        gdb.write(f"Output:\n{command_output}\n")
+    except Exception as e:
+        command_output = f"Error executing command '{command}': {str(e)}"
+        gdb.write(f"{command_output}\n")
+        return command_output, True
+    return command_output, False
+
 def explore_state(initial_query, max_iterations=3):
     gdb.write(f"Starting exploration for: {initial_query}\n")
     history = [] 
+    # Resolved once per exploration; the query does not change between steps
+    symbol_context = _exploration_context(initial_query)
     # current_llm_input_command will store the raw suggestion from LLM for the next command
     # It's initialized to empty, so the first command comes from _generate_initial_command
     current_llm_input_command = "" 
@@ -45,7 +202,7 @@ def explore_state(initial_query, max_iterations=3):
         gdb.write(f"--- Exploration Step {i+1}/{max_iterations} ---\n")
 
         if i == 0:
-            gdb_command_to_run = _generate_initial_command(initial_query)
+            gdb_command_to_run = _generate_initial_command(initial_query, symbol_context)
         else:
             # current_llm_input_command holds the raw suggestion from previous iteration
             # If it was a HYPOTHESIS or DONE, we would have broken already.
@@ -60,16 +217,8 @@ def explore_state(initial_query, max_iterations=3):
                 break
             gdb_command_to_run = current_llm_input_command
 
-        gdb.write(f"Executing: {gdb_command_to_run}\n")
-        try:
-            command_output = gdb.execute(gdb_command_to_run, to_string=True)
-            if command_output is None: command_output = "<no output>"
-            # Strip trailing newlines that gdb.execute might add, but keep internal ones
-            command_output = command_output.rstrip('\n') 
-            gdb.write(f"Output:\n{command_output}\n")
-        except Exception as e:
-            command_output = f"Error executing command '{gdb_command_to_run}': {str(e)}"
-            gdb.write(f"{command_output}\n")
+        command_output, failed = _execute_step(gdb_command_to_run)
+        if failed:
             history.append((gdb_command_to_run, command_output))
             # As per instructions, if an error occurs, print error and break.
             # Future improvement: let LLM try to recover.
@@ -80,19 +229,22 @@ def explore_state(initial_query, max_iterations=3):
 
         history_str = "\n".join([f"Cmd: {h[0]}\nOut: {h[1]}" for h in history])
         
-        prompt_for_llm = (
+        prompt_header = (
             f"User's initial debug query: '{initial_query}'.\n"
-            f"Debugging history so far (last executed command was '{gdb_command_to_run}'):\n{history_str}\n\n"
-            "Based on this history and the initial query, what is the single BEST next GDB command to execute to investigate further? "
-            "Or, if you have a strong hypothesis, state it prefixed with 'HYPOTHESIS: '. "
-            "If no more useful commands can be run or the issue is likely found, state 'DONE: ' followed by a summary. "
-            "If suggesting a GDB command, provide ONLY the command itself, without any additional explanation or formatting. "
-            "If the previous command resulted in an error, consider what might have caused it (e.g., invalid syntax, non-existent variable) and suggest a corrected command or a different approach."
+            + (symbol_context + "\n" if symbol_context else "")
+            + f"Debugging history so far (last executed command was '{gdb_command_to_run}'):\n"
         )
+        # Large outputs (bt full, x dumps) would otherwise grow the prompt
+        # without bound; the most recent history matters most, so keep the tail.
+        history_str = prompt_budget.truncate_to_budget(
+            history_str, prompt_budget.content_budget("explorer", prompt_header, NEXT_STEP_INSTRUCTIONS), keep="tail")
+        prompt_for_llm = prompt_header + history_str
+        prompt_tokens = prompt_budget.estimate_tokens(NEXT_STEP_INSTRUCTIONS) + prompt_budget.estimate_tokens(prompt_for_llm)
 
-        sys.stdout.write("ChatGDB Explorer (Next Step Suggestion): ") # Prefix for clarity
+        sys.stdout.write(f"ChatGDB Explorer (Next Step Suggestion, ~{prompt_tokens} input tokens): ") # Prefix for clarity
         sys.stdout.flush()
-        llm_suggestion = utils.get_llm_response(prompt_for_llm, _explorer_printer)
+        llm_suggestion = utils.get_llm_response(prompt_for_llm, _explorer_printer, stage="explorer",
+                                                system_prompt=NEXT_STEP_INSTRUCTIONS)
         sys.stdout.write("\n") # Ensure a final newline
         sys.stdout.flush()
         
@@ -101,10 +253,10 @@ def explore_state(initial_query, max_iterations=3):
         current_llm_input_command = llm_suggestion.strip() 
 
         if current_llm_input_command.startswith("HYPOTHESIS:"):
-            gdb.write(f"LLM Hypothesis: {current_llm_input_command[len('HYPOTHESIS:').:].strip()}\n")
+            gdb.write(f"LLM Hypothesis: {current_llm_input_command[len('HYPOTHESIS:'):].strip()}\n")
             break 
         if current_llm_input_command.startswith("DONE:"):
-            gdb.write(f"LLM Conclusion: {current_llm_input_command[len('DONE:').:].strip()}\n")
+            gdb.write(f"LLM Conclusion: {current_llm_input_command[len('DONE:'):].strip()}\n")
             break
         
         # If it's neither HYPOTHESIS, DONE, nor an empty string, it's assumed to be the next command.
@@ -116,3 +268,162 @@ def explore_state(initial_query, max_iterations=3):
             gdb.write("Max iterations reached. Ending exploration.\n")
 
     gdb.write("--- Exploration Finished ---\n")
+
+def checkpoints_supported():
+    """Returns True if the selected inferior can be checkpointed (live native Linux process)."""
+    inferior = gdb.selected_inferior()
+    if not sys.platform.startswith("linux") or not inferior.pid:
+        return False
+    connection = getattr(inferior, "connection", None)
+    return connection is None or connection.type == "native"
+
+def _take_checkpoint():
+    """Forks a checkpoint of the inferior.
+
+    Returns: (str) its id, e.g. "1" (or "1.1" where ids include the inferior)
+    """
+    output = gdb.execute("checkpoint", to_string=True)
+    match = re.search(r"checkpoint (\d+(?:\.\d+)?)", output)
+    if not match:
+        raise gdb.error(f"Unexpected checkpoint output: {output.strip()}")
+    return match.group(1)
+
+def _active_checkpoint():
+    """Returns the id of the checkpoint currently debugged, or None."""
+    for line in gdb.execute("info checkpoints", to_string=True).splitlines():
+        match = re.match(r"\s*\*\s*(\d+(?:\.\d+)?)", line)
+        if match:
+            return match.group(1)
+    return None
+
+def _parse_branches(text, max_branches, max_steps):
+    """Parses "BRANCH: <hypothesis>" blocks into (hypothesis, [commands])."""
+    branches = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("```"):
+            continue
+        if line.startswith("BRANCH:"):
+            branches.append((line[len("BRANCH:"):].strip(), []))
+        elif branches and len(branches[-1][1]) < max_steps:
+            branches[-1][1].append(line.strip("`"))
+    return [branch for branch in branches if branch[1]][:max_branches]
+
+def _breakpoint_numbers():
+    return {breakpoint.number for breakpoint in gdb.breakpoints()}
+
+def _delete_breakpoints_since(before):
+    """Deletes the breakpoints and watchpoints created since before was taken.
+
+    restart only rolls back the inferior; without this a branch's breakpoints
+    would stay for the following branches and after the exploration.
+    """
+    for breakpoint in gdb.breakpoints():
+        if breakpoint.number not in before and breakpoint.is_valid():
+            try:
+                breakpoint.delete()
+            except (gdb.error, RuntimeError):
+                pass
+
+def _run_branch(commands):
+    """Runs the commands of one branch. Returns: (list) (command, output) pairs"""
+    results = []
+    for command in commands:
+        if not _allowed_in_branch(command):
+            results.append((command, "Skipped: not allowed in a branch"))
+            continue
+        command_output, failed = _execute_step(command)
+        results.append((command, command_output))
+        if failed:
+            break
+    return results
+
+def explore_branches(initial_query, max_branches=3, max_steps=4):
+    """Tests several hypotheses, each from the same checkpoint of the inferior.
+
+    One LLM call proposes the branches, each branch runs on a fresh copy of
+    the stopped process (GDB checkpoint/restart, Linux native targets only),
+    and one more call draws the conclusion from all results. The inferior is
+    left in the state it was in when the exploration started, and the
+    breakpoints and watchpoints a branch sets are deleted after it.
+    """
+    gdb.write(f"Starting branching exploration for: {initial_query}\n")
+    if not checkpoints_supported():
+        gdb.write("Branching exploration needs a live process on a native Linux target. "
+                  "Exploring linearly instead.\n")
+        explore_state(initial_query)
+        return
+    context = _exploration_context(initial_query)
+    try:
+        frame_text = gdb.execute("frame", to_string=True).strip()
+    except gdb.error:
+        frame_text = ""
+    proposal_prompt = (f"User's debug query: '{initial_query}'.\n"
+                       + (context + "\n" if context else "")
+                       + (f"Current frame:\n{frame_text}\n" if frame_text else ""))
+    sys.stdout.write("ChatGDB Explorer (Branch Proposals):\n")
+    sys.stdout.flush()
+    proposals = utils.get_llm_response(
+        proposal_prompt, _explorer_printer, stage="explorer",
+        system_prompt=BRANCH_PROPOSAL_INSTRUCTIONS.format(branches=max_branches, steps=max_steps))
+    sys.stdout.write("\n")
+    sys.stdout.flush()
+    if proposals.startswith("ERROR:"):
+        return
+    branches = _parse_branches(proposals, max_branches, max_steps)
+    if not branches:
+        gdb.write("LLM did not propose any branch. Ending exploration.\n")
+        return
+
+    results = []
+    with stop_policy.suppressed():
+        try:
+            snapshot = _take_checkpoint()
+        except gdb.error as e:
+            gdb.write(f"Could not checkpoint the inferior: {e}. Ending exploration.\n")
+            return
+        try:
+            for index, (hypothesis, commands) in enumerate(branches):
+                gdb.write(f"--- Branch {index + 1}/{len(branches)}: {hypothesis} ---\n")
+                before = _breakpoint_numbers()
+                try:
+                    results.append((hypothesis, _run_branch(commands)))
+                finally:
+                    _delete_breakpoints_since(before)
+                # Back to the snapshot. Restarting consumes it, so the next
+                # branch needs a fresh copy; the branch's own process is dropped.
+                used = _active_checkpoint()
+                gdb.execute(f"restart {snapshot}", to_string=True)
+                if used is not None and used != snapshot:
+                    try:
+                        gdb.execute(f"delete checkpoint {used}", to_string=True)
+                    except gdb.error:
+                        pass
+                if index < len(branches) - 1:
+                    snapshot = _take_checkpoint()
+        except gdb.error as e:
+            gdb.write(f"Could not return to the checkpoint: {e}. "
+                      "The program state may differ from where the exploration started.\n")
+
+    # All branches go back in one round, each within its share of the budget
+    prompt_header = (f"User's initial debug query: '{initial_query}'.\n"
+                     + (context + "\n" if context else "")
+                     + "Results of the tested hypotheses:\n")
+    branch_budget = max(prompt_budget.MIN_CONTENT_TOKENS, prompt_budget.content_budget(
+        "explorer", prompt_header, BRANCH_CONCLUSION_INSTRUCTIONS) // max(1, len(results)))
+    branch_texts = []
+    for index, (hypothesis, steps) in enumerate(results):
+        steps_text = "\n".join(f"Cmd: {command}\nOut: {output}" for command, output in steps)
+        branch_texts.append(f"Branch {index + 1}: {hypothesis}\n"
+                            + prompt_budget.truncate_to_budget(steps_text, branch_budget, keep="tail"))
+    sys.stdout.write("ChatGDB Explorer (Conclusion): ")
+    sys.stdout.flush()
+    conclusion = utils.get_llm_response(prompt_header + "\n\n".join(branch_texts), _explorer_printer,
+                                        stage="explorer", system_prompt=BRANCH_CONCLUSION_INSTRUCTIONS).strip()
+    sys.stdout.write("\n")
+    sys.stdout.flush()
+    if conclusion.startswith("HYPOTHESIS:"):
+        gdb.write(f"LLM Hypothesis: {conclusion[len('HYPOTHESIS:'):].strip()}\n")
+    elif conclusion.startswith("DONE:"):
+        gdb.write(f"LLM Conclusion: {conclusion[len('DONE:'):].strip()}\n")
+    gdb.write("--- Exploration Finished ---\n")
@@ -1,6 +1,9 @@
 import lldb
 import sys # Added
 from chatgdb import utils
+from chatgdb import fast_path
+from chatgdb import explain_cache
+from chatgdb import warmup
 
 
 def __lldb_init_module(debugger, internal_dict):
@@ -11,6 +14,16 @@ def __lldb_init_module(debugger, internal_dict):
     debugger.HandleCommand('command script add -f lldb.chat chat')
     debugger.HandleCommand('command script add -f lldb.explain explain')
     debugger.HandleCommand('command script add -f lldb.chat_set_mode chat-set-mode') # Register new command
+    debugger.HandleCommand('command script add -f lldb.chat_rules chat-rules')
+    debugger.HandleCommand('command script add -f lldb.chat_cache chat-cache')
+    debugger.HandleCommand('command script add -f lldb.chat_warmup chat-warmup')
+    # Ctrl-C does not interrupt script commands, but LLDB records the request
+    if hasattr(debugger, "InterruptRequested"):
+        utils.INTERRUPT_CHECK = debugger.InterruptRequested
+    # Open the API connection in the background so the first chat does not
+    # pay for the TLS handshake
+    if warmup.is_enabled():
+        warmup.start(WARMUP_STEPS)
 
 
 prev_command = ""
@@ -24,6 +37,7 @@ COMMAND_PROMPT = (
     "User query: "
 )
 EXPLANATION_PROMPT = "Give me an explanation for this LLDB command: "
+WARMUP_STEPS = [("connection", warmup.connect_step)]
 
 
 def chat(debugger, command, result, internal_dict):
@@ -43,9 +57,20 @@ def chat(debugger, command, result, internal_dict):
         sys.stdout.write(text_chunk)
         sys.stdout.flush()
     
-    # global prev_command # Ensure this is declared if prev_command is module-level
-    # The chat_helper returns (full_assembled_command, full_assembled_command)
-    _discarded_prev_cmd, generated_cmd_to_execute = utils.chat_helper(command, prompt=COMMAND_PROMPT, print_callback=lldb_printer)
+    # Trivial intents are mapped to LLDB commands by the rule table, without
+    # any LLM round trip.
+    fast_command, rule = fast_path.match_query(command, "lldb")
+    if fast_command:
+        lldb_printer(f"[FastPath] Rule '{rule.name}':\n{fast_command}")
+        generated_cmd_to_execute = fast_command
+    else:
+        # global prev_command # Ensure this is declared if prev_command is module-level
+        # The chat_helper returns (full_assembled_command, full_assembled_command)
+        try:
+            _discarded_prev_cmd, generated_cmd_to_execute = utils.chat_helper(command, prompt=COMMAND_PROMPT, print_callback=lldb_printer)
+        except KeyboardInterrupt:
+            result.PutStr("Request cancelled.\n")
+            return
     sys.stdout.write("\n") # Ensure a final newline
     sys.stdout.flush()
     
@@ -66,15 +91,22 @@ def chat(debugger, command, result, internal_dict):
                 response = return_obj.GetOutput().strip().replace("\n", "").replace("'", "").replace('"', '')
             
             if response in ["y", "yes"]:
-                debugger.HandleCommand(generated_cmd_to_execute)
+                _handle_lines(debugger, generated_cmd_to_execute)
             else:
                 result.PutStr("Command not executed.\n") # Use result for feedback in LLDB
         else: # agent mode
-            debugger.HandleCommand(generated_cmd_to_execute)
+            _handle_lines(debugger, generated_cmd_to_execute)
     elif command != "help": # Don't print error for 'chat help' if it results in empty command
          result.PutStr("LLM did not return a command or an error occurred.\n")
 
 
+def _handle_lines(debugger, commands):
+    """Runs commands line by line; repeated fast-path rules emit several lines"""
+    for line in commands.split("\n"):
+        if line.strip():
+            debugger.HandleCommand(line.strip())
+
+
 def explain(debugger, command, result, internal_dict):
     """Custom LLDB command - explain
 
@@ -86,7 +118,13 @@ def explain(debugger, command, result, internal_dict):
         sys.stdout.flush()
 
     # Use globals().get to safely access prev_command
-    utils.explain_helper(globals().get('prev_command', ''), command, EXPLANATION_PROMPT, lldb_explain_printer)
+    # The version string starts with "lldb version ...", so it names the flavor too
+    try:
+        utils.explain_helper(globals().get('prev_command', ''), command, EXPLANATION_PROMPT, lldb_explain_printer,
+                             debugger=lldb.SBDebugger.GetVersionString().split("\n")[0])
+    except KeyboardInterrupt:
+        result.PutStr("Request cancelled.\n")
+        return
     sys.stdout.write("\n") # Ensure a final newline
     sys.stdout.flush()
 
@@ -107,3 +145,63 @@ def chat_set_mode(debugger, command_args_str, result, internal_dict):
         result.PutStr("ChatLLDB mode set to: Agent\n")
     else:
         result.PutStr("Usage: chat-set-mode [ask|agent]\n")
+
+
+def chat_rules(debugger, command_args_str, result, internal_dict):
+    """Custom LLDB command - chat-rules
+
+    Lists the fast-path rules with their hit counts. 'chat-rules on|off'
+    enables or disables the fast path, 'chat-rules reload' re-reads the user
+    rules file.
+    """
+    args = command_args_str.strip()
+    if args in ("on", "off"):
+        fast_path.ENABLED = args == "on"
+    elif args == "reload":
+        result.PutStr(f"Loaded {fast_path.reload_rules()} user rules from {fast_path.RULES_FILE}\n")
+    elif args:
+        result.PutStr("Usage: chat-rules [on|off|reload]\n")
+        return
+    result.PutStr(fast_path.format_stats())
+
+
+def chat_cache(debugger, command_args_str, result, internal_dict):
+    """Custom LLDB command - chat-cache
+
+    Shows the explanation cache. 'chat-cache on|off' enables or disables it,
+    'chat-cache clear' removes all cached explanations.
+    """
+    args = command_args_str.strip()
+    if args in ("on", "off"):
+        explain_cache.ENABLED = args == "on"
+    elif args == "clear":
+        result.PutStr(f"Removed {explain_cache.clear()} cached explanations\n")
+    elif args:
+        result.PutStr("Usage: chat-cache [on|off|clear]\n")
+        return
+    result.PutStr(explain_cache.format_stats())
+
+
+def chat_warmup(debugger, command_args_str, result, internal_dict):
+    """Custom LLDB command - chat-warmup
+
+    Shows what the background warm-up at load did. 'chat-warmup run' runs it
+    again, 'chat-warmup cancel' stops it, 'chat-warmup on|off' turns the
+    warm-up at load on or off for future sessions.
+    """
+    args = command_args_str.strip()
+    if args == "run":
+        if not warmup.start(WARMUP_STEPS):
+            result.PutStr("A warm-up is already running.\n")
+    elif args == "cancel":
+        result.PutStr("Warm-up cancelled.\n" if warmup.cancel() else "No warm-up is running.\n")
+    elif args in ("on", "off"):
+        try:
+            warmup.set_enabled(args == "on")
+        except OSError as e:
+            result.PutStr(f"Could not save the setting: {e}\n")
+            return
+    elif args not in ("", "status"):
+        result.PutStr("Usage: chat-warmup [status|run|cancel|on|off]\n")
+        return
+    result.PutStr(warmup.format_stats())
@@ -0,0 +1,249 @@
+import re
+import struct
+import sys
+
+import gdb
+
+# Compact, locally computed summaries of memory regions. The region is read
+# once with read_memory and scanned through memoryviews; the summary lists
+# zero runs, repeated fill patterns, allocator poison values and stack
+# canaries, pointer-like words (resolved to symbols) and ASCII strings. A few
+# hundred bytes of digest replace the huge text of "x/1000x addr".
+
+# Largest region a digest reads
+MAX_DIGEST_BYTES = 1024 * 1024
+
+# "x/" commands examining at least this many bytes are digested instead
+# when run by the explorer
+EXAMINE_THRESHOLD = 512
+
+# Entries listed per section of a digest
+MAX_ITEMS = 8
+
+# Distinct pointer-like values resolved to symbols per digest
+MAX_POINTER_LOOKUPS = 32
+
+MIN_ZERO_RUN = 16
+MIN_BYTE_RUN = 16
+MIN_WORD_RUN = 4
+MIN_STRING = 6
+
+# Fill values of debug allocators and sanitizers, as 32-bit words
+POISON_WORDS = {
+    0xdeadbeef: "deadbeef marker",
+    0xbaadf00d: "uninitialized heap (Windows LocalAlloc)",
+    0xfeeefeee: "freed heap (Windows HeapFree)",
+    0xcdcdcdcd: "uninitialized heap (MSVC debug)",
+    0xdddddddd: "freed heap (MSVC debug)",
+    0xfdfdfdfd: "heap guard bytes (MSVC debug)",
+    0xabababab: "heap guard after allocation (Windows HeapAlloc)",
+    0xcccccccc: "uninitialized stack (MSVC /RTC)",
+    0xa5a5a5a5: "poisoned memory (kernel / MALLOC_PERTURB_ style fill)",
+    0xbebebebe: "uninitialized heap (ASan malloc fill)",
+}
+
+_EXAMINE_RE = re.compile(r"^x\s*/\s*(\d*)([a-z]*)\s+(.+)$")
+_UNIT_SIZES = {"b": 1, "h": 2, "w": 4, "g": 8}
+_ZERO_RUN_RE = re.compile(rb"\x00{%d,}" % MIN_ZERO_RUN)
+_BYTE_RUN_RE = re.compile(rb"([^\x00])\1{%d,}" % (MIN_BYTE_RUN - 1), re.DOTALL)
+_STRING_RE = re.compile(rb"[\x20-\x7e]{%d,}" % MIN_STRING)
+
+
+def parse_examine(command):
+    """Recognizes a large "x/NFU addr" command.
+
+    Returns: (tuple) (address expression, byte count) if the command
+    examines at least EXAMINE_THRESHOLD bytes as data, otherwise None.
+    Instruction and string formats are never intercepted.
+    """
+    match = _EXAMINE_RE.match(command.strip())
+    if not match:
+        return None
+    count = int(match.group(1) or 1)
+    letters = match.group(2)
+    if "i" in letters or "s" in letters:
+        return None
+    size = 4
+    for letter in letters:
+        if letter in _UNIT_SIZES:
+            size = _UNIT_SIZES[letter]
+        elif letter == "a":
+            size = _pointer_size()
+        elif letter == "c":
+            size = 1
+    if count * size < EXAMINE_THRESHOLD:
+        return None
+    return match.group(3).strip(), count * size
+
+
+def _pointer_size():
+    return gdb.lookup_type("void").pointer().sizeof
+
+
+def _byte_order():
+    try:
+        return "big" if "big endian" in gdb.execute("show endian", to_string=True) else "little"
+    except gdb.error:
+        return sys.byteorder
+
+
+def evaluate_address(expression):
+    """Evaluates an address expression the way "x" does (arrays decay)."""
+    value = gdb.parse_and_eval(expression)
+    if value.type.strip_typedefs().code == gdb.TYPE_CODE_ARRAY and value.address is not None:
+        value = value.address
+    return int(value.cast(gdb.lookup_type("unsigned long")))
+
+
+def _words(view, word_size, byte_order):
+    """Returns the aligned words of view as a sequence of ints, zero-copy when possible."""
+    count = len(view) // word_size
+    code = "Q" if word_size == 8 else "I"
+    if byte_order == sys.byteorder:
+        return view[:count * word_size].cast(code)
+    prefix = ">" if byte_order == "big" else "<"
+    return struct.unpack(f"{prefix}{count}{code}", view[:count * word_size])
+
+
+def _runs(values, minimum):
+    """Yields (start index, length, value) of runs of equal non-zero values."""
+    start = 0
+    for index in range(1, len(values) + 1):
+        if index == len(values) or values[index] != values[start]:
+            if index - start >= minimum and values[start]:
+                yield start, index - start, values[start]
+            start = index
+
+
+def _stack_canary(word_size):
+    """Returns the stack protector canary of the current thread, or None (x86 Linux only)."""
+    expression = ("*(unsigned long *)($fs_base + 0x28)" if word_size == 8
+                  else "*(unsigned int *)($gs_base + 0x14)")
+    try:
+        canary = int(gdb.parse_and_eval(expression))
+    except (gdb.error, gdb.MemoryError, ValueError):
+        return None
+    return canary or None
+
+
+def _describe_pointer(inferior, value):
+    """Returns a description of what value points to, or None if it does not point to readable memory."""
+    try:
+        inferior.read_memory(value, 1)
+    except (gdb.error, gdb.MemoryError):
+        return None
+    try:
+        block = gdb.block_for_pc(value)
+    except RuntimeError:
+        block = None
+    # block_for_pc returns the innermost lexical block; its function block is further out
+    while block is not None and block.function is None:
+        block = block.superblock
+    if block is not None:
+        return f"{block.function.print_name}+{value - block.start} (code)"
+    try:
+        symbol = gdb.execute(f"info symbol {value:#x}", to_string=True).strip()
+    except gdb.error:
+        symbol = ""
+    if symbol and not symbol.startswith("No symbol"):
+        return symbol
+    return "readable memory"
+
+
+def _offsets(offsets):
+    shown = ", ".join(f"+{o:#x}" for o in offsets[:MAX_ITEMS])
+    if len(offsets) > MAX_ITEMS:
+        shown += f", ... ({len(offsets) - MAX_ITEMS} more)"
+    return shown
+
+
+def digest(address, length):
+    """Summarizes the memory at address.
+
+    Params:
+    address (int): start of the region
+    length (int): bytes to read, capped at MAX_DIGEST_BYTES
+
+    Returns: (str) the digest, one section per line
+    Raises: gdb.MemoryError if the region cannot be read
+    """
+    length = max(1, min(length, MAX_DIGEST_BYTES))
+    inferior = gdb.selected_inferior()
+    view = memoryview(inferior.read_memory(address, length))
+    word_size = _pointer_size()
+    byte_order = _byte_order()
+    lines = [f"Memory digest of {address:#x}, {length} bytes ({word_size}-byte words, {byte_order} endian):"]
+
+    # Zero runs
+    zero_runs = [(m.start(), m.end() - m.start()) for m in _ZERO_RUN_RE.finditer(view)]
+    zero_bytes = sum(size for _, size in zero_runs)
+    if zero_runs:
+        shown = ", ".join(f"+{start:#x}..+{start + size - 1:#x}" for start, size in zero_runs[:MAX_ITEMS])
+        more = f", ... ({len(zero_runs) - MAX_ITEMS} more)" if len(zero_runs) > MAX_ITEMS else ""
+        lines.append(f"  zero runs: {len(zero_runs)} covering {zero_bytes} of {length} bytes: {shown}{more}")
+    else:
+        lines.append("  zero runs: none")
+
+    # Repeated non-zero fill, at word and at byte granularity
+    words = _words(view, word_size, byte_order)
+    repeats = [f"+{start * word_size:#x} {value:#0{word_size * 2 + 2}x} x{count} words"
+               for start, count, value in _runs(words, MIN_WORD_RUN)]
+    repeats += [f"+{m.start():#x} byte {m.group(1)[0]:#04x} x{m.end() - m.start()}"
+                for m in _BYTE_RUN_RE.finditer(view)]
+    if repeats:
+        lines.append(f"  repeated patterns: {'; '.join(repeats[:MAX_ITEMS])}"
+                     + (f"; ... ({len(repeats) - MAX_ITEMS} more)" if len(repeats) > MAX_ITEMS else ""))
+
+    # Allocator poison values and the stack canary
+    poison = []
+    words32 = _words(view, 4, byte_order) if word_size != 4 else words
+    found = {}
+    for index, value in enumerate(words32):
+        if value in POISON_WORDS:
+            found.setdefault(value, []).append(index * 4)
+    for value, offsets in found.items():
+        poison.append(f"{value:#010x} ({POISON_WORDS[value]}) x{len(offsets)} at {_offsets(offsets)}")
+    canary = _stack_canary(word_size)
+    if canary is not None:
+        canary_offsets = [i * word_size for i, value in enumerate(words) if value == canary]
+        if canary_offsets:
+            poison.append(f"stack protector canary at {_offsets(canary_offsets)}")
+    if poison:
+        lines.append("  poison/canary: " + "; ".join(poison))
+
+    # Pointer-like words, resolved once per distinct value
+    resolved = {}
+    pointers = []
+    for index, value in enumerate(words):
+        if value < 0x1000 or value % 4:
+            continue
+        if value not in resolved:
+            if len(resolved) >= MAX_POINTER_LOOKUPS:
+                continue
+            resolved[value] = _describe_pointer(inferior, value)
+        if resolved[value]:
+            pointers.append(f"+{index * word_size:#x} {value:#x} -> {resolved[value]}")
+    if pointers:
+        lines.append(f"  pointers ({len(pointers)}): " + "; ".join(pointers[:MAX_ITEMS])
+                     + (f"; ... ({len(pointers) - MAX_ITEMS} more)" if len(pointers) > MAX_ITEMS else ""))
+
+    # Printable strings
+    strings = []
+    for m in _STRING_RE.finditer(view):
+        text = bytes(m.group(0)).decode("ascii")
+        strings.append(f"+{m.start():#x} {text[:48]!r}" + ("..." if len(text) > 48 else ""))
+    if strings:
+        lines.append(f"  strings ({len(strings)}): " + "; ".join(strings[:MAX_ITEMS])
+                     + (f"; ... ({len(strings) - MAX_ITEMS} more)" if len(strings) > MAX_ITEMS else ""))
+    return "\n".join(lines)
+
+
+def digest_expression(address_expression, length):
+    """Evaluates address_expression and digests length bytes there.
+
+    Returns: (str) the digest, or an "Error: ..." line
+    """
+    try:
+        return digest(evaluate_address(address_expression), length)
+    except (gdb.error, gdb.MemoryError, ValueError) as e:
+        return f"Error: could not digest {address_expression}: {e}"
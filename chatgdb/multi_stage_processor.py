@@ -1,7 +1,16 @@
+import functools
 import gdb
 import os
 import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from chatgdb import utils # For get_llm_response
+from chatgdb import prompt_budget
+from chatgdb import symbol_index
+from chatgdb import output_capture
+from chatgdb import command_matcher
 
 PROMPT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "system_prompts")
 PROMPTS = {
@@ -10,6 +19,19 @@ PROMPTS = {
     "stage5": None
 }
 
+# Precompiled prompts: stage -> (system prompt, label of the section that
+# follows it, e.g. "List of commands:"). Built once by load_prompts and sent
+# byte-for-byte identically on every call so providers can prefix-cache them.
+COMPILED_PROMPTS = {}
+
+# Output of "help <class>" / "help <command>" by help command. Help text does
+# not change during a session, and reusing the exact same text keeps the
+# static context of Stage 3 and Stage 5 byte-stable.
+_HELP_CACHE = {}
+
+# User-defined commands can change at any time, so their help is not cached
+_UNCACHED_HELP_CLASSES = ("user-defined",)
+
 SUPPORTED_COMMAND_CLASSES = [
     "breakpoints", "data", "files", "internals", "obscure", "running",
     "stack", "status", "support", "text-user-interface", "tracepoints", "user-defined"
@@ -18,6 +40,14 @@ SUPPORTED_COMMAND_CLASSES = [
 # Flag to ensure prompts are loaded only once or if loading failed previously
 _prompts_loaded_successfully = False
 
+# Queries of a batch whose stages are in progress at the same time; each has
+# at most one LLM call in flight
+BATCH_CONCURRENCY = 4
+
+# One query of a batch: the generated command(s) ("" on failure), the
+# pipeline's progress output and the seconds from start to result
+BatchResult = namedtuple("BatchResult", ["query", "command", "log", "seconds"])
+
 def load_prompts():
     global _prompts_loaded_successfully
     if _prompts_loaded_successfully: # Don't reload if already successful
@@ -37,7 +67,8 @@ def load_prompts():
         filepath = os.path.join(PROMPT_DIR, actual_filename)
         try:
             with open(filepath, "r") as f:
-                PROMPTS[stage_name] = f.read()
+                PROMPTS[stage_name] = utils.normalize_static_text(f.read())
+            COMPILED_PROMPTS[stage_name] = _compile_prompt(PROMPTS[stage_name])
         except FileNotFoundError:
             sys.stderr.write(f"[MultiStageProcessor] Error: Prompt file not found: {filepath}\n")
             all_found = False
@@ -54,10 +85,155 @@ def load_prompts():
         # Ensure prompts are None if loading failed to prevent partial use
         for stage_name in required_prompts:
             PROMPTS[stage_name] = None
+        COMPILED_PROMPTS.clear()
         _prompts_loaded_successfully = False
         return False
 
-def generate_gdb_command_multi_stage(user_query, print_callback):
+def _compile_prompt(prompt_text):
+    """Splits a stage prompt into its instructions and trailing section label.
+
+    The prompt files end with the label of the input that follows them
+    ("User Query:", "List of commands:", "Help Query:"). The label is moved in
+    front of that input so the instructions can be sent as a system message.
+    """
+    instructions, _, label = prompt_text.rpartition("\n")
+    return instructions, label.strip()
+
+def get_help_text(help_command, print_callback=None):
+    """Returns the output of a GDB help command, cached for the session.
+
+    Returns: (str) the help text, or the error string of
+    _execute_gdb_command_safely
+    """
+    if help_command in _HELP_CACHE:
+        return _HELP_CACHE[help_command]
+    # Help listings are needed whole; Stages 2 and 4 fit them to the budget
+    output = _execute_gdb_command_safely(help_command, to_string=True, print_callback=print_callback,
+                                         bounded=False)
+    if output.startswith("GDB_EXECUTION_ERROR:") or output.startswith("PYTHON_EXECUTION_ERROR:"):
+        return output
+    output = utils.normalize_static_text(output)
+    if help_command.split(None, 1)[-1] not in _UNCACHED_HELP_CLASSES:
+        _HELP_CACHE[help_command] = output
+    return output
+
+def generate_gdb_command_multi_stage(user_query, print_callback, line_callback=None):
+    """Runs the five-stage pipeline that maps a user query to GDB command(s).
+
+    Params:
+    user_query (str): the natural language request
+    print_callback (callable): receives all progress and streamed LLM output
+    line_callback (callable, optional): receives each Stage 5 command line as
+        soon as it has been streamed, so the caller can validate and run it
+        while the rest of the response is still being generated
+
+    Returns: (str) the final command(s), one per line, or "" on failure
+    """
+    return _run_serially(_pipeline(user_query, print_callback, line_callback))
+
+def _run_serially(pipeline):
+    """Drives a _pipeline generator, running each LLM call as it comes."""
+    try:
+        step = next(pipeline)
+        while True:
+            step = pipeline.send(step())
+    except StopIteration as finished:
+        return finished.value
+
+def _run_step(step, cancel):
+    """Runs one LLM call of a batch on a worker thread."""
+    with utils.cancel_on(cancel):
+        try:
+            return step()
+        except KeyboardInterrupt:
+            return "ERROR: Request cancelled"
+
+def generate_batch(queries, concurrency=BATCH_CONCURRENCY, on_result=None, shortcut=None):
+    """Runs the pipeline for many queries, overlapping their LLM calls.
+
+    Up to concurrency queries are in progress at once, so while one waits
+    for Stage 5, another can be in Stage 1. LLM calls run on worker threads;
+    the rest of each pipeline (GDB help lookups, symbol context) and
+    on_result run on the calling thread, i.e. the GDB thread. Queries are
+    started in order, so earlier ones finish first.
+
+    Params:
+    queries (list): natural language requests
+    concurrency (int): queries in progress at the same time
+    on_result (callable, optional): called with (index, BatchResult) in
+        input order, as soon as a result and all results before it are
+        available; the place to run the commands, in order
+    shortcut (callable, optional): called with a query; a non-empty
+        return value is used as its command without running the pipeline
+        (e.g. the fast path's rule table)
+
+    Returns: (list) BatchResult per query, in input order
+    Raises: KeyboardInterrupt after cancelling the calls still in flight
+    """
+    results = [None] * len(queries)
+    logs = [[] for _ in queries]
+    started = {}
+    pipelines = {}
+    pending = {}
+    cancel = threading.Event()
+    next_query = 0
+    next_result = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="chatgdb-batch") as executor:
+
+        def advance(index, response):
+            try:
+                step = pipelines[index].send(response)
+            except StopIteration as finished:
+                command = finished.value or ""
+            except Exception as e:
+                # One failing query does not end the batch
+                logs[index].append(f"[MultiStageProcessor] Error: {e}\n")
+                command = ""
+            else:
+                pending[executor.submit(_run_step, step, cancel)] = index
+                return
+            del pipelines[index]
+            results[index] = BatchResult(queries[index], command, "".join(logs[index]),
+                                         time.monotonic() - started[index])
+
+        try:
+            while next_result < len(queries):
+                while next_query < len(queries) and len(pipelines) < max(1, concurrency):
+                    index, next_query = next_query, next_query + 1
+                    started[index] = time.monotonic()
+                    command = shortcut(queries[index]) if shortcut else None
+                    if command:
+                        results[index] = BatchResult(queries[index], command, "", 0.0)
+                        continue
+                    pipelines[index] = _pipeline(queries[index], logs[index].append)
+                    advance(index, None)
+                while next_result < len(queries) and results[next_result] is not None:
+                    if on_result:
+                        on_result(next_result, results[next_result])
+                    next_result += 1
+                if pending:
+                    # Short timeout so Ctrl-C on the GDB thread is noticed
+                    done, _ = wait(list(pending), timeout=0.1, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        advance(pending.pop(future), future.result())
+        except BaseException:
+            cancel.set()
+            for future in pending:
+                future.cancel()
+            raise
+    return results
+
+def _pipeline(user_query, print_callback, line_callback=None):
+    """Generator running the five stages for one query.
+
+    Every LLM call is yielded as a callable without arguments, and its
+    response must be sent back in; the driver decides where and when the
+    calls run (inline, or on a worker thread in batch mode). Everything
+    else, including the GDB help lookups, runs on the driver's thread.
+
+    Returns: (str) the final command(s), one per line, or "" on failure
+    """
     if not _prompts_loaded_successfully: # Try loading if not already successful
         if not load_prompts():
             if print_callback: # Check if callback is None
@@ -78,12 +254,15 @@ def generate_gdb_command_multi_stage(user_query, print_callback):
     if print_callback:
         print_callback("--- Stage 1: Classifying user intent ---\n")
     
-    # PROMPTS["stage1"] from file should end with "User Query:
-" # Note: The prompt files actually don't end with this.
-    # The user_query will be appended directly.
-    stage1_full_prompt = PROMPTS["stage1"] + user_query 
+    # The stage prompt is sent as the system message; its trailing "User Query:"
+    # label is moved in front of the query.
+    stage1_system, stage1_label = COMPILED_PROMPTS["stage1"]
+    stage1_query = stage1_label + " " + user_query
     
-    llm_response_stage1_raw = utils.get_llm_response(stage1_full_prompt, print_callback)
+    _report_prompt_size("Stage 1", "stage1", print_callback, stage1_system, stage1_query)
+    llm_response_stage1_raw = yield functools.partial(
+        utils.get_llm_response, stage1_query, print_callback, stage="stage1",
+        system_prompt=stage1_system, stop_when=_stage1_complete)
     if print_callback: 
         print_callback("\n") # Newline after raw LLM stream for this stage
 
@@ -128,7 +307,7 @@ def generate_gdb_command_multi_stage(user_query, print_callback):
 
     gdb_help_command = f"help {command_class}"
     # Pass print_callback to _execute_gdb_command_safely so it can also stream GDB's own command echo if desired (though it's simple here)
-    help_class_output = _execute_gdb_command_safely(gdb_help_command, to_string=True, print_callback=print_callback)
+    help_class_output = get_help_text(gdb_help_command, print_callback=print_callback)
 
     if help_class_output.startswith("GDB_EXECUTION_ERROR:") or help_class_output.startswith("PYTHON_EXECUTION_ERROR:"):
         if print_callback:
@@ -177,31 +356,23 @@ def generate_gdb_command_multi_stage(user_query, print_callback):
     if print_callback:
         print_callback(f"--- Stage 3: Selecting specific command from class '{command_class}' ---\n")
 
-    # PROMPTS["stage3"] ends with "List of commands:
-" (as per prompt file content)
-    # We append the filtered help, then the user query.
-    stage3_full_prompt = PROMPTS["stage3"] + gdb_cmd_class_help_filtered + "\nUser Query: " + user_query
-    
-    # utils.get_llm_response will use print_callback for streaming
-    llm_response_stage3_raw = utils.get_llm_response(stage3_full_prompt, print_callback)
-    if print_callback:
-        print_callback("\n") # Newline after raw LLM stream for this stage
-
-    if not llm_response_stage3_raw or llm_response_stage3_raw.startswith("ERROR:"):
+    # Most queries name their command plainly ("break at line 42"), so a local
+    # ranker tries first. Only if no command is clearly ahead does the LLM
+    # choose, and then only among the top candidates.
+    local_choice, stage3_listing = command_matcher.select_command(user_query, gdb_cmd_class_help_filtered, summary)
+    if local_choice:
+        selected_command_name = local_choice
+        selected_by = "matcher"
         if print_callback:
-            # Error message from get_llm_response (via make_streaming_request) is already printed by the callback.
-            print_callback(f"[MultiStageProcessor] Error in Stage 3 LLM call.\n") # llm_response_stage3_raw may contain the error details.
-        return ""
-
-    selected_command_name = _parse_llm_response_for_last_line(llm_response_stage3_raw)
-
-    if not selected_command_name:
-        if print_callback:
-            print_callback(f"[MultiStageProcessor] Stage 3 Error: LLM did not select a specific command from the list for class '{command_class}'. Or the response was empty after parsing.\nRaw LLM response for selection: '{llm_response_stage3_raw}'\n")
-        return ""
-        
-    # Optional: Could try to validate selected_command_name against commands in gdb_cmd_class_help_filtered
-    # For now, we trust the LLM's selection if it's non-empty.
+            print_callback(f"[MultiStageProcessor] Stage 3: Matched '{selected_command_name}' locally, skipping the LLM call.\n")
+    else:
+        selected_command_name = yield from _select_command_with_llm(
+            user_query, summary, command_class, stage3_listing, print_callback)
+        if not selected_command_name:
+            return ""
+        selected_by = "llm"
+    command_matcher.record_session(user_query, summary, command_class, gdb_cmd_class_help_filtered,
+                                   selected_command_name, selected_by)
 
     if print_callback:
         print_callback(f"[MultiStageProcessor] Stage 3 Result: Selected command: '{selected_command_name}'\n")
@@ -215,7 +386,7 @@ def generate_gdb_command_multi_stage(user_query, print_callback):
 
     gdb_detailed_help_command = f"help {selected_command_name}"
     # Pass print_callback to _execute_gdb_command_safely so it can show GDB's command execution
-    detailed_help_output = _execute_gdb_command_safely(gdb_detailed_help_command, to_string=True, print_callback=print_callback)
+    detailed_help_output = get_help_text(gdb_detailed_help_command, print_callback=print_callback)
 
     if detailed_help_output.startswith("GDB_EXECUTION_ERROR:") or detailed_help_output.startswith("PYTHON_EXECUTION_ERROR:"):
         if print_callback:
@@ -243,12 +414,25 @@ def generate_gdb_command_multi_stage(user_query, print_callback):
     if print_callback:
         print_callback(f"--- Stage 5: Generating final GDB command(s) based on help for '{selected_command_name}' ---\n")
 
-    # PROMPTS["stage5"] (from stage5_generate_final_command.md) ends with "Help Query: 
-"
-    # We append detailed_help_output, then "User Query: ", then the user_query.
-    stage5_full_prompt = PROMPTS["stage5"] + detailed_help_output + "\nUser Query: " + user_query
+    # Layout: stage prompt (system), detailed help (static context), query.
+    # The syntax summary is at the top of GDB's help text, so keep the head.
+    stage5_system, stage5_label = COMPILED_PROMPTS["stage5"]
+    stage5_query = "User Query: " + user_query
+    # Ground names like "the parse function of lexer.c" in the real symbols
+    # so the model does not have to guess them.
+    symbol_context = symbol_index.context_for_query(user_query)
+    if symbol_context:
+        stage5_query += "\n" + symbol_context
+    detailed_help_fitted = prompt_budget.truncate_to_budget(
+        detailed_help_output,
+        prompt_budget.content_budget("stage5", stage5_system, stage5_label, stage5_query),
+        keep="head")
+    stage5_context = stage5_label + "\n" + detailed_help_fitted
     
-    llm_response_stage5_raw = utils.get_llm_response(stage5_full_prompt, print_callback)
+    _report_prompt_size("Stage 5", "stage5", print_callback, stage5_system, stage5_context, stage5_query)
+    llm_response_stage5_raw = yield functools.partial(
+        utils.get_llm_response, stage5_query, print_callback, line_callback=line_callback, stage="stage5",
+        system_prompt=stage5_system, static_context=stage5_context)
     if print_callback:
         print_callback("\n") # Newline after raw LLM stream
 
@@ -274,6 +458,91 @@ def generate_gdb_command_multi_stage(user_query, print_callback):
 
     return final_gdb_command # Return the actual GDB command string(s)
 
+def _select_command_with_llm(user_query, summary, command_class, help_listing, print_callback):
+    """Generator for the Stage 3 LLM call (see _pipeline). Returns the selected command name or ""."""
+    # "help data" and "help status" alone can exceed the whole budget, so only
+    # the command lines that rank best against the query and summary are kept.
+    # Layout: stage prompt (system), help listing (static context), query.
+    # The listing is only query dependent when it had to be cut to the budget.
+    stage3_system, stage3_label = COMPILED_PROMPTS["stage3"]
+    stage3_query = "User Query: " + user_query
+    gdb_cmd_class_help_fitted, dropped_lines = prompt_budget.fit_help_lines(
+        help_listing, user_query + " " + summary,
+        prompt_budget.content_budget("stage3", stage3_system, stage3_label, stage3_query))
+    if dropped_lines and print_callback:
+        print_callback(f"[MultiStageProcessor] Stage 3: Kept the most relevant help lines, dropped {dropped_lines} to fit the token budget.\n")
+    stage3_context = stage3_label + "\n" + gdb_cmd_class_help_fitted
+    
+    # utils.get_llm_response will use print_callback for streaming
+    _report_prompt_size("Stage 3", "stage3", print_callback, stage3_system, stage3_context, stage3_query)
+    llm_response_stage3_raw = yield functools.partial(
+        utils.get_llm_response, stage3_query, print_callback, stage="stage3",
+        system_prompt=stage3_system, static_context=stage3_context,
+        stop_when=_stage3_complete(gdb_cmd_class_help_fitted))
+    if print_callback:
+        print_callback("\n") # Newline after raw LLM stream for this stage
+
+    if not llm_response_stage3_raw or llm_response_stage3_raw.startswith("ERROR:"):
+        if print_callback:
+            # Error message from get_llm_response (via make_streaming_request) is already printed by the callback.
+            print_callback(f"[MultiStageProcessor] Error in Stage 3 LLM call.\n") # llm_response_stage3_raw may contain the error details.
+        return ""
+
+    selected_command_name = _parse_llm_response_for_last_line(llm_response_stage3_raw)
+
+    if not selected_command_name:
+        if print_callback:
+            print_callback(f"[MultiStageProcessor] Stage 3 Error: LLM did not select a specific command from the list for class '{command_class}'. Or the response was empty after parsing.\nRaw LLM response for selection: '{llm_response_stage3_raw}'\n")
+        return ""
+        
+    return selected_command_name
+
+def _complete_lines(text):
+    """Non-empty complete lines of a partial response, or None inside an unfinished <think> block."""
+    if "<think>" in text and "</think>" not in text:
+        return None
+    return [line.strip() for line in text.split("\n")[:-1] if line.strip()]
+
+def _answer_complete(names, min_lines=1):
+    """Returns a stop_when accepting a response whose last line is one of names.
+
+    One-line answers often end without a newline, so when the response is
+    a single unterminated line it is accepted too, as long as no longer
+    name starts with it ("break" could still become "break-range"). After
+    earlier lines the model may be in the middle of a sentence ("data" of
+    "data structures are..."), so there the newline is waited for. The
+    stop_when returns the response up to and including the accepted line,
+    or None while more is needed.
+    """
+    names = set(names)
+    unambiguous = {name for name in names if not any(other != name and other.startswith(name) for other in names)}
+
+    def complete(text):
+        lines = _complete_lines(text)
+        if lines is None:
+            return None
+        head, _, partial = text.rpartition("\n")
+        partial = partial.strip()
+        if not lines and min_lines <= 1 and partial in unambiguous:
+            return text
+        if lines and lines[-1] in names and len(lines) >= min_lines:
+            return head
+        return None
+    return complete
+
+# stop_when for Stage 1: a summary line followed by a valid class line has arrived
+_stage1_complete = _answer_complete(SUPPORTED_COMMAND_CLASSES, min_lines=2)
+
+def _stage3_complete(help_listing):
+    """Returns a stop_when for Stage 3: a line naming a listed command has arrived."""
+    return _answer_complete(entry.name for entry in command_matcher.parse_help_listing(help_listing))
+
+def _report_prompt_size(stage_label, stage, print_callback, *prompt_parts):
+    if print_callback:
+        tokens = sum(prompt_budget.estimate_tokens(part) for part in prompt_parts)
+        print_callback(f"[MultiStageProcessor] {stage_label} prompt: ~{tokens} input tokens "
+                       f"(budget {prompt_budget.get_budget(stage)})\n")
+
 def _parse_llm_response_for_last_line(response_text):
     if not response_text: # Handles None or empty string
         return "" 
@@ -282,18 +551,21 @@ def _parse_llm_response_for_last_line(response_text):
         return "" 
     return lines[-1]
 
-def _execute_gdb_command_safely(command_str, to_string=False, print_callback=None):
+def _execute_gdb_command_safely(command_str, to_string=False, print_callback=None, bounded=True):
     """
     Executes a GDB command and handles potential errors.
     Returns the command output or an error-prefixed string.
+    With bounded=False the output is returned whole, e.g. help listings that
+    prompt_budget ranks and trims itself.
     """
     if print_callback:
         print_callback(f"[MultiStageProcessor] Executing GDB command: {command_str}\n")
     try:
+        if to_string and bounded:
+            # Runaway output is cut to head and tail with its original size
+            return output_capture.capture(command_str)
         output = gdb.execute(command_str, to_string=to_string)
-        if to_string and output is None: # Some commands return None on success instead of empty string
-            return ""
-        return output if to_string else "" # Don't return the gdb.Value object if not to_string
+        return (output or "") if to_string else ""
     except gdb.error as e: # Errors during GDB command execution (e.g., command not found, syntax error)
         err_msg = f"GDB_EXECUTION_ERROR: Error executing GDB command '{command_str}': {str(e)}"
         if print_callback:
@@ -0,0 +1,266 @@
+import atexit
+import os
+import signal
+import tempfile
+import threading
+
+import gdb
+
+# Bounded capture of command output. gdb.execute(..., to_string=True) builds
+# the whole output in memory, so "bt full" on deep recursion or "info
+# functions" on a large binary produces megabytes that are then printed and
+# pasted into the next prompt. Here GDB's logging is redirected to a file
+# while the command runs; a watcher thread interrupts the command (as Ctrl-C
+# would) once the file grows past ABORT_BYTES, and only the head and tail of
+# the file are read back, with a marker giving the original size. GDB
+# versions without "set logging enabled", or sessions where the user is
+# already logging, fall back to to_string and are truncated afterwards.
+
+# Output kept for display and prompts; larger output is cut to a head and a
+# tail excerpt
+MAX_BYTES = 64 * 1024
+MAX_LINES = 1000
+
+# Share of the kept output taken from the beginning
+HEAD_SHARE = 0.7
+
+# Output size at which a command is interrupted
+ABORT_BYTES = 8 * 1024 * 1024
+
+# Seconds between size checks of the watcher thread
+POLL_INTERVAL = 0.05
+
+STATS = {"captures": 0, "truncated": 0, "interrupted": 0, "fallbacks": 0,
+         "bytes_seen": 0, "bytes_kept": 0}
+
+# None until the first capture, then whether logging redirection works here
+_redirect_supported = None
+_log_path = None
+
+
+def _elision_marker(omitted_lines, omitted_bytes, total_lines, total_bytes, interrupted):
+    size = f"{total_lines} lines, {total_bytes} bytes"
+    if interrupted:
+        size += " when the command was interrupted"
+    return f"[... {omitted_lines} lines ({omitted_bytes} bytes) elided, output was {size} ...]"
+
+
+def _excerpt(head, tail, total_bytes, total_lines, max_bytes, max_lines, interrupted=False):
+    """Joins head and tail lines (bytes, without line endings) around an elision marker.
+
+    head holds the first lines of the output and tail the last ones (the
+    same list when all of it is in memory). Since the kept lines stay within
+    limits the output exceeds, the two excerpts never overlap.
+    """
+    head_bytes, head_lines = int(max_bytes * HEAD_SHARE), int(max_lines * HEAD_SHARE)
+    kept_head, used = [], 0
+    for line in head[:head_lines]:
+        if used + len(line) + 1 > head_bytes:
+            break
+        kept_head.append(line)
+        used += len(line) + 1
+    tail_bytes, tail_lines = max_bytes - used, max_lines - len(kept_head)
+    kept_tail, used_tail = [], 0
+    for line in reversed(tail[-tail_lines:] if tail_lines > 0 else []):
+        if used_tail + len(line) + 1 > tail_bytes:
+            break
+        kept_tail.append(line)
+        used_tail += len(line) + 1
+    kept_tail.reverse()
+    omitted_lines = total_lines - len(kept_head) - len(kept_tail)
+    omitted_bytes = max(0, total_bytes - used - used_tail)
+    marker = _elision_marker(omitted_lines, omitted_bytes, total_lines, total_bytes, interrupted).encode()
+    return b"\n".join(kept_head + [marker] + kept_tail)
+
+
+def bound_text(text, max_bytes=MAX_BYTES, max_lines=MAX_LINES):
+    """Cuts text already in memory to the byte and line limits.
+
+    Returns: (str) text itself if it fits, otherwise its head and tail
+    around an elision marker
+    """
+    data = text.encode("utf-8", errors="replace")
+    lines = data.split(b"\n")
+    if data.endswith(b"\n"):
+        lines.pop()
+    if len(data) <= max_bytes and len(lines) <= max_lines:
+        return text
+    result = _excerpt(lines, lines, len(data), len(lines), max_bytes, max_lines)
+    return result.decode("utf-8", errors="replace") + "\n"
+
+
+def _read_bounded(path, max_bytes, max_lines, interrupted):
+    """Reads the captured file, loading at most the head and tail excerpts.
+
+    Returns: (tuple) (text, original size in bytes, whether it was cut)
+    """
+    total_bytes = os.path.getsize(path)
+    with open(path, "rb") as f:
+        if total_bytes <= max_bytes:
+            data = f.read()
+            lines = data.split(b"\n")
+            if data.endswith(b"\n"):
+                lines.pop()
+            if len(lines) <= max_lines:
+                text = data.decode("utf-8", errors="replace")
+                if interrupted:
+                    text += f"[... command interrupted after {total_bytes} bytes of output ...]\n"
+                return text, total_bytes, interrupted
+            result = _excerpt(lines, lines, total_bytes, len(lines), max_bytes, max_lines, interrupted)
+            return result.decode("utf-8", errors="replace") + "\n", total_bytes, True
+        head = f.read(max_bytes).split(b"\n")[:-1]
+        # Count lines in chunks instead of reading the whole file
+        f.seek(0)
+        total_lines = 0
+        ends_with_newline = False
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            total_lines += chunk.count(b"\n")
+            ends_with_newline = chunk.endswith(b"\n")
+        if not ends_with_newline:
+            total_lines += 1
+        f.seek(max(0, total_bytes - max_bytes))
+        tail = f.read().split(b"\n")
+        # The first piece is a partial line, a trailing newline leaves an empty one
+        tail = tail[1:]
+        if tail and not tail[-1]:
+            tail.pop()
+    result = _excerpt(head, tail, total_bytes, total_lines, max_bytes, max_lines, interrupted)
+    return result.decode("utf-8", errors="replace") + "\n", total_bytes, True
+
+
+def _parameter(name):
+    try:
+        return gdb.parameter(name)
+    except (gdb.error, RuntimeError):
+        return None
+
+
+def _can_redirect():
+    global _redirect_supported, _log_path
+    if _redirect_supported is None:
+        # "logging enabled" appeared in GDB 12; older versions only have "set logging on"
+        _redirect_supported = _parameter("logging enabled") is not None
+        if _redirect_supported:
+            fd, _log_path = tempfile.mkstemp(prefix="chatgdb-capture-", suffix=".log")
+            os.close(fd)
+            atexit.register(_remove_log)
+    # Never take over logging the user has turned on
+    return _redirect_supported and not _parameter("logging enabled")
+
+
+def _remove_log():
+    try:
+        os.remove(_log_path)
+    except OSError:
+        pass
+
+
+def _on_off(value):
+    return "on" if value else "off"
+
+
+def _watch(path, done, state):
+    """Watcher thread: interrupts the command once its output passes ABORT_BYTES."""
+    while not done.wait(POLL_INTERVAL):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            continue
+        if size > ABORT_BYTES:
+            with state["lock"]:
+                if not done.is_set():
+                    state["interrupted"] = True
+                    os.kill(os.getpid(), signal.SIGINT)
+            return
+
+
+def _execute_redirected(command, max_bytes, max_lines):
+    saved = {name: _parameter(name) for name in ("logging file", "logging redirect", "logging overwrite",
+                                                  "logging debugredirect", "pagination")}
+    done = threading.Event()
+    state = {"lock": threading.Lock(), "interrupted": False}
+    watcher = threading.Thread(target=_watch, args=(_log_path, done, state), name="chatgdb-capture", daemon=True)
+    try:
+        # Everything changed here is put back by _restore, even if a step fails
+        gdb.execute(f"set logging file {_log_path}", to_string=True)
+        gdb.execute("set logging overwrite on", to_string=True)
+        gdb.execute("set logging redirect on", to_string=True)
+        if saved["logging debugredirect"] is not None:
+            gdb.execute("set logging debugredirect on", to_string=True)
+        # A pager prompt would wait for input that the redirected output hides
+        gdb.execute("set pagination off", to_string=True)
+        gdb.execute("set logging enabled on", to_string=True)
+        watcher.start()
+        try:
+            gdb.execute(command, from_tty=False)
+            # The output is complete even if the interrupt lands later
+            state["completed"] = True
+        except (KeyboardInterrupt, gdb.error):
+            # Our own interrupt ends the command like Ctrl-C; anything else is the caller's
+            if not state["interrupted"]:
+                raise
+        finally:
+            with state["lock"]:
+                done.set()
+    finally:
+        if watcher.is_alive():
+            watcher.join()
+        _restore(saved, state)
+    interrupted = state["interrupted"] and not state.get("completed")
+    return _read_bounded(_log_path, max_bytes, max_lines, interrupted) + (interrupted,)
+
+
+def _restore(saved, state):
+    """Turns logging off and puts back the settings changed for a capture.
+
+    The watcher's SIGINT can arrive after the command has already returned
+    and interrupt one of these commands instead; since they only set
+    values, they are simply run again from the start.
+    """
+    while True:
+        try:
+            gdb.execute("set logging enabled off", to_string=True)
+            if saved["logging file"] is not None:
+                gdb.execute(f"set logging file {saved['logging file']}", to_string=True)
+            for name in ("logging redirect", "logging overwrite", "logging debugredirect", "pagination"):
+                if saved[name] is not None:
+                    gdb.execute(f"set {name} {_on_off(saved[name])}", to_string=True)
+            return
+        except (KeyboardInterrupt, gdb.error):
+            if not state["interrupted"] or state.get("late_interrupt"):
+                raise
+            # At most one signal is sent, so at most one retry is needed
+            state["late_interrupt"] = True
+
+
+def capture(command, max_bytes=MAX_BYTES, max_lines=MAX_LINES):
+    """Runs a GDB command and returns its output, cut to the given limits.
+
+    Output within the limits is returned unchanged. Larger output keeps its
+    first and last lines around a marker with the number of elided lines
+    and the original size; output past ABORT_BYTES interrupts the command.
+
+    Params:
+    command (str): the GDB command
+    max_bytes (int): most bytes of output returned
+    max_lines (int): most lines of output returned
+
+    Returns: (str) the output, "" if the command printed nothing
+    Raises: gdb.error like gdb.execute; KeyboardInterrupt if the user
+    pressed Ctrl-C
+    """
+    STATS["captures"] += 1
+    if _can_redirect():
+        text, total_bytes, cut, interrupted = _execute_redirected(command, max_bytes, max_lines)
+        STATS["interrupted"] += interrupted
+    else:
+        STATS["fallbacks"] += 1
+        text = gdb.execute(command, to_string=True) or ""
+        total_bytes = len(text.encode("utf-8", errors="replace"))
+        bounded = bound_text(text, max_bytes, max_lines)
+        cut = bounded is not text
+        text = bounded
+    STATS["truncated"] += cut
+    STATS["bytes_seen"] += total_bytes
+    STATS["bytes_kept"] += len(text)
+    return text
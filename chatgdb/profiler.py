@@ -0,0 +1,167 @@
+import cProfile
+import functools
+import io
+import pstats
+import time
+from datetime import datetime
+
+import gdb
+
+from chatgdb import utils
+
+# Opt-in profiler for the plugin's own cost inside GDB. Entry points wrapped
+# with @profiled run under cProfile while profiling is on, and their wall
+# time is split into plugin Python, gdb.execute, waiting for the network
+# and waiting for the user (ask-mode confirmations). Those buckets come from
+# timing wrappers that are only installed while profiling, so the plugin
+# runs unmodified otherwise.
+
+ACTIVE = False
+
+# entry name -> {"calls", "wall", "gdb", "network", "user"}
+ENTRY_STATS = {}
+
+_profile = None
+_depth = 0
+_execute_depth = 0
+_timers = {"gdb": 0.0, "network": 0.0, "user": 0.0}
+_originals = {}
+
+
+def _timed_execute(command, *args, **kwargs):
+    global _execute_depth
+    if _execute_depth:
+        # Nested gdb.execute (e.g. a command that runs commands) is timed once
+        return _originals["execute"](command, *args, **kwargs)
+    _execute_depth += 1
+    start = time.perf_counter()
+    try:
+        return _originals["execute"](command, *args, **kwargs)
+    finally:
+        _execute_depth -= 1
+        # Ask-mode confirmations run "pi print(input(...))"; that is the user typing
+        _timers["user" if "input(" in command else "gdb"] += time.perf_counter() - start
+
+
+def _timed_stream(self, api_url, headers, data, on_event, *args, **kwargs):
+    # Callbacks run on this thread while it waits; they are not network time
+    callback_time = [0.0]
+
+    def timed_event(payload):
+        start = time.perf_counter()
+        try:
+            on_event(payload)
+        finally:
+            callback_time[0] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    try:
+        return _originals["stream"](self, api_url, headers, data, timed_event, *args, **kwargs)
+    finally:
+        _timers["network"] += time.perf_counter() - start - callback_time[0]
+
+
+def start():
+    """Starts a new profile, discarding the previous one.
+
+    Returns: (bool) False if profiling was already on
+    """
+    global ACTIVE, _profile
+    if ACTIVE:
+        return False
+    _profile = cProfile.Profile()
+    ENTRY_STATS.clear()
+    _originals["execute"] = gdb.execute
+    _originals["stream"] = utils.RequestCoordinator.stream
+    gdb.execute = _timed_execute
+    utils.RequestCoordinator.stream = _timed_stream
+    ACTIVE = True
+    return True
+
+
+def stop():
+    """Stops profiling; the collected data stays available for report().
+
+    Returns: (bool) False if profiling was not on
+    """
+    global ACTIVE
+    if not ACTIVE:
+        return False
+    gdb.execute = _originals.pop("execute")
+    utils.RequestCoordinator.stream = _originals.pop("stream")
+    ACTIVE = False
+    return True
+
+
+def profiled(name):
+    """Decorator for plugin entry points (GDB commands, event handlers).
+
+    While profiling is off the wrapper only checks a flag. Entry points
+    called from inside another one are accounted to the outer one.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            global _depth
+            if not ACTIVE or _depth:
+                return func(*args, **kwargs)
+            _depth += 1
+            before = dict(_timers)
+            start_time = time.perf_counter()
+            profile = _profile
+            profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                _depth -= 1
+                stats = ENTRY_STATS.setdefault(name, {"calls": 0, "wall": 0.0, "gdb": 0.0, "network": 0.0, "user": 0.0})
+                stats["calls"] += 1
+                stats["wall"] += time.perf_counter() - start_time
+                for bucket in _timers:
+                    stats[bucket] += _timers[bucket] - before[bucket]
+        return wrapper
+    return decorator
+
+
+def report(top=25):
+    """Formats the collected profile.
+
+    Returns: (str) per-entry time split and the plugin functions with the
+    most own time
+    """
+    if _profile is None:
+        return "No profile collected. Run 'chat-profile start' first.\n"
+    lines = [f"ChatGDB profile, {datetime.now().isoformat(timespec='seconds')}, GDB {gdb.VERSION}"
+             + (" (still running)" if ACTIVE else ""),
+             f"{'entry':<12} {'calls':>6} {'wall':>9} {'plugin':>9} {'gdb.exec':>9} {'network':>9} {'user':>9}"]
+    totals = {"calls": 0, "wall": 0.0, "gdb": 0.0, "network": 0.0, "user": 0.0}
+    for name, stats in sorted(ENTRY_STATS.items()):
+        lines.append(_entry_line(name, stats))
+        for key in totals:
+            totals[key] += stats[key]
+    lines.append(_entry_line("total", totals))
+    if not ENTRY_STATS:
+        # pstats refuses a profile without any calls
+        return "\n".join(lines) + "\n"
+    output = io.StringIO()
+    function_stats = pstats.Stats(_profile, stream=output)
+    function_stats.sort_stats("tottime").print_stats(r"chatgdb", top)
+    lines.append("")
+    lines.append(f"Plugin functions by own time (top {top}):")
+    lines.append(output.getvalue().strip())
+    return "\n".join(lines) + "\n"
+
+
+def _entry_line(name, stats):
+    plugin = stats["wall"] - stats["gdb"] - stats["network"] - stats["user"]
+    return (f"{name:<12} {stats['calls']:>6} {stats['wall']:>8.3f}s {plugin:>8.3f}s "
+            f"{stats['gdb']:>8.3f}s {stats['network']:>8.3f}s {stats['user']:>8.3f}s")
+
+
+def dump(path):
+    """Writes report() to path and the raw cProfile data to path + ".pstats"."""
+    with open(path, "w") as f:
+        f.write(report())
+    if _profile is not None and ENTRY_STATS:
+        _profile.dump_stats(path + ".pstats")
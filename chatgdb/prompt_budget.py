@@ -0,0 +1,219 @@
+# Token budgeting for the prompts sent to the LLM. Nothing in here talks to
+# GDB or the network, so it is shared by GDB, LLDB and the CLI. Token counts
+# are local estimates that need no tokenizer download.
+import math
+import re
+from collections import deque
+
+# Default input token budget per prompt kind. "default" applies to any call
+# that does not name a stage.
+STAGE_BUDGETS = {
+    "stage1": 1000,
+    "stage3": 1500,
+    "stage5": 2500,
+    "explorer": 3000,
+    "stop": 1500,
+    "watch": 1000,
+    "default": 4000,
+}
+
+# Variable content always gets at least this many tokens, even when the fixed
+# part of a prompt already uses up the budget
+MIN_CONTENT_TOKENS = 200
+
+# Text inserted where content was dropped to fit a budget
+ELISION_MARKER = "[... truncated to fit token budget ...]"
+
+# Most recent calls, one dict per call with the stage, the estimated input
+# tokens and the budget. When the API reports usage, "prompt_tokens",
+# "cached_tokens" and "completion_tokens" are added once the call finishes.
+CALL_LOG = deque(maxlen=50)
+
+_ESTIMATE_RE = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+_WORD_RE = re.compile(r"[a-z0-9_]+")
+
+
+def estimate_tokens(text):
+    """Estimates the number of tokens text uses in a BPE-style tokenizer.
+
+    Letters runs count as one token per started 6 characters, digit groups of
+    up to three as one token and every punctuation character as one token.
+    Whitespace is free. This tracks real tokenizers closely enough on GDB
+    help and command output to keep prompts inside their budgets.
+
+    Params:
+    text (str): text to measure
+
+    Returns: (int) estimated token count
+    """
+    if not text:
+        return 0
+    count = 0
+    for piece in _ESTIMATE_RE.findall(text):
+        if piece[0].isalpha():
+            count += 1 + (len(piece) - 1) // 6
+        else:
+            count += 1
+    return count
+
+
+def get_budget(stage):
+    """Returns the token budget for stage, falling back to the default."""
+    return STAGE_BUDGETS.get(stage, STAGE_BUDGETS["default"])
+
+
+def set_budget(stage, tokens):
+    """Sets the token budget for stage.
+
+    Raises: ValueError: if tokens is not a positive integer.
+    """
+    tokens = int(tokens)
+    if tokens <= 0:
+        raise ValueError("Token budget must be a positive integer")
+    STAGE_BUDGETS[stage] = tokens
+
+
+def content_budget(stage, *fixed_parts):
+    """Returns the tokens left for variable content in a stage's prompt.
+
+    Params:
+    stage (str): prompt kind, see STAGE_BUDGETS
+    fixed_parts (str): the parts of the prompt that are always sent
+
+    Returns: (int) remaining budget, at least MIN_CONTENT_TOKENS
+    """
+    used = sum(estimate_tokens(part) for part in fixed_parts)
+    return max(get_budget(stage) - used, MIN_CONTENT_TOKENS)
+
+
+def record_call(stage, prompt_tokens):
+    """Logs the estimated input size of one LLM call.
+
+    Returns: (dict) the log entry, which the caller may update with the
+    usage reported by the API
+    """
+    stage = stage or "default"
+    entry = {"stage": stage, "estimated": prompt_tokens, "budget": get_budget(stage)}
+    CALL_LOG.append(entry)
+    return entry
+
+
+def tokenize(text):
+    """Lowercases text and splits it into words for ranking.
+
+    Hyphenated and underscored names are also split into their parts, so
+    "text-user-interface" matches a query for "user interface".
+    """
+    words = _WORD_RE.findall(text.lower().replace("-", " "))
+    parts = []
+    for word in words:
+        parts.append(word)
+        if "_" in word:
+            parts.extend(p for p in word.split("_") if p)
+    return parts
+
+
+def bm25_rank(query, documents, k1=1.5, b=0.75):
+    """Ranks documents against query with Okapi BM25.
+
+    Params:
+    query (str): the user query
+    documents (list of str): texts to rank
+
+    Returns: (list) (score, index) pairs, best first. Ties keep document order.
+    """
+    doc_terms = [tokenize(doc) for doc in documents]
+    if not doc_terms:
+        return []
+    avg_len = (sum(len(terms) for terms in doc_terms) / len(doc_terms)) or 1.0
+    doc_freq = {}
+    for terms in doc_terms:
+        for term in set(terms):
+            doc_freq[term] = doc_freq.get(term, 0) + 1
+
+    query_terms = set(tokenize(query))
+    n_docs = len(doc_terms)
+    scored = []
+    for index, terms in enumerate(doc_terms):
+        score = 0.0
+        if terms:
+            term_counts = {}
+            for term in terms:
+                term_counts[term] = term_counts.get(term, 0) + 1
+            for term in query_terms:
+                tf = term_counts.get(term)
+                if not tf:
+                    continue
+                df = doc_freq[term]
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(terms) / avg_len))
+        scored.append((score, index))
+    scored.sort(key=lambda pair: (-pair[0], pair[1]))
+    return scored
+
+
+def fit_help_lines(help_text, query, budget_tokens, top_k=None):
+    """Keeps the help lines most relevant to query within budget_tokens.
+
+    Command lines ("name, alias -- description") are ranked with BM25 against
+    the query and added best first until the budget or top_k is reached.
+    The kept lines are returned in their original order so the listing
+    still reads like GDB's own help output.
+
+    Params:
+    help_text (str): filtered output of "help <class>"
+    query (str): the user query (and optionally the Stage 1 summary)
+    budget_tokens (int): maximum estimated tokens of the result
+    top_k (int, optional): maximum number of command lines to keep
+
+    Returns: (tuple) (fitted text, number of lines dropped)
+    """
+    lines = [line for line in help_text.split("\n") if line.strip()]
+    if estimate_tokens(help_text) <= budget_tokens and (top_k is None or len(lines) <= top_k):
+        return help_text, 0
+    command_lines = [line for line in lines if " -- " in line] or lines
+
+    kept = set()
+    used = 0
+    for score, index in bm25_rank(query, command_lines):
+        if top_k is not None and len(kept) >= top_k:
+            break
+        cost = estimate_tokens(command_lines[index]) + 1
+        if used + cost > budget_tokens:
+            # A cheaper, lower ranked line might still fit
+            continue
+        kept.add(index)
+        used += cost
+    fitted = [command_lines[i] for i in sorted(kept)]
+    return "\n".join(fitted), len(lines) - len(fitted)
+
+
+def truncate_to_budget(text, budget_tokens, keep="head"):
+    """Cuts text down to roughly budget_tokens on line boundaries.
+
+    Params:
+    text (str): text to shorten
+    budget_tokens (int): maximum estimated tokens of the result
+    keep (str): "head" keeps the beginning (e.g. command syntax at the top
+        of help output), "tail" keeps the end (e.g. the most recent history)
+
+    Returns: (str) text itself if it fits, otherwise the kept part with
+    ELISION_MARKER where the rest was dropped
+    """
+    if estimate_tokens(text) <= budget_tokens:
+        return text
+    lines = text.split("\n")
+    if keep == "tail":
+        lines.reverse()
+    kept = []
+    used = estimate_tokens(ELISION_MARKER) + 1
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget_tokens:
+            break
+        kept.append(line)
+        used += cost
+    if keep == "tail":
+        kept.reverse()
+        return "\n".join([ELISION_MARKER] + kept)
+    return "\n".join(kept + [ELISION_MARKER])
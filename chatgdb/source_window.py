@@ -0,0 +1,160 @@
+import mmap
+import os
+import re
+from array import array
+from collections import OrderedDict
+
+import gdb
+
+from chatgdb import prompt_budget
+
+# Source code around the stop point for prompts. Each source file is
+# memory-mapped once and indexed by line start offsets, so extracting the
+# lines around a PC is a slice of the mapping instead of a "list" command
+# formatted by GDB at every stop. A file is re-read when its size or mtime
+# changes (e.g. after an edit and rebuild).
+
+# Lines shown before and after the current line
+CONTEXT_LINES = 6
+
+# Token budget of a window inside a prompt; the window shrinks around the
+# current line until it fits
+WINDOW_TOKENS = 400
+
+# Longest line kept in a window
+MAX_LINE_CHARS = 200
+
+# Mapped files kept open, least recently used are closed first
+MAX_OPEN_FILES = 16
+
+STATS = {"hits": 0, "loads": 0, "reloads": 0}
+
+_NEWLINE_RE = re.compile(rb"\n")
+
+# fullname -> SourceFile
+_files = OrderedDict()
+
+
+class SourceFile:
+    """A memory-mapped source file with the start offset of every line."""
+
+    def __init__(self, path):
+        self.path = path
+        stat = os.stat(path)
+        self.signature = (stat.st_size, stat.st_mtime_ns)
+        self.map = None
+        # offsets[n] is where line n + 1 starts; one entry per line
+        self.offsets = array("Q", [0])
+        self.size = stat.st_size
+        if self.size:
+            with open(path, "rb") as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.offsets.extend(m.end() for m in _NEWLINE_RE.finditer(self.map))
+            if self.offsets[-1] == self.size:
+                # A trailing newline does not start another line
+                self.offsets.pop()
+
+    @property
+    def line_count(self):
+        return len(self.offsets) if self.size else 0
+
+    def is_stale(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return True
+        return (stat.st_size, stat.st_mtime_ns) != self.signature
+
+    def line(self, number):
+        """Returns line number (1-based) without its line ending."""
+        start = self.offsets[number - 1]
+        end = self.offsets[number] if number < len(self.offsets) else self.size
+        text = self.map[start:end].rstrip(b"\r\n").decode("utf-8", errors="replace")
+        if len(text) > MAX_LINE_CHARS:
+            text = text[:MAX_LINE_CHARS - 3] + "..."
+        return text
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+
+def get_file(path):
+    """Returns the SourceFile for path, mapping or re-mapping it as needed.
+
+    Returns: (SourceFile) or None if the file cannot be read
+    """
+    source = _files.get(path)
+    if source is not None and not source.is_stale():
+        _files.move_to_end(path)
+        STATS["hits"] += 1
+        return source
+    if source is not None:
+        STATS["reloads"] += 1
+        source.close()
+        del _files[path]
+    try:
+        source = SourceFile(path)
+    except (OSError, ValueError):
+        return None
+    STATS["loads"] += 1
+    _files[path] = source
+    while len(_files) > MAX_OPEN_FILES:
+        _files.popitem(last=False)[1].close()
+    return source
+
+
+def window(path, line, context_lines=CONTEXT_LINES, budget=WINDOW_TOKENS):
+    """Formats the lines around line of path, the current line marked with "=>".
+
+    Lines farthest from the current line are dropped first until the window
+    fits in budget tokens.
+
+    Returns: (str) the numbered lines, or "" if the file or line is not available
+    """
+    source = get_file(path)
+    if source is None or not 1 <= line <= source.line_count:
+        return ""
+    first = max(1, line - context_lines)
+    last = min(source.line_count, line + context_lines)
+    width = len(str(last))
+    lines = {number: f"{'=>' if number == line else '  '} {number:>{width}}  {source.line(number)}"
+             for number in range(first, last + 1)}
+    costs = {number: prompt_budget.estimate_tokens(text) + 1 for number, text in lines.items()}
+    used = sum(costs.values())
+    while used > budget and first < last:
+        # Drop from the side with more lines left, keeping the window centered
+        if line - first >= last - line:
+            used -= costs[first]
+            first += 1
+        else:
+            used -= costs[last]
+            last -= 1
+    return "\n".join(lines[number] for number in range(first, last + 1))
+
+
+def window_for_frame(frame, context_lines=CONTEXT_LINES, budget=WINDOW_TOKENS):
+    """Returns the source window around frame's current line.
+
+    Returns: (str) a "Source (file:line):" header and the window, or "" when
+    the frame has no line info or its source file is not readable
+    """
+    try:
+        sal = frame.find_sal()
+        if sal.symtab is None or not sal.line:
+            return ""
+        path = sal.symtab.fullname()
+    except (gdb.error, RuntimeError):
+        return ""
+    text = window(path, sal.line, context_lines, budget)
+    if not text:
+        return ""
+    return f"Source ({sal.symtab.filename}:{sal.line}):\n{text}"
+
+
+def clear():
+    """Closes all mapped files."""
+    for source in _files.values():
+        source.close()
+    _files.clear()
@@ -0,0 +1,179 @@
+import time
+from contextlib import contextmanager
+
+import gdb
+
+# Decides which stops get contextual assistance. Every stop is classified by
+# reason (breakpoint, watchpoint, signal, step); disabled reasons are
+# dropped, and repeated stops at the same PC can be sampled and rate limited
+# so that a breakpoint inside a loop does not cost an LLM call per iteration.
+# Both are off by default; a stop skipped by the rate limit says so.
+#
+# Assistance is not given from the stop event itself but just before GDB
+# shows its prompt. Stops without a prompt in between (the intermediate stops
+# of "until", breakpoint command lists that continue, scripts and commands
+# run from Python) collapse into the last one, which is the only one the user
+# gets to see.
+
+REASONS = {"breakpoint": True, "watchpoint": True, "signal": True, "step": True}
+
+# Set to False to turn contextual assistance off completely
+ENABLED = True
+
+# Assist on every Nth stop at the same PC (1 = every stop)
+SAMPLE_EVERY = 1
+
+# Minimum seconds between two assisted stops at the same PC (0 = no limit)
+MIN_INTERVAL = 0.0
+
+# Per-PC state is dropped once this many PCs have been seen
+_MAX_TRACKED_PCS = 4096
+
+_WATCHPOINT_TYPES = tuple(getattr(gdb, name) for name in (
+    "BP_WATCHPOINT", "BP_HARDWARE_WATCHPOINT", "BP_READ_WATCHPOINT", "BP_ACCESS_WATCHPOINT")
+    if hasattr(gdb, name))
+
+STATS = {"stops": 0, "assisted": 0, "coalesced": 0, "suppressed": 0,
+         "disabled": 0, "sampled_out": 0, "rate_limited": 0}
+
+# pc -> [stops seen, time of the last assisted stop]
+_pc_state = {}
+# (reason, pc, event) of the latest stop not yet handled
+_pending = None
+_suppress_depth = 0
+_assist_callback = None
+
+
+def classify(event):
+    """Returns the stop reason: "breakpoint", "watchpoint", "signal" or "step".
+
+    Plain stops (end of step, next, finish, until or an interrupt) count as
+    "step".
+    """
+    if isinstance(event, gdb.BreakpointEvent):
+        breakpoints = getattr(event, "breakpoints", None) or [event.breakpoint]
+        if any(bp.type in _WATCHPOINT_TYPES for bp in breakpoints):
+            return "watchpoint"
+        return "breakpoint"
+    if isinstance(event, gdb.SignalEvent):
+        return "signal"
+    return "step"
+
+
+def _current_pc():
+    try:
+        return gdb.selected_frame().pc()
+    except gdb.error:
+        return None
+
+
+def should_assist(reason, pc, now=None):
+    """Applies the reason filter, sampling and rate limit to one stop.
+
+    Params:
+    reason (str): result of classify()
+    pc (int): PC of the stop, or None if there is no frame
+    now (float, optional): current time.monotonic()
+
+    Returns: (bool) True if the stop should get assistance
+    """
+    if not ENABLED or not REASONS.get(reason, True):
+        STATS["disabled"] += 1
+        return False
+    if pc is None:
+        return True
+    if now is None:
+        now = time.monotonic()
+    if pc not in _pc_state and len(_pc_state) >= _MAX_TRACKED_PCS:
+        _pc_state.clear()
+    state = _pc_state.setdefault(pc, [0, None])
+    state[0] += 1
+    if SAMPLE_EVERY > 1 and (state[0] - 1) % SAMPLE_EVERY:
+        STATS["sampled_out"] += 1
+        return False
+    if MIN_INTERVAL and state[1] is not None and now - state[1] < MIN_INTERVAL:
+        STATS["rate_limited"] += 1
+        return False
+    state[1] = now
+    return True
+
+
+@contextmanager
+def suppressed():
+    """Context manager: stops inside it never get assistance.
+
+    Used around commands that ChatGDB runs on its own behalf, e.g. the
+    explorer's steps.
+    """
+    global _suppress_depth, _pending
+    _suppress_depth += 1
+    try:
+        yield
+    finally:
+        _suppress_depth -= 1
+        if _suppress_depth == 0:
+            _pending = None
+
+
+def reset():
+    """Forgets the per-PC sampling and rate-limit state."""
+    _pc_state.clear()
+
+
+def _run(reason, pc, event):
+    rate_limited = STATS["rate_limited"]
+    if should_assist(reason, pc):
+        STATS["assisted"] += 1
+        _assist_callback(event)
+    elif STATS["rate_limited"] > rate_limited:
+        gdb.write(f"[ChatGDB] Assistance throttled: this PC was assisted less than {MIN_INTERVAL:g}s ago "
+                  "(chat-assist interval to change)\n")
+
+
+def _on_stop(event):
+    global _pending
+    STATS["stops"] += 1
+    if _suppress_depth:
+        STATS["suppressed"] += 1
+        _pending = None
+        return
+    stop = (classify(event), _current_pc(), event)
+    if not hasattr(gdb.events, "before_prompt"):
+        # Without before_prompt (GDB < 8) every stop is decided on its own
+        _run(*stop)
+        return
+    if _pending is not None:
+        STATS["coalesced"] += 1
+    _pending = stop
+
+
+def _on_before_prompt():
+    global _pending
+    stop, _pending = _pending, None
+    if stop is not None:
+        _run(*stop)
+
+
+def install(assist_callback):
+    """Connects the policy to GDB's events.
+
+    Params:
+    assist_callback (callable): called with the gdb.StopEvent of every stop
+        that should get assistance
+    """
+    global _assist_callback
+    _assist_callback = assist_callback
+    gdb.events.stop.connect(_on_stop)
+    if hasattr(gdb.events, "before_prompt"):
+        gdb.events.before_prompt.connect(_on_before_prompt)
+
+
+def format_stats():
+    """Returns the policy settings and counters as text."""
+    reasons = ", ".join(f"{r} {'on' if on else 'off'}" for r, on in REASONS.items())
+    return (f"Stop assistance: {'on' if ENABLED else 'off'} ({reasons})\n"
+            f"Per PC: every {SAMPLE_EVERY} stop(s), at most once per {MIN_INTERVAL:g}s, "
+            f"{len(_pc_state)} PCs tracked\n"
+            f"Stops: {STATS['stops']}, assisted: {STATS['assisted']}, coalesced: {STATS['coalesced']}, "
+            f"suppressed: {STATS['suppressed']}, reason disabled: {STATS['disabled']}, "
+            f"sampled out: {STATS['sampled_out']}, rate limited: {STATS['rate_limited']}\n")
@@ -0,0 +1,174 @@
+import re
+
+import gdb
+
+# Lines the model sometimes emits around the actual commands. They are never
+# handed to gdb.execute.
+_FENCE_PREFIX = "```"
+_PROMPT_PREFIX = "(gdb)"
+_THINK_OPEN = "<think>"
+_THINK_CLOSE = "</think>"
+
+_COMMAND_WORD_RE = re.compile(r"[A-Za-z][\w-]*")
+
+# First words GDB resolved to a command. Misses are not remembered, since
+# the user may define the command later.
+_known_commands = set()
+
+
+def is_gdb_command(word):
+    """Returns True if GDB resolves word to a command. Must run on the GDB thread."""
+    if word in _known_commands:
+        return True
+    try:
+        gdb.execute(f"help {word}", to_string=True)
+    except gdb.error:
+        # Undefined or ambiguous
+        return False
+    _known_commands.add(word)
+    return True
+
+
+def validate_line(line):
+    """Checks a single streamed line before it is handed to GDB.
+
+    Params:
+    line (str): one raw line of Stage 5 output
+
+    Returns: (tuple) (command, reason). command is the cleaned command string,
+    or None when the line must not be executed, in which case reason explains
+    why ("" for lines that are silently ignored such as blanks and fences).
+    """
+    command = line.strip()
+    if not command or command.startswith(_FENCE_PREFIX):
+        return None, ""
+    if command.startswith("#"):
+        # Comments, including the "# No valid command" marker from Stage 5
+        return None, ""
+    if command.startswith(_PROMPT_PREFIX):
+        command = command[len(_PROMPT_PREFIX):].strip()
+        if not command:
+            return None, ""
+    if any(ord(ch) < 32 and ch != "\t" for ch in command):
+        return None, "contains control characters"
+    match = _COMMAND_WORD_RE.match(command)
+    # GDB command names are lower case; a capitalized first word is prose
+    if not match or match.group(0)[0].isupper() or not is_gdb_command(match.group(0)):
+        return None, "not a GDB command"
+    return command, ""
+
+
+def confirm_command(command):
+    """Asks the user whether command should be run. Returns True on yes."""
+    question = f"Execute '{command}'? (y/n): "
+    response_str = gdb.execute(f"pi print(input({question!r}))", to_string=True)
+    response = response_str.strip().lower().replace('"', '').replace("'", "")
+    return response in ["y", "yes"]
+
+
+class StreamedCommandExecutor:
+    """Runs Stage 5 output line by line while it is being streamed.
+
+    In agent mode each complete line is validated and executed as soon as it
+    arrives, so GDB works on the first command while the model is still
+    generating the next ones. In ask mode lines are queued and confirmed one
+    at a time once the stream has finished. Every line gets its own result
+    entry, so an error on line 2 is reported against line 2. After a failing
+    line the remaining lines are skipped, since they usually depend on it.
+    """
+
+    def __init__(self, ask_mode=False):
+        self.ask_mode = ask_mode
+        # (line number, command, status, detail) per received command line
+        self.results = []
+        self._queued = []
+        self._line_number = 0
+        self._failed = False
+        self._in_think = False
+
+    def feed_line(self, line):
+        """Line callback for utils.get_llm_response / the multi-stage processor."""
+        # Reasoning in <think> blocks is never executed
+        if self._in_think:
+            if _THINK_CLOSE not in line:
+                return
+            self._in_think = False
+            line = line.split(_THINK_CLOSE, 1)[1]
+        if _THINK_OPEN in line:
+            before, _, after = line.partition(_THINK_OPEN)
+            if _THINK_CLOSE in after:
+                line = before + after.split(_THINK_CLOSE, 1)[1]
+            else:
+                self._in_think = True
+                line = before
+        command, reason = validate_line(line)
+        if command is None:
+            if reason:
+                self._line_number += 1
+                self._record(line.strip(), "rejected", reason)
+            return
+        self._line_number += 1
+        if self.ask_mode:
+            self._queued.append((self._line_number, command))
+        else:
+            self._run(self._line_number, command)
+
+    def finish(self, execute_queued=True):
+        """Confirms and runs queued lines (ask mode) and prints a summary.
+
+        Params:
+        execute_queued (bool): when False, queued lines are dropped, e.g.
+            because the pipeline reported an error after streaming them.
+
+        Returns: (bool) True if no line failed or was rejected
+        """
+        queued, self._queued = self._queued, []
+        for line_number, command in queued:
+            if not execute_queued:
+                self._record(command, "skipped", "pipeline did not complete", line_number)
+            elif self._failed:
+                self._record(command, "skipped", "an earlier line failed", line_number)
+            else:
+                try:
+                    confirmed = confirm_command(command)
+                except Exception as e:
+                    self._record(command, "skipped", f"error during confirmation: {e}", line_number)
+                    continue
+                if confirmed:
+                    self._run(line_number, command)
+                else:
+                    self._record(command, "declined", "", line_number)
+        self._report()
+        return all(r[2] in ("ok", "declined") for r in self.results)
+
+    def _run(self, line_number, command):
+        if self._failed:
+            self._record(command, "skipped", "an earlier line failed", line_number)
+            return
+        try:
+            gdb.execute(command)
+        except gdb.error as e:
+            self._failed = True
+            self._record(command, "error", str(e), line_number)
+            gdb.write(f"[line {line_number}] Error: {e}\n")
+            return
+        except Exception as e:
+            self._failed = True
+            self._record(command, "error", f"Python error: {e}", line_number)
+            gdb.write(f"[line {line_number}] Python error: {e}\n")
+            return
+        self._record(command, "ok", "", line_number)
+
+    def _record(self, command, status, detail, line_number=None):
+        if line_number is None:
+            line_number = self._line_number
+        self.results.append((line_number, command, status, detail))
+
+    def _report(self):
+        # A single successful command needs no summary, keep the output as before
+        if not self.results or (len(self.results) == 1 and self.results[0][2] == "ok"):
+            return
+        gdb.write("--- Command results ---\n")
+        for line_number, command, status, detail in sorted(self.results):
+            suffix = f": {detail}" if detail else ""
+            gdb.write(f"[line {line_number}] {status}: {command}{suffix}\n")
@@ -0,0 +1,551 @@
+import base64
+import bisect
+import difflib
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+
+import gdb
+
+# Symbol tables are read straight from the ELF files rather than through the
+# GDB Python API, which must not be used off the GDB thread. That lets the
+# index be built on a background thread while the user keeps debugging. GDB
+# itself is only asked, on its own thread, for the list of objfiles and to
+# resolve the few candidates that end up in a prompt.
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "chatgdb", "symbols")
+_CACHE_VERSION = 2
+
+# Maximum number of candidates put into a prompt
+MAX_PROMPT_CANDIDATES = 8
+
+# Names that merely contain the term are collected up to this many per
+# objfile; exact and prefix matches are always all found
+_MAX_SUBSTRING_MATCHES = 2000
+
+# Typo-tolerant matching only compares this many names sharing a prefix
+_MAX_FUZZY_CANDIDATES = 2000
+
+_SHT_SYMTAB = 2
+_SHT_NOTE = 7
+_SHT_DYNSYM = 11
+_STT_OBJECT = 1
+_STT_FUNC = 2
+_STT_FILE = 4
+_NT_GNU_BUILD_ID = 3
+
+# Kind codes stored per symbol
+KIND_FUNCTION = ord("F")
+KIND_OBJECT = ord("O")
+_KIND_NAMES = {KIND_FUNCTION: "function", KIND_OBJECT: "variable"}
+
+# Words that are part of how people phrase requests, never symbol names
+_STOPWORDS = frozenset("""
+all and any are bad break breakpoint call called calls can change check continue current
+delete display does each every file find finish for frame from function get global
+how info into its line list local locals next not print program run set show source
+stack step stop that the then this times until value var variable watch what when
+where which while why with
+""".split())
+
+_IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}")
+_SOURCE_FILE_RE = re.compile(r"[\w./+-]+\.(?:c|cc|cpp|cxx|h|hh|hpp|hxx|m|mm|rs|go|d|f|f90|s|S)\b")
+
+
+_SOURCE_NAME_RE = re.compile(r"(\d+)")
+
+
+def demangled_name(name):
+    """Returns the qualified name of an Itanium C++ mangled symbol.
+
+    Only the name is decoded, without parameter types, which is what a
+    breakpoint location or a prompt needs: "_ZN5Lexer5parseEv" gives
+    "Lexer::parse", constructors and destructors "Lexer::Lexer" and
+    "Lexer::~Lexer". Non-C++ names are returned unchanged.
+
+    Returns: (str) the name, or None for symbols that are not worth
+    showing (vtables, typeinfo, guard variables, thunks) or whose name uses
+    templates, operators or substitutions this decoder does not handle
+    """
+    if not name.startswith("_Z"):
+        return name
+    # Compiler clones (.cold, .isra.0, .constprop.1) belong to the same function
+    text = name.split(".", 1)[0][2:]
+    nested = text.startswith("N")
+    position = 1 if nested else 0
+    if nested:
+        # CV and ref qualifiers of member functions
+        while position < len(text) and text[position] in "rVKRO":
+            position += 1
+    elif text.startswith("L"):
+        # Internal linkage
+        position = 1
+    parts = []
+    if text.startswith("St", position):
+        parts.append("std")
+        position += 2
+    while position < len(text):
+        char = text[position]
+        if char.isdigit():
+            length = _SOURCE_NAME_RE.match(text, position).group(1)
+            position += len(length)
+            parts.append(text[position:position + int(length)])
+            position += int(length)
+            if len(parts[-1]) != int(length):
+                return None
+            if not nested:
+                break
+        elif nested and char == "C" and parts and text[position + 1:position + 2] in ("1", "2", "3"):
+            parts.append(parts[-1])
+            position += 2
+        elif nested and char == "D" and parts and text[position + 1:position + 2] in ("0", "1", "2"):
+            parts.append("~" + parts[-1])
+            position += 2
+        elif nested and char == "E":
+            break
+        else:
+            return None
+    if not parts or (nested and not text.startswith("E", position)):
+        return None
+    return "::".join(parts)
+
+
+class _ElfFile:
+    """Minimal ELF reader for section headers, the build-id and symbols."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data = self.data
+        if data[:4] != b"\x7fELF":
+            self.close()
+            raise ValueError(f"{path} is not an ELF file")
+        self.is_64 = data[4] == 2
+        self.endian = "<" if data[5] == 1 else ">"
+        if self.is_64:
+            shoff, = struct.unpack_from(self.endian + "Q", data, 0x28)
+            shentsize, shnum = struct.unpack_from(self.endian + "HH", data, 0x3A)
+            section_format = self.endian + "IIQQQQIIQQ"
+        else:
+            shoff, = struct.unpack_from(self.endian + "I", data, 0x20)
+            shentsize, shnum = struct.unpack_from(self.endian + "HH", data, 0x2E)
+            section_format = self.endian + "IIIIIIIIII"
+        # (type, offset, size, link) per section
+        self.sections = []
+        for i in range(shnum):
+            fields = struct.unpack_from(section_format, data, shoff + i * shentsize)
+            self.sections.append((fields[1], fields[4], fields[5], fields[6]))
+
+    def close(self):
+        self.data.close()
+
+    def build_id(self):
+        """Returns the GNU build-id as a hex string, or None."""
+        for section_type, offset, size, _ in self.sections:
+            if section_type != _SHT_NOTE:
+                continue
+            position = offset
+            while position + 12 <= offset + size:
+                namesz, descsz, note_type = struct.unpack_from(self.endian + "III", self.data, position)
+                name_start = position + 12
+                desc_start = name_start + ((namesz + 3) & ~3)
+                if note_type == _NT_GNU_BUILD_ID and self.data[name_start:name_start + 3] == b"GNU":
+                    return self.data[desc_start:desc_start + descsz].hex()
+                position = desc_start + ((descsz + 3) & ~3)
+        return None
+
+    def symbols(self):
+        """Reads the defined function and object symbols.
+
+        Returns: (_ObjfileSymbols) the compact table
+        """
+        data = self.data
+        if self.is_64:
+            symbol_format = self.endian + "IBBHQQ"
+        else:
+            symbol_format = self.endian + "IIIBBH"
+        symbol_size = struct.calcsize(symbol_format)
+        # Prefer the full symbol table; stripped binaries only have .dynsym
+        tables = ([s for s in self.sections if s[0] == _SHT_SYMTAB]
+                  or [s for s in self.sections if s[0] == _SHT_DYNSYM])
+        names, kinds, file_ids, files = [], bytearray(), array("I"), []
+        seen = set()
+        for _, offset, size, link in tables:
+            strtab_offset = self.sections[link][1]
+            current_file = 0
+            table = data[offset:offset + size - size % symbol_size]
+            for fields in struct.iter_unpack(symbol_format, table):
+                if self.is_64:
+                    st_name, st_info, _, st_shndx, _, _ = fields
+                else:
+                    st_name, _, _, st_info, _, st_shndx = fields
+                symbol_type = st_info & 0xF
+                if not st_name or symbol_type not in (_STT_FUNC, _STT_OBJECT, _STT_FILE):
+                    continue
+                start = strtab_offset + st_name
+                name = data[start:data.find(b"\0", start)].decode("utf-8", "replace")
+                if symbol_type == _STT_FILE:
+                    files.append(name)
+                    current_file = len(files)
+                    continue
+                # Local symbols follow the STT_FILE entry of their source file;
+                # global ones are not tied to a file in the symbol table.
+                file_id = current_file if (st_info >> 4) == 0 else 0
+                if st_shndx == 0 or "\n" in name:
+                    continue
+                # C++ names go into prompts, so they are stored demangled;
+                # overloads collapse into one entry
+                name = demangled_name(name)
+                if name is None or (name, file_id) in seen:
+                    continue
+                seen.add((name, file_id))
+                names.append(name)
+                kinds.append(KIND_FUNCTION if symbol_type == _STT_FUNC else KIND_OBJECT)
+                file_ids.append(file_id)
+        return _ObjfileSymbols(self.path, "\n" + "\n".join(names) + "\n", kinds, file_ids, files)
+
+
+class _ObjfileSymbols:
+    """Compact symbol table of one objfile.
+
+    Names are kept in one newline-separated string (with a leading and a
+    trailing newline) plus an array of start offsets, so millions of symbols
+    cost little more than their characters and can be searched with a single
+    regular expression pass.
+    """
+
+    def __init__(self, path, names_blob, kinds, file_ids, files):
+        self.path = path
+        self.names_blob = names_blob
+        self.kinds = kinds
+        self.file_ids = file_ids
+        self.files = files
+        self.offsets = array("I")
+        position = 1
+        if len(kinds):
+            for name in names_blob[1:-1].split("\n"):
+                self.offsets.append(position)
+                position += len(name) + 1
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def name_at(self, index):
+        start = self.offsets[index]
+        return self.names_blob[start:self.names_blob.index("\n", start)]
+
+    def index_at(self, position):
+        """Returns the index of the symbol whose name contains position."""
+        return bisect.bisect_right(self.offsets, position) - 1
+
+    def file_of(self, index):
+        file_id = self.file_ids[index]
+        return self.files[file_id - 1] if file_id else None
+
+    def to_bytes(self):
+        payload = {
+            "version": _CACHE_VERSION,
+            "path": self.path,
+            "names": self.names_blob,
+            "kinds": base64.b64encode(bytes(self.kinds)).decode("ascii"),
+            "file_ids": base64.b64encode(self.file_ids.tobytes()).decode("ascii"),
+            "files": self.files,
+        }
+        return zlib.compress(json.dumps(payload).encode("utf-8"))
+
+    @classmethod
+    def from_bytes(cls, data, path):
+        payload = json.loads(zlib.decompress(data).decode("utf-8"))
+        if payload.get("version") != _CACHE_VERSION:
+            raise ValueError("Symbol cache version mismatch")
+        file_ids = array("I")
+        file_ids.frombytes(base64.b64decode(payload["file_ids"]))
+        return cls(path, payload["names"], bytearray(base64.b64decode(payload["kinds"])),
+                   file_ids, payload["files"])
+
+
+def _cache_path(path, build_id):
+    if build_id:
+        key = build_id
+    else:
+        stat = os.stat(path)
+        key = hashlib.sha1(f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}".encode()).hexdigest()
+    return os.path.join(CACHE_DIR, key + ".idx")
+
+
+def load_objfile_symbols(path):
+    """Returns the symbols of the ELF file at path, using the disk cache.
+
+    The cache is keyed by build-id (or path, mtime and size when the file
+    has none), so rebuilt binaries are re-indexed and identical ones shared.
+
+    Returns: (tuple) (_ObjfileSymbols or None if path is not a readable ELF
+    file, whether it came from the cache)
+    """
+    try:
+        elf = _ElfFile(path)
+    except (OSError, ValueError, struct.error):
+        return None, False
+    try:
+        cache_file = _cache_path(path, elf.build_id())
+        try:
+            with open(cache_file, "rb") as f:
+                return _ObjfileSymbols.from_bytes(f.read(), path), True
+        except (OSError, ValueError, KeyError):
+            pass
+        try:
+            symbols = elf.symbols()
+        except (ValueError, struct.error, IndexError):
+            return None, False
+    finally:
+        elf.close()
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write to a temporary name first so a concurrent reader never sees half a file
+        temporary = f"{cache_file}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(symbols.to_bytes())
+        os.replace(temporary, cache_file)
+    except OSError as e:
+        sys.stderr.write(f"[SymbolIndex] Could not write symbol cache {cache_file}: {e}\n")
+    return symbols, False
+
+
+def query_terms(query):
+    """Extracts likely symbol names and source file names from a query.
+
+    Returns: (tuple) (list of identifier terms, list of file names)
+    """
+    files = _SOURCE_FILE_RE.findall(query)
+    remainder = _SOURCE_FILE_RE.sub(" ", query)
+    terms = []
+    for word in _IDENTIFIER_RE.findall(remainder):
+        if word.lower() not in _STOPWORDS and word not in terms:
+            terms.append(word)
+    return terms, files
+
+
+class SymbolIndex:
+    """Lazily built index of the functions and globals of all objfiles."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables = {}
+        self._pending = []
+        self._thread = None
+        # Set by the first full schedule(); until then new objfiles are not indexed
+        self.requested = False
+        self.stats = {"objfiles": 0, "symbols": 0, "cache_hits": 0, "build_seconds": 0.0}
+
+    def is_ready(self):
+        with self._lock:
+            return not self._pending and (self._thread is None or not self._thread.is_alive())
+
+    def schedule(self, paths=None):
+        """Queues objfiles for indexing and starts the background pass.
+
+        Must be called on the GDB thread when paths is None, since the
+        objfile list is then read from gdb.objfiles().
+        """
+        if paths is None:
+            paths = [objfile.filename for objfile in gdb.objfiles() if objfile.filename]
+            self.requested = True
+        with self._lock:
+            for path in paths:
+                if path not in self._tables and path not in self._pending and os.path.isfile(path):
+                    self._pending.append(path)
+            if self._pending and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._build, name="chatgdb-symbol-index", daemon=True)
+                self._thread.start()
+
+    def wait(self, timeout=None):
+        """Blocks until the background pass has finished."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        return self.is_ready()
+
+    def clear(self):
+        with self._lock:
+            self._tables = {}
+            self._pending = []
+            self.stats.update(objfiles=0, symbols=0)
+
+    def _build(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return
+                path = self._pending[0]
+            start = time.monotonic()
+            symbols, from_cache = load_objfile_symbols(path)
+            with self._lock:
+                if path in self._pending:
+                    self._pending.remove(path)
+                    if symbols is not None:
+                        self._tables[path] = symbols
+                        self.stats["objfiles"] += 1
+                        self.stats["symbols"] += len(symbols)
+                        self.stats["cache_hits"] += int(from_cache)
+                self.stats["build_seconds"] += time.monotonic() - start
+
+    def lookup(self, term, file_filter=None, limit=10):
+        """Finds symbols matching term.
+
+        Exact matches rank first, then case-insensitive ones, prefixes,
+        substrings and finally close (misspelled) names.
+
+        Params:
+        term (str): name or part of a name
+        file_filter (str, optional): only keep local symbols from source
+            files whose name ends with this (global symbols always pass,
+            their file is resolved later)
+        limit (int): maximum number of results
+
+        Returns: (list) (score, name, kind, file or None, objfile path)
+        """
+        with self._lock:
+            tables = list(self._tables.values())
+        results = {}
+        lowered_term = term.lower()
+        # Names starting with the term, which includes exact matches, and
+        # names containing it further in; only the latter are capped, so a
+        # common substring cannot crowd out "main" itself
+        prefix_pattern = re.compile(r"\n(" + re.escape(term) + r")", re.IGNORECASE)
+        pattern = re.compile(r"[^\n]" + re.escape(term), re.IGNORECASE)
+
+        def add(table, index):
+            name = table.name_at(index)
+            source_file = table.file_of(index)
+            if file_filter and source_file and not source_file.endswith(file_filter):
+                return
+            if name == term:
+                score = 1.0
+            elif name.lower() == lowered_term:
+                score = 0.95
+            elif name.lower().startswith(lowered_term):
+                score = 0.8 + 0.1 * len(term) / len(name)
+            else:
+                score = 0.5 + 0.2 * len(term) / len(name)
+            if file_filter and source_file:
+                score += 0.05
+            key = (name, source_file)
+            if key not in results or results[key][0] < score:
+                results[key] = (score, name, _KIND_NAMES[table.kinds[index]], source_file, table.path)
+
+        for table in tables:
+            blob = table.names_blob
+            matched = 0
+            for match in prefix_pattern.finditer(blob):
+                add(table, table.index_at(match.start(1)))
+                matched += 1
+            substrings = 0
+            position = 0
+            while substrings < _MAX_SUBSTRING_MATCHES:
+                match = pattern.search(blob, position)
+                if match is None:
+                    break
+                # Expand the hit to the whole name and continue after it
+                add(table, table.index_at(match.start()))
+                position = blob.index("\n", match.start()) + 1
+                substrings += 1
+            matched += substrings
+            if matched == 0 and len(term) >= 4:
+                # Nothing contains the term: compare names sharing its first
+                # three characters, which catches most typos cheaply.
+                prefix = re.compile(r"\n(" + re.escape(term[:3]) + r"[^\n]*)", re.IGNORECASE)
+                candidates = {}
+                for match in prefix.finditer(blob):
+                    candidates[match.group(1)] = match.start(1)
+                    if len(candidates) >= _MAX_FUZZY_CANDIDATES:
+                        break
+                for name in difflib.get_close_matches(term, list(candidates), n=limit, cutoff=0.75):
+                    index = table.index_at(candidates[name])
+                    ratio = difflib.SequenceMatcher(None, term, name).ratio()
+                    results.setdefault((name, table.file_of(index)),
+                                       (0.6 * ratio, name, _KIND_NAMES[table.kinds[index]],
+                                        table.file_of(index), table.path))
+        ranked = sorted(results.values(), key=lambda r: (-r[0], len(r[1]), r[1]))
+        return ranked[:limit]
+
+    def candidates_for_query(self, query, limit=MAX_PROMPT_CANDIDATES):
+        """Looks up every symbol-like word of query; returns the best matches."""
+        terms, files = query_terms(query)
+        file_filter = os.path.basename(files[0]) if files else None
+        merged = {}
+        for term in terms:
+            for result in self.lookup(term, file_filter=file_filter, limit=limit):
+                key = (result[1], result[3])
+                if key not in merged or merged[key][0] < result[0]:
+                    merged[key] = result
+        ranked = sorted(merged.values(), key=lambda r: (-r[0], len(r[1]), r[1]))
+        return [r for r in ranked if r[0] >= 0.5][:limit]
+
+
+INDEX = SymbolIndex()
+
+
+def _resolve_location(name, kind):
+    """Returns "file:line" for a symbol using GDB's debug info, or None.
+
+    Must run on the GDB thread.
+    """
+    try:
+        symbol = gdb.lookup_global_symbol(name)
+        if symbol is None and hasattr(gdb, "lookup_static_symbol"):
+            symbol = gdb.lookup_static_symbol(name)
+    except gdb.error:
+        return None
+    if symbol is None or symbol.symtab is None:
+        return None
+    return f"{symbol.symtab.filename}:{symbol.line}"
+
+
+def context_for_query(query, limit=MAX_PROMPT_CANDIDATES):
+    """Formats the program symbols matching query for a prompt.
+
+    Never blocks on the index: the first call starts building it and
+    returns "". Must run on the GDB thread.
+
+    Returns: (str) a short block of candidate symbols, or ""
+    """
+    if not INDEX.is_ready() or not INDEX.stats["objfiles"]:
+        try:
+            INDEX.schedule()
+        except gdb.error:
+            pass
+        if not INDEX.is_ready():
+            return ""
+    candidates = INDEX.candidates_for_query(query, limit)
+    if not candidates:
+        return ""
+    lines = ["Program symbols matching the query (use these exact names):"]
+    for _, name, kind, source_file, _ in candidates:
+        location = _resolve_location(name, kind) or source_file
+        lines.append(f"  {kind} {name}" + (f" ({location})" if location else ""))
+    return "\n".join(lines)
+
+
+def _on_new_objfile(event):
+    # Nothing is parsed before the first query (or the warm-up) asks for the
+    # index; after that, objfiles loaded later are added as they come
+    if INDEX.requested and event.new_objfile.filename:
+        INDEX.schedule([event.new_objfile.filename])
+
+
+def _on_clear_objfiles(event):
+    INDEX.clear()
+
+
+gdb.events.new_objfile.connect(_on_new_objfile)
+if hasattr(gdb.events, "clear_objfiles"):
+    gdb.events.clear_objfiles.connect(_on_clear_objfiles)
@@ -0,0 +1,159 @@
+import time
+
+import gdb
+
+from chatgdb import prompt_budget
+
+# pstack-style snapshot of all threads. Every thread's frame chain is walked
+# through the Python API (much cheaper than formatting "thread apply all bt"
+# as text), threads with identical stacks are grouped, and the summary lists
+# each distinct stack once with its thread count.
+
+# Innermost frames walked per thread; deeper frames rarely tell threads apart
+MAX_FRAMES = 24
+
+# Collection stops after this many seconds; the remaining threads are counted
+# but not walked
+MAX_SECONDS = 2.0
+
+# Distinct stacks listed in a summary, and frames shown per stack
+MAX_GROUPS = 8
+MAX_SHOWN_FRAMES = 8
+
+# Token budget of a summary inside a prompt
+SUMMARY_TOKENS = 500
+
+# pc -> function name. Names resolve the same way until objfiles change.
+# Inline frames share their pc with the frame containing them, so they are
+# never cached.
+_name_cache = {}
+
+
+def _frame_name(frame):
+    pc = frame.pc()
+    if frame.type() == gdb.INLINE_FRAME:
+        return frame.name() or f"0x{pc:x}"
+    name = _name_cache.get(pc)
+    if name is None:
+        name = frame.name() or f"0x{pc:x}"
+        _name_cache[pc] = name
+    return name
+
+
+def _walk(max_frames):
+    names = []
+    frame = gdb.newest_frame()
+    while frame is not None and len(names) < max_frames:
+        names.append(_frame_name(frame))
+        try:
+            frame = frame.older()
+        except gdb.error:
+            # Corrupt stack; what was unwound so far still groups usefully
+            break
+    return tuple(names)
+
+
+def _ranges(numbers, max_parts=6):
+    """Formats sorted thread numbers compactly: [1, 2, 3, 7] -> "1-3,7".
+
+    Only the first max_parts ranges are listed, the rest is counted.
+    """
+    parts = []
+    start = previous = None
+    for number in numbers:
+        if previous is not None and number == previous + 1:
+            previous = number
+            continue
+        if start is not None:
+            parts.append(str(start) if start == previous else f"{start}-{previous}")
+        start = previous = number
+    if start is not None:
+        parts.append(str(start) if start == previous else f"{start}-{previous}")
+    if len(parts) > max_parts:
+        return ",".join(parts[:max_parts]) + f",... +{len(parts) - max_parts} ranges"
+    return ",".join(parts)
+
+
+class ThreadSnapshot:
+    """Threads of the selected inferior grouped by identical stacks."""
+
+    def __init__(self):
+        # stack (tuple of names, innermost first) -> list of thread numbers
+        self.groups = {}
+        self.threads = 0
+        self.skipped = 0
+        self.selected = None
+        self.elapsed = 0.0
+
+    def collect(self, max_frames=MAX_FRAMES, max_seconds=MAX_SECONDS):
+        """Walks every thread's stack. The selected thread and frame are restored."""
+        start = time.perf_counter()
+        try:
+            selected_thread = gdb.selected_thread()
+            selected_frame = gdb.selected_frame()
+        except gdb.error:
+            selected_thread = selected_frame = None
+        self.selected = selected_thread.num if selected_thread else None
+        threads = gdb.selected_inferior().threads()
+        self.threads = len(threads)
+        try:
+            for thread in threads:
+                if (not thread.is_valid() or thread.is_running()
+                        or time.perf_counter() - start > max_seconds):
+                    self.skipped += 1
+                    continue
+                try:
+                    thread.switch()
+                    stack = _walk(max_frames)
+                except gdb.error:
+                    self.skipped += 1
+                    continue
+                self.groups.setdefault(stack, []).append(thread.num)
+        finally:
+            if selected_thread is not None and selected_thread.is_valid():
+                selected_thread.switch()
+                if selected_frame is not None and selected_frame.is_valid():
+                    selected_frame.select()
+        self.elapsed = time.perf_counter() - start
+        return self
+
+    def summary(self, max_groups=MAX_GROUPS, max_shown_frames=MAX_SHOWN_FRAMES):
+        """Formats the groups, largest first, the selected thread's group always included.
+
+        Returns: (str) one header line plus one line per listed stack
+        """
+        ordered = sorted(self.groups.items(), key=lambda item: (self.selected not in item[1], -len(item[1])))
+        lines = [f"Threads: {self.threads} in {len(self.groups)} distinct stacks "
+                 f"(collected in {self.elapsed:.2f}s"
+                 + (f", {self.skipped} not walked" if self.skipped else "") + ")"]
+        for stack, numbers in ordered[:max_groups]:
+            shown = " <- ".join(stack[:max_shown_frames])
+            if len(stack) > max_shown_frames:
+                shown += f" <- ... ({len(stack) - max_shown_frames} more)"
+            marker = ", selected" if self.selected in numbers else ""
+            count = f"{len(numbers)} thread" + ("s" if len(numbers) > 1 else "")
+            lines.append(f"  {count} [{_ranges(sorted(numbers))}{marker}]: {shown or '<no frames>'}")
+        if len(ordered) > max_groups:
+            rest = sum(len(numbers) for _, numbers in ordered[max_groups:])
+            lines.append(f"  ... {len(ordered) - max_groups} more stacks with {rest} threads")
+        return "\n".join(lines)
+
+
+def collect_summary(min_threads=2, budget=SUMMARY_TOKENS):
+    """Returns a budget-bounded snapshot summary, or "" for fewer than min_threads threads."""
+    try:
+        if len(gdb.selected_inferior().threads()) < min_threads:
+            return ""
+        text = ThreadSnapshot().collect().summary()
+    except gdb.error as e:
+        return f"Thread snapshot not available: {e}"
+    return prompt_budget.truncate_to_budget(text, budget, keep="head")
+
+
+def _on_objfiles_changed(event):
+    _name_cache.clear()
+
+
+gdb.events.new_objfile.connect(_on_objfiles_changed)
+if hasattr(gdb.events, "clear_objfiles"):
+    gdb.events.clear_objfiles.connect(_on_objfiles_changed)
@@ -1,10 +1,18 @@
+import asyncio
+import hashlib
 import json
 import sys # Added
+import threading
+import time
+from contextlib import contextmanager
 from posixpath import dirname
 from urllib.error import HTTPError, URLError
 from urllib.request import Request, urlopen
 from os.path import abspath, dirname
 from inspect import getfile, currentframe
+from chatgdb import async_client
+from chatgdb import explain_cache
+from chatgdb import prompt_budget
 
 
 def get_key():
@@ -171,27 +179,115 @@ except FileNotFoundError as e:
     URL = None
 
 
-def explain_helper(prev_command, current_user_query, explanation_prompt_prefix, print_callback):
-    """Generates explanation for either the previous command or a user query with streaming."""
-    question = explanation_prompt_prefix + prev_command if current_user_query == "" else current_user_query
+# Set to False for API providers that reject the "stream_options" field
+REQUEST_STREAM_USAGE = True
+
+# Models that reject the "system" role get their system prompt as a leading
+# user message instead. The message order, and so the cacheable prefix, stays
+# the same.
+_NO_SYSTEM_ROLE_MODELS = ("o1-preview", "o1-mini")
+
+
+def normalize_static_text(text):
+    """Makes static prompt parts byte-stable.
+
+    Provider-side prompt caching only matches identical prefixes, so line
+    endings and trailing whitespace are normalized once here rather than
+    depending on how a prompt file or help text happened to be produced.
+    """
+    lines = text.replace("\r\n", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def build_messages(query, system_prompt=None, static_context=None, model=None):
+    """Builds the message list for a chat completion request.
+
+    The layout is system prompt, then static context, then the dynamic query.
+    The first two only change when the prompt files or the debugger's help
+    text change, so providers can serve them from their prefix cache and
+    only the query has to be processed on every call.
+
+    Params:
+    query (str): the part of the prompt that changes on every call
+    system_prompt (str, optional): instructions, e.g. a stage prompt file
+    static_context (str, optional): reference material such as help output
+    model (str, optional): model name, used to pick the system role
+
+    Returns: (list) message dicts
+    """
+    messages = []
+    if system_prompt:
+        role = "user" if model and model.startswith(_NO_SYSTEM_ROLE_MODELS) else "system"
+        messages.append({"role": role, "content": normalize_static_text(system_prompt)})
+    if static_context:
+        messages.append({"role": "user", "content": normalize_static_text(static_context)})
+    messages.append({"role": "user", "content": query})
+    return messages
+
+
+def _build_request(messages, model):
     data = {
-        "model": get_model(),
-        "messages": [{"role": "user", "content": question}],
+        "model": model,
+        "messages": messages,
         "stream": True
     }
+    if REQUEST_STREAM_USAGE:
+        # Ask for a final usage chunk so prompt and cached token counts can be reported
+        data["stream_options"] = {"include_usage": True}
+    return data
+
+
+def _record_usage(log_entry, usage):
+    if usage:
+        log_entry.update(usage)
+
+
+def explain_helper(prev_command, current_user_query, explanation_prompt_prefix, print_callback, debugger=None):
+    """Generates explanation for either the previous command or a user query with streaming.
+
+    Params:
+    debugger (str, optional): debugger flavor and version, e.g. "gdb 14.2".
+        When given, answers are cached on disk under the command, debugger
+        and model, and a cached answer is replayed through print_callback
+        without an API request.
+
+    Returns: (str) the explanation, or an "ERROR:" string
+    """
+    model = get_model()
+    if current_user_query == "":
+        messages = build_messages(prev_command, system_prompt=explanation_prompt_prefix, model=model)
+        cache_key = explain_cache.make_key("command", prev_command, debugger, model, explanation_prompt_prefix)
+    else:
+        messages = build_messages(current_user_query, model=model)
+        cache_key = explain_cache.make_key("query", current_user_query, debugger, model)
+    if debugger is None:
+        cache_key = None
+    cached = explain_cache.get(cache_key)
+    if cached is not None:
+        print_callback(cached)
+        return cached
+    log_entry = prompt_budget.record_call(
+        "explain", sum(prompt_budget.estimate_tokens(m["content"]) for m in messages))
+    usage = {}
     # Errors are handled by make_streaming_request, which prints to stderr and callback
-    make_streaming_request(URL, HEADERS, data, print_callback)
+    answer = make_streaming_request(URL, HEADERS, _build_request(messages, model), print_callback, usage=usage)
+    _record_usage(log_entry, usage)
+    if answer and not answer.startswith("ERROR:"):
+        explain_cache.put(cache_key, answer, current_user_query or prev_command)
+    return answer
 
 
 def chat_helper(command, prompt, print_callback):
-    data = {
-        "model": get_model(), # Assumes get_model() is defined
-        "messages": [{"role": "user", "content": prompt + command}],
-        "stream": True 
-    }
+    model = get_model() # Assumes get_model() is defined
+    # The fixed instructions go first as the system prompt, the query last
+    messages = build_messages(command, system_prompt=prompt, model=model)
+    log_entry = prompt_budget.record_call(
+        "chat", sum(prompt_budget.estimate_tokens(m["content"]) for m in messages))
+    usage = {}
     
     # URL, HEADERS are assumed to be defined globally in utils.py
-    full_command = make_streaming_request(URL, HEADERS, data, print_callback) 
+    full_command = make_streaming_request(URL, HEADERS, _build_request(messages, model), print_callback, usage=usage)
+    _record_usage(log_entry, usage)
     
     if full_command.startswith("ERROR:"):
         # Error message already printed by make_streaming_request or callback
@@ -202,46 +298,339 @@ def chat_helper(command, prompt, print_callback):
     # The second element is the fully assembled command for execution.
     return full_command, full_command 
 
+class LineBuffer:
+    """Splits a stream of text chunks into complete lines.
+
+    Every line is handed to line_callback as soon as its terminating newline
+    arrives. Whatever is left after the last newline stays pending until
+    flush() is called, so a stream that is cut off mid-line never delivers
+    the partial line.
+    """
+
+    def __init__(self, line_callback):
+        self.line_callback = line_callback
+        self._pending = ""
+
+    def feed(self, text_chunk):
+        self._pending += text_chunk
+        while "\n" in self._pending:
+            line, self._pending = self._pending.split("\n", 1)
+            self.line_callback(line)
+
+    def flush(self):
+        """Delivers the trailing unterminated line, if any."""
+        if self._pending:
+            line, self._pending = self._pending, ""
+            self.line_callback(line)
+
+
+# Client-side rate limits applied by the RequestCoordinator. Bursts of stop
+# events or parallel work are queued instead of tripping provider limits.
+# None disables a limit.
+REQUESTS_PER_SECOND = 3.0
+REQUEST_BURST = 5
+TOKENS_PER_SECOND = 2000.0
+TOKEN_BURST = 16000
+
+
+class TokenBucket:
+    """Thread-safe token bucket.
+
+    reserve() always succeeds and returns how long the caller has to wait
+    before its reservation is covered, so queued callers are served in order
+    and a request larger than the burst size is delayed rather than refused.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1.0):
+        """Takes amount tokens and returns the seconds to wait for them."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+# Called while waiting for a response; returning True aborts the wait as if
+# Ctrl-C had been pressed. LLDB does not turn Ctrl-C into KeyboardInterrupt
+# inside script commands, so lldb.py points this at InterruptRequested().
+INTERRUPT_CHECK = None
+
+# Per-thread Event that aborts requests like Ctrl-C once set, see cancel_on()
+_cancel_scope = threading.local()
+
+
+@contextmanager
+def cancel_on(event):
+    """Context manager: requests made by this thread inside it raise
+    KeyboardInterrupt once event is set.
+
+    Used for requests running on worker threads, which never see Ctrl-C.
+    """
+    previous = getattr(_cancel_scope, "event", None)
+    _cancel_scope.event = event
+    try:
+        yield
+    finally:
+        _cancel_scope.event = previous
+
+
+def _interrupt_requested():
+    event = getattr(_cancel_scope, "event", None)
+    if event is not None and event.is_set():
+        return True
+    return INTERRUPT_CHECK is not None and INTERRUPT_CHECK()
+
+
+class _EnoughReceived(Exception):
+    """Raised from an event callback when stop_when accepted the response so far.
+
+    Carries the part of the response to keep.
+    """
+
+
+class _SharedStream:
+    """Events of one in-flight request, replayed to every waiter."""
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.error = None
+        self.future = None
+        self.waiters = 0
+        self.condition = threading.Condition()
+
+    def publish(self, event):
+        with self.condition:
+            self.events.append(event)
+            self.condition.notify_all()
+
+    def finish(self, error=None):
+        with self.condition:
+            self.done = True
+            self.error = error
+            self.condition.notify_all()
+
+
+class RequestCoordinator:
+    """Deduplicates identical in-flight requests and rate-limits the rest.
+
+    When the same request body is sent to the same URL while an identical
+    request is still streaming (e.g. 'chat' racing the stop assistant), the
+    later caller does not hit the API: it gets the events already received
+    and then follows the live stream. New requests pass a requests-per-second
+    and a tokens-per-second bucket first; the time they spend queued there
+    is recorded in stats() for tuning the limits.
+    """
+
+    def __init__(self, requests_per_second=REQUESTS_PER_SECOND, tokens_per_second=TOKENS_PER_SECOND):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._stats = {
+            "requests": 0,
+            "coalesced": 0,
+            "rate_limited": 0,
+            "total_wait": 0.0,
+            "max_wait": 0.0,
+            "queued": 0,
+            "stopped_early": 0,
+            "interrupted": 0,
+            "cancelled_upstream": 0,
+        }
+        self.configure(requests_per_second, tokens_per_second)
+
+    def configure(self, requests_per_second=None, tokens_per_second=None):
+        """Sets the limits. None disables the respective limit."""
+        self.request_bucket = TokenBucket(requests_per_second, REQUEST_BURST) if requests_per_second else None
+        self.token_bucket = TokenBucket(tokens_per_second, TOKEN_BURST) if tokens_per_second else None
+
+    def stats(self):
+        """Returns a snapshot of the request and queueing counters."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._in_flight)
+        stats["requests_per_second"] = self.request_bucket.rate if self.request_bucket else None
+        stats["tokens_per_second"] = self.token_bucket.rate if self.token_bucket else None
+        return stats
+
+    def stream(self, api_url, headers, data, on_event):
+        """Streams a request through AsyncLLMClient.stream, sharing duplicates.
+
+        on_event is called on the calling thread; an exception it raises ends
+        the wait. A waiter that leaves early (Ctrl-C, INTERRUPT_CHECK, an
+        exception from on_event) only cancels the underlying request if
+        nobody else is waiting for it, which closes its connection.
+        """
+        key = hashlib.sha256((api_url + "\0" + json.dumps(data, sort_keys=True)).encode("utf-8")).hexdigest()
+        with self._lock:
+            shared = self._in_flight.get(key)
+            if shared is None:
+                shared = _SharedStream()
+                self._in_flight[key] = shared
+                self._stats["requests"] += 1
+                leader = True
+            else:
+                self._stats["coalesced"] += 1
+                leader = False
+            shared.waiters += 1
+        if leader:
+            tokens = sum(prompt_budget.estimate_tokens(m.get("content", "")) for m in data.get("messages", []))
+            shared.future = async_client.get_client().submit(self._run(key, shared, api_url, headers, data, tokens))
+
+        index = 0
+        try:
+            while True:
+                with shared.condition:
+                    while index >= len(shared.events) and not shared.done:
+                        shared.condition.wait(0.1)
+                        if _interrupt_requested():
+                            raise KeyboardInterrupt()
+                    pending = shared.events[index:]
+                    done = shared.done
+                index += len(pending)
+                for event in pending:
+                    on_event(event)
+                if done and index >= len(shared.events):
+                    break
+        except BaseException as error:
+            reason = ("stopped_early" if isinstance(error, _EnoughReceived)
+                      else "interrupted" if isinstance(error, KeyboardInterrupt) else None)
+            with self._lock:
+                shared.waiters -= 1
+                abandon = shared.waiters == 0
+                if reason:
+                    self._stats[reason] += 1
+                if abandon and shared.future is not None and not shared.future.done():
+                    self._stats["cancelled_upstream"] += 1
+            if abandon and shared.future is not None:
+                shared.future.cancel()
+            raise
+        with self._lock:
+            shared.waiters -= 1
+        if shared.error is not None:
+            raise shared.error
+
+    async def _run(self, key, shared, api_url, headers, data, tokens):
+        error = None
+        try:
+            delay = 0.0
+            if self.request_bucket:
+                delay = self.request_bucket.reserve(1)
+            if self.token_bucket:
+                delay = max(delay, self.token_bucket.reserve(tokens))
+            if delay > 0:
+                with self._lock:
+                    self._stats["rate_limited"] += 1
+                    self._stats["total_wait"] += delay
+                    self._stats["max_wait"] = max(self._stats["max_wait"], delay)
+                    self._stats["queued"] += 1
+                try:
+                    await asyncio.sleep(delay)
+                finally:
+                    with self._lock:
+                        self._stats["queued"] -= 1
+            await async_client.get_client().stream(api_url, headers, data, shared.publish)
+        except asyncio.CancelledError:
+            error = ConnectionAbortedError("LLM request was cancelled")
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            # Later identical requests start a new stream instead of joining this one
+            with self._lock:
+                if self._in_flight.get(key) is shared:
+                    del self._in_flight[key]
+            shared.finish(error)
+
+
+COORDINATOR = RequestCoordinator()
+
+
 # Ensure Request, urlopen, HTTPError, URLError, json, sys are imported
 # Ensure URL, HEADERS, get_model are available
-def make_streaming_request(api_url, headers_dict, request_data_dict, stream_print_callback):
-    full_response_content = ""
+def make_streaming_request(api_url, headers_dict, request_data_dict, stream_print_callback, line_callback=None, usage=None,
+                           stop_when=None):
+    """Streams a chat completion, returning the full response text.
+
+    Params:
+    api_url (str): chat completions endpoint
+    headers_dict (dict): request headers
+    request_data_dict (dict): JSON body of the request
+    stream_print_callback (callable, optional): receives every content chunk
+        as well as any error message
+    line_callback (callable, optional): receives each complete line of the
+        response content as soon as it has been streamed. Error messages are
+        never passed to it, and the last line is only delivered if the stream
+        finished cleanly.
+    usage (dict, optional): filled with "prompt_tokens", "completion_tokens"
+        and "cached_tokens" if the API reports usage in the stream
+    stop_when (callable, optional): called with the response text received
+        so far after every chunk; once it returns a non-empty string the
+        request is cancelled and that string is the response
+
+    Returns: (str) the stripped response, or an "ERROR: ..." string
+    Raises: KeyboardInterrupt on Ctrl-C, after the request was cancelled
+    """
+    response_parts = []
+    line_buffer = LineBuffer(line_callback) if line_callback else None
+
+    def handle_event(chunk_json_str):
+        try:
+            chunk_data = json.loads(chunk_json_str)
+        except json.JSONDecodeError:
+            # In case of malformed JSON in a chunk, skip it and continue
+            sys.stderr.write(f"Warning: Malformed JSON chunk skipped: {chunk_json_str}\n")
+            return
+        if usage is not None and chunk_data.get('usage'):
+            usage.update(parse_usage(chunk_data['usage']))
+        if chunk_data.get('choices') and len(chunk_data['choices']) > 0:
+            delta = chunk_data['choices'][0].get('delta', {})
+            content_chunk = delta.get('content')
+            if content_chunk:
+                response_parts.append(content_chunk)
+                if stream_print_callback:
+                    stream_print_callback(content_chunk)
+                if line_buffer:
+                    line_buffer.feed(content_chunk)
+                if stop_when is not None:
+                    kept = stop_when("".join(response_parts))
+                    if kept:
+                        raise _EnoughReceived(kept)
+
     try:
-        request_data_bytes = bytes(json.dumps(request_data_dict), encoding="utf-8")
-        req = Request(api_url, headers=headers_dict, data=request_data_bytes, method="POST")
-        
-        with urlopen(req, timeout=60) as response:
-            for line_bytes in response:
-                line = line_bytes.decode('utf-8').strip()
-                if line.startswith('data: '):
-                    chunk_json_str = line[len('data: '):]
-                    if chunk_json_str == "[DONE]":
-                        break
-                    try:
-                        chunk_data = json.loads(chunk_json_str)
-                        if chunk_data.get('choices') and len(chunk_data['choices']) > 0:
-                            delta = chunk_data['choices'][0].get('delta', {})
-                            content_chunk = delta.get('content')
-                            if content_chunk:
-                                full_response_content += content_chunk
-                                if stream_print_callback:
-                                    stream_print_callback(content_chunk)
-                    except json.JSONDecodeError:
-                        # In case of malformed JSON in a chunk, skip it and continue
-                        sys.stderr.write(f"Warning: Malformed JSON chunk skipped: {chunk_json_str}\n")
-                        continue 
-    except HTTPError as error:
+        # The request runs on the client's event-loop thread; events are
+        # handed back to this thread so the callbacks can call into GDB/LLDB.
+        # Identical in-flight requests are shared and new ones rate-limited.
+        COORDINATOR.stream(api_url, headers_dict, request_data_dict, handle_event)
+    except _EnoughReceived as enough:
+        # The parser has what it needs; anything after the accepted part is
+        # text it would ignore anyway
+        if stream_print_callback: stream_print_callback("\n[stopped early: answer complete]\n")
+        return enough.args[0].strip()
+    except KeyboardInterrupt:
+        if stream_print_callback: stream_print_callback("\n[Request cancelled]\n")
+        raise
+    except async_client.HTTPStatusError as error:
         err_msg = f"HTTP Error: {error.status} {error.reason}"
         sys.stderr.write(f"{err_msg}\n")
         if stream_print_callback: stream_print_callback(f"\nLLM API Error: {err_msg}\n")
         return f"ERROR: {err_msg}"
-    except URLError as error:
-        err_msg = f"URL Error: {error.reason}"
+    except (TimeoutError, asyncio.TimeoutError):
+        err_msg = "LLM Request timed out"
         sys.stderr.write(f"{err_msg}\n")
         if stream_print_callback: stream_print_callback(f"\nLLM API Error: {err_msg}\n")
         return f"ERROR: {err_msg}"
-    except TimeoutError:
-        err_msg = "LLM Request timed out"
+    except OSError as error:
+        err_msg = f"URL Error: {error}"
         sys.stderr.write(f"{err_msg}\n")
         if stream_print_callback: stream_print_callback(f"\nLLM API Error: {err_msg}\n")
         return f"ERROR: {err_msg}"
@@ -250,16 +639,52 @@ def make_streaming_request(api_url, headers_dict, request_data_dict, stream_prin
         sys.stderr.write(f"{err_msg}\n")
         if stream_print_callback: stream_print_callback(f"\nLLM API Error: {err_msg}\n")
         return f"ERROR: {err_msg}"
-    
-    return full_response_content.strip()
 
-def get_llm_response(full_prompt_string, stream_print_callback=None):
-    data = {
-        "model": get_model(), # Assumes get_model() is defined
-        "messages": [{"role": "user", "content": full_prompt_string}],
-        "stream": True # Always stream for this function now
+    if line_buffer:
+        line_buffer.flush()
+    return "".join(response_parts).strip()
+
+def parse_usage(usage_dict):
+    """Extracts token counts from an API usage object.
+
+    Cached prompt tokens are reported by OpenAI-style APIs under
+    prompt_tokens_details.cached_tokens; providers that do not cache report 0.
+    """
+    details = usage_dict.get("prompt_tokens_details") or {}
+    return {
+        "prompt_tokens": usage_dict.get("prompt_tokens", 0),
+        "completion_tokens": usage_dict.get("completion_tokens", 0),
+        "cached_tokens": details.get("cached_tokens", 0) or 0,
     }
+
+def get_llm_response(full_prompt_string, stream_print_callback=None, line_callback=None, stage=None,
+                     system_prompt=None, static_context=None, stop_when=None):
+    """Sends a prompt and streams the response.
+
+    Params:
+    full_prompt_string (str): the dynamic part of the prompt (or the whole
+        prompt when system_prompt and static_context are not given)
+    stream_print_callback (callable, optional): receives streamed chunks
+    line_callback (callable, optional): receives each complete response line
+    stage (str, optional): prompt kind used for token accounting, see
+        prompt_budget.STAGE_BUDGETS
+    system_prompt (str, optional): static instructions sent first
+    static_context (str, optional): static reference text sent after the
+        system prompt and before the dynamic part
+    stop_when (callable, optional): ends the stream early once it returns
+        the part of the text so far to keep, see make_streaming_request
+
+    Returns: (str) the response, or an "ERROR: ..." string
+    """
+    model = get_model() # Assumes get_model() is defined
+    messages = build_messages(full_prompt_string, system_prompt, static_context, model)
+    log_entry = prompt_budget.record_call(
+        stage, sum(prompt_budget.estimate_tokens(m["content"]) for m in messages))
+    usage = {}
     # make_streaming_request will handle printing chunks to stream_print_callback
     # and will return the full assembled string or an "ERROR:" string.
-    full_response = make_streaming_request(URL, HEADERS, data, stream_print_callback)
+    full_response = make_streaming_request(URL, HEADERS, _build_request(messages, model),
+                                           stream_print_callback, line_callback, usage=usage,
+                                           stop_when=stop_when)
+    _record_usage(log_entry, usage)
     return full_response
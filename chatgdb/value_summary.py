@@ -0,0 +1,215 @@
+import itertools
+
+import gdb
+
+# Compact formatting of frames and values for prompts. Walking a struct
+# through gdb.Value needs its field list, typedef-stripped type and which
+# pretty-printer applies; these are computed once per type and
+# objfile and kept in a layout cache, so the same structures seen at every
+# stop are formatted from precomputed layouts. The cache is dropped whenever
+# objfiles change.
+
+# Nesting levels expanded, fields shown per struct and elements per array
+MAX_DEPTH = 2
+MAX_FIELDS = 12
+MAX_ELEMENTS = 8
+
+# Characters read from char pointers, and the longest single value summary
+MAX_STRING = 64
+MAX_VALUE_CHARS = 400
+
+# Symbols listed per frame
+MAX_SYMBOLS = 40
+
+STATS = {"hits": 0, "misses": 0, "invalidations": 0}
+
+# (type name, objfile filename) -> TypeLayout
+_layouts = {}
+
+_COMPOUND_CODES = (gdb.TYPE_CODE_STRUCT, gdb.TYPE_CODE_UNION)
+_CHAR_CODES = tuple(getattr(gdb, name) for name in ("TYPE_CODE_INT", "TYPE_CODE_CHAR") if hasattr(gdb, name))
+
+
+class TypeLayout:
+    """What formatting a value of one type needs, computed once."""
+
+    def __init__(self, type_):
+        stripped = type_.strip_typedefs()
+        self.code = stripped.code
+        # (name, gdb.Field) of the non-static fields; values are indexed with
+        # the Field object, which skips the name lookup
+        self.fields = []
+        self.length = 0
+        self.is_string = False
+        # Pretty-printer lookup function that accepted the first value seen
+        # (printers are looked up by value); called directly for later values
+        self.printer = None
+        self.printer_checked = False
+        if self.code in _COMPOUND_CODES:
+            for field in stripped.fields():
+                if not hasattr(field, "bitpos") or field.artificial:
+                    continue
+                self.fields.append((field.name or "<anonymous>", field))
+        elif self.code == gdb.TYPE_CODE_ARRAY:
+            low, high = stripped.range()
+            self.length = high - low + 1
+        elif self.code == gdb.TYPE_CODE_PTR:
+            target = stripped.target().strip_typedefs()
+            self.is_string = target.code in _CHAR_CODES and target.sizeof == 1
+
+
+def _cache_key(type_):
+    objfile = getattr(type_, "objfile", None)
+    return str(type_), objfile.filename if objfile is not None else ""
+
+
+def layout_for(type_):
+    """Returns the cached TypeLayout of type_, building it on first use."""
+    key = _cache_key(type_)
+    layout = _layouts.get(key)
+    if layout is None:
+        STATS["misses"] += 1
+        layout = _layouts[key] = TypeLayout(type_)
+    else:
+        STATS["hits"] += 1
+    return layout
+
+
+def summarize(value, depth=MAX_DEPTH):
+    """Formats value on one line, expanding at most depth levels of nesting.
+
+    Values with a pretty-printer are formatted through the printer cached in
+    their layout; structs, arrays and pointers without one are walked using
+    the cached layout.
+
+    Returns: (str) at most MAX_VALUE_CHARS characters
+    """
+    try:
+        text = _format(value, depth)
+    except gdb.error as e:
+        text = f"<error: {e}>"
+    if len(text) > MAX_VALUE_CHARS:
+        text = text[:MAX_VALUE_CHARS - 3] + "..."
+    return text
+
+
+def _find_printer(value):
+    """Returns the pretty-printer lookup function accepting value, searched in
+    GDB's order (objfiles, program space, global), or None."""
+    sources = [objfile.pretty_printers for objfile in gdb.objfiles()]
+    sources.append(gdb.current_progspace().pretty_printers)
+    sources.append(gdb.pretty_printers)
+    for printers in sources:
+        for lookup in printers:
+            if getattr(lookup, "enabled", True) and lookup(value) is not None:
+                return lookup
+    return None
+
+
+def _format_printer(printer, depth):
+    """Formats a value through its pretty-printer object, within the usual limits."""
+    text = ""
+    if hasattr(printer, "to_string"):
+        result = printer.to_string()
+        if isinstance(result, gdb.LazyString):
+            result = result.value()
+        if isinstance(result, gdb.Value):
+            text = _format(result, depth)
+        elif result is not None:
+            text = str(result)
+    if not hasattr(printer, "children"):
+        return text
+    if depth <= 0:
+        return (text + " " if text else "") + "{...}"
+    is_map = hasattr(printer, "display_hint") and printer.display_hint() == "map"
+    # Maps yield key and value as separate children; one extra child tells
+    # whether anything was left out
+    per_item = 2 if is_map else 1
+    children = list(itertools.islice(printer.children(), MAX_ELEMENTS * per_item + 1))
+    values = [_format(child, depth - 1) if isinstance(child, gdb.Value) else str(child) for _, child in children]
+    if is_map:
+        items = [f"[{values[i]}] = {values[i + 1]}" for i in range(0, min(len(values), MAX_ELEMENTS * 2) - 1, 2)]
+    else:
+        # Array-like printers name their children "[0]", "[1]", ...
+        items = [value if name.startswith("[") else f"{name} = {value}"
+                 for (name, _), value in zip(children[:MAX_ELEMENTS], values)]
+    if len(children) > MAX_ELEMENTS * per_item:
+        items.append("...")
+    return (text + " " if text else "") + "{" + ", ".join(items) + "}"
+
+
+def _format(value, depth):
+    layout = layout_for(value.type)
+    if not layout.printer_checked:
+        layout.printer = _find_printer(value)
+        layout.printer_checked = True
+    if layout.printer is not None:
+        printer = layout.printer(value)
+        # A lookup may still refuse particular values of the type
+        return _format_printer(printer, depth) if printer is not None else str(value)
+    if layout.code in _COMPOUND_CODES:
+        if depth <= 0:
+            return "{...}"
+        parts = [f"{name} = {_format(value[field], depth - 1)}" for name, field in layout.fields[:MAX_FIELDS]]
+        if len(layout.fields) > MAX_FIELDS:
+            parts.append(f"... {len(layout.fields) - MAX_FIELDS} more fields")
+        return "{" + ", ".join(parts) + "}"
+    if layout.code == gdb.TYPE_CODE_ARRAY:
+        if depth <= 0:
+            return f"[{layout.length} items]"
+        shown = min(layout.length, MAX_ELEMENTS)
+        items = [_format(value[index], depth - 1) for index in range(shown)]
+        if layout.length > shown:
+            items.append(f"... {layout.length - shown} more")
+        return "{" + ", ".join(items) + "}"
+    if layout.code == gdb.TYPE_CODE_PTR:
+        address = int(value)
+        if layout.is_string and address:
+            try:
+                return f"{address:#x} {value.string(length=MAX_STRING)!r}"
+            except (gdb.error, UnicodeDecodeError):
+                pass
+        return f"{address:#x}"
+    return str(value)
+
+
+def summarize_frame(frame, max_symbols=MAX_SYMBOLS):
+    """Formats the arguments and locals of frame.
+
+    Returns: (tuple) (arguments, locals) as lists of "name = value" lines,
+    or None when the frame has no debug info
+    """
+    try:
+        block = frame.block()
+    except RuntimeError:
+        return None
+    arguments, local_vars = [], []
+    seen = set()
+    while block is not None and len(seen) < max_symbols:
+        for symbol in block:
+            if not (symbol.is_argument or symbol.is_variable) or symbol.name in seen:
+                continue
+            seen.add(symbol.name)
+            try:
+                text = summarize(symbol.value(frame))
+            except gdb.error as e:
+                text = f"<error: {e}>"
+            (arguments if symbol.is_argument else local_vars).append(f"{symbol.name} = {text}")
+            if len(seen) >= max_symbols:
+                break
+        # Locals of nested blocks up to the function's outermost block
+        if block.function is not None:
+            break
+        block = block.superblock
+    return arguments, local_vars
+
+
+def _on_objfiles_changed(event):
+    if _layouts:
+        STATS["invalidations"] += 1
+    _layouts.clear()
+
+
+gdb.events.new_objfile.connect(_on_objfiles_changed)
+if hasattr(gdb.events, "clear_objfiles"):
+    gdb.events.clear_objfiles.connect(_on_objfiles_changed)
@@ -0,0 +1,217 @@
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, TimeoutError as FutureTimeoutError
+
+from chatgdb import async_client
+from chatgdb import utils
+
+# Background warm-up when the plugin is loaded, so that the first chat is not
+# much slower than the following ones: the API connection (TCP, proxy tunnel,
+# TLS) is opened and kept alive, prompts are read, and debugger-side indexes
+# are built. Steps run one after the other on a daemon thread; steps that
+# need the debugger's own thread hand their work over to it (run_posted) and
+# never block the prompt for long. Nothing in here imports gdb or lldb; the
+# debugger scripts pass in their steps.
+
+# "off" in this file disables the warm-up at load
+WARMUP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".warmup.txt")
+
+# Seconds a single step may take before the warm-up moves on
+STEP_TIMEOUT = 15.0
+
+# "idle", "running", "done" or "cancelled"
+STATE = "idle"
+
+# step name -> [status, seconds, detail]; status is "pending", "running",
+# "ok", "failed" or "cancelled"
+STEPS = {}
+
+_cancel = threading.Event()
+_thread = None
+_lock = threading.Lock()
+_started = None
+_elapsed = 0.0
+
+
+def is_enabled():
+    """Returns False if WARMUP_FILE turns the warm-up off."""
+    try:
+        with open(WARMUP_FILE) as f:
+            return f.read().strip().lower() != "off"
+    except OSError:
+        return True
+
+
+def set_enabled(enabled):
+    """Turns the warm-up at load on or off for future sessions."""
+    with open(WARMUP_FILE, "w") as f:
+        f.write("on\n" if enabled else "off\n")
+
+
+def _wait_future(future, timeout):
+    """Waits for a concurrent future, cancelling it on timeout or cancel()."""
+    deadline = time.monotonic() + timeout
+    while True:
+        if _cancel.is_set():
+            future.cancel()
+            raise CancelledError()
+        try:
+            return future.result(timeout=0.1)
+        except FutureTimeoutError:
+            if time.monotonic() >= deadline:
+                future.cancel()
+                raise
+
+
+def connect_step():
+    """Step: opens a keep-alive connection to the API host.
+
+    Returns: (str) detail for the stats
+    """
+    if not utils.URL:
+        raise RuntimeError("no API URL configured")
+    client = async_client.get_client()
+    pooled = _wait_future(client.prewarm(utils.URL), STEP_TIMEOUT)
+    if not pooled:
+        return "proxy does not allow keep-alive, nothing kept"
+    return f"{client.pool.idle_count()} idle connection(s)"
+
+
+def run_posted(post, func, timeout=STEP_TIMEOUT):
+    """Runs func on the debugger's thread and waits for it.
+
+    Params:
+    post (callable): hands a callable to the debugger thread, e.g. gdb.post_event
+    func (callable): the work; not run at all if the warm-up was cancelled
+        before the debugger got to it
+
+    Returns: whatever func returns
+    """
+    done = threading.Event()
+    outcome = {}
+
+    def posted():
+        if _cancel.is_set():
+            done.set()
+            return
+        try:
+            outcome["result"] = func()
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            done.set()
+
+    post(posted)
+    deadline = time.monotonic() + timeout
+    while not done.wait(0.1):
+        if _cancel.is_set():
+            raise CancelledError()
+        if time.monotonic() >= deadline:
+            raise FutureTimeoutError()
+    if _cancel.is_set():
+        raise CancelledError()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("result")
+
+
+def wait_for(check, timeout=STEP_TIMEOUT):
+    """Polls check() until it returns true, the timeout passes or the warm-up is cancelled.
+
+    Returns: (bool) the last result of check()
+    Raises: CancelledError if the warm-up was cancelled
+    """
+    deadline = time.monotonic() + timeout
+    while not check():
+        if _cancel.is_set():
+            raise CancelledError()
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.1)
+    return True
+
+
+def _run(steps):
+    global STATE, _elapsed
+    for name, func in steps:
+        entry = STEPS[name]
+        if _cancel.is_set():
+            entry[0] = "cancelled"
+            continue
+        entry[0] = "running"
+        start = time.monotonic()
+        try:
+            entry[2] = func() or ""
+            entry[0] = "ok"
+        except CancelledError:
+            entry[0] = "cancelled"
+        except FutureTimeoutError:
+            entry[0], entry[2] = "failed", f"timed out after {STEP_TIMEOUT:g}s"
+        except Exception as e:
+            entry[0], entry[2] = "failed", str(e) or type(e).__name__
+        entry[1] = time.monotonic() - start
+    _elapsed = time.monotonic() - _started
+    STATE = "cancelled" if _cancel.is_set() else "done"
+
+
+def start(steps):
+    """Starts the warm-up on a daemon thread.
+
+    Params:
+    steps (list): (name, callable) pairs run in order; each callable
+        returns an optional detail string and may raise
+
+    Returns: (bool) False if a warm-up is already running
+    """
+    global STATE, _thread, _started
+    with _lock:
+        if _thread is not None and _thread.is_alive():
+            return False
+        _cancel.clear()
+        STEPS.clear()
+        for name, _ in steps:
+            STEPS[name] = ["pending", 0.0, ""]
+        STATE = "running"
+        _started = time.monotonic()
+        _thread = threading.Thread(target=_run, args=(list(steps),), name="chatgdb-warmup", daemon=True)
+        _thread.start()
+    return True
+
+
+def cancel():
+    """Asks the warm-up to stop; the running step is abandoned as soon as possible.
+
+    Returns: (bool) False if no warm-up was running
+    """
+    if _thread is None or not _thread.is_alive():
+        return False
+    _cancel.set()
+    return True
+
+
+def wait(timeout=None):
+    """Blocks until the warm-up has finished. Returns True if it has."""
+    thread = _thread
+    if thread is not None:
+        thread.join(timeout)
+        return not thread.is_alive()
+    return True
+
+
+def format_stats():
+    """Returns the warm-up state, one line per step, and connection pool counters."""
+    enabled = "on" if is_enabled() else "off"
+    if STATE == "running":
+        header = f"Warm-up: running for {time.monotonic() - _started:.2f}s (at load: {enabled})"
+    elif STATE == "idle":
+        header = f"Warm-up: not run (at load: {enabled})"
+    else:
+        header = f"Warm-up: {STATE} in {_elapsed:.2f}s (at load: {enabled})"
+    lines = [header]
+    for name, (status, seconds, detail) in STEPS.items():
+        lines.append(f"  {name:<12} {status:<9} {seconds:>6.2f}s" + (f"  {detail}" if detail else ""))
+    pool = async_client.get_client().pool.stats
+    lines.append(f"Connections: opened {pool['opened']}, reused {pool['reused']}, "
+                 f"stale {pool['stale']}, prewarmed {pool['prewarmed']}")
+    return "\n".join(lines) + "\n"
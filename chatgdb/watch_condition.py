@@ -0,0 +1,261 @@
+import ast
+import time
+
+import gdb
+
+from chatgdb import utils
+
+# Breakpoints whose condition is written by the model from a plain-language
+# description ("stop when len exceeds 1000"). The model answers with a
+# Python expression over the variables in scope; the expression is checked
+# against a whitelist of syntax, compiled once, and evaluated by the
+# breakpoint's stop() method. Symbol lookups are cached per PC, so a hit in a
+# hot loop only reads the values and evaluates the compiled code; stops that
+# do not match never reach the prompt or the LLM.
+
+CONDITION_INSTRUCTIONS = (
+    "Write a condition for a debugger breakpoint as a single Python expression. "
+    "The expression is evaluated each time the breakpoint is hit and the program stops when it is true. "
+    "Use only the listed variable names, integer, float and string constants, comparisons, and/or/not, "
+    "arithmetic and bitwise operators, indexing (a[i]) and struct fields (p.field, also through pointers). "
+    "You may call string(x) to read a char pointer as text, register('rax') to read a register, "
+    "and abs, min, max, int and float. "
+    "Respond with ONLY the expression, without explanation, quotes or markdown."
+)
+
+# Longest accepted condition, in characters and in syntax nodes
+MAX_CONDITION_CHARS = 400
+MAX_CONDITION_NODES = 100
+
+# Variables listed to the model for the breakpoint location
+MAX_SCOPE_SYMBOLS = 60
+
+# Characters read by string()
+MAX_STRING = 256
+
+_ALLOWED_NODES = tuple(node for node in (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd, ast.Invert,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.LShift, ast.RShift,
+    ast.BitAnd, ast.BitOr, ast.BitXor, ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+    ast.IfExp, ast.Name, ast.Load, ast.Constant, ast.Subscript, ast.Attribute, ast.Call,
+    # Python < 3.9 wraps subscripts in Index
+    getattr(ast, "Index", None)) if node is not None)
+
+# (pc, name) -> gdb.Symbol, or None for names not found at that PC
+_symbols = {}
+
+# Watch breakpoints created in this session
+WATCHES = []
+
+
+def _string(value):
+    return value.string(length=MAX_STRING)
+
+
+def _field(value, name):
+    if value.type.strip_typedefs().code == gdb.TYPE_CODE_PTR:
+        value = value.dereference()
+    return value[name]
+
+
+def _register(name):
+    return gdb.selected_frame().read_register(name)
+
+
+# Callable from conditions; _field is only reachable through attribute syntax
+HELPERS = {"string": _string, "register": _register, "abs": abs, "min": min, "max": max,
+           "int": int, "float": float}
+_GLOBALS = dict(HELPERS, _field=_field, __builtins__={})
+
+
+class _FieldAccess(ast.NodeTransformer):
+    """Rewrites p.field into _field(p, "field"), which also follows pointers."""
+
+    def visit_Attribute(self, node):
+        self.generic_visit(node)
+        call = ast.Call(func=ast.Name(id="_field", ctx=ast.Load()),
+                        args=[node.value, ast.Constant(value=node.attr)], keywords=[])
+        return ast.copy_location(call, node)
+
+
+def compile_condition(source, known_names=None):
+    """Validates a condition expression and compiles it.
+
+    Params:
+    source (str): the Python expression
+    known_names (iterable, optional): local variable names the expression
+        may use besides globals; any name is accepted when not given
+
+    Returns: (tuple) (code object, tuple of the variable names it reads)
+    Raises: ValueError describing the first construct that is not allowed
+    """
+    source = source.strip()
+    if not source:
+        raise ValueError("empty condition")
+    if len(source) > MAX_CONDITION_CHARS:
+        raise ValueError(f"condition longer than {MAX_CONDITION_CHARS} characters")
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"not a valid expression: {e.msg}")
+    known = set(known_names) if known_names is not None else None
+    names = []
+    nodes = list(ast.walk(tree))
+    if len(nodes) > MAX_CONDITION_NODES:
+        raise ValueError("condition is too complex")
+    # Helpers may only be called, never passed around as values
+    callees = {id(node.func) for node in nodes if isinstance(node, ast.Call)}
+    for node in nodes:
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"{type(node).__name__} is not allowed in a condition")
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float, str)):
+            raise ValueError(f"constant {node.value!r} is not allowed")
+        if isinstance(node, ast.Attribute) and node.attr.startswith("_"):
+            raise ValueError(f"field {node.attr} is not allowed")
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in HELPERS or node.keywords:
+                raise ValueError(f"only calls to {', '.join(HELPERS)} are allowed")
+        if isinstance(node, ast.Name):
+            if node.id in HELPERS:
+                if id(node) not in callees:
+                    raise ValueError(f"{node.id} can only be called")
+                continue
+            if node.id.startswith("_"):
+                raise ValueError(f"name {node.id} is not allowed")
+            if known is not None and node.id not in known and gdb.lookup_global_symbol(node.id) is None:
+                raise ValueError(f"{node.id} is not a variable in scope")
+            if node.id not in names:
+                names.append(node.id)
+    tree = ast.fix_missing_locations(_FieldAccess().visit(tree))
+    return compile(tree, "<chat-watch condition>", "eval"), tuple(names)
+
+
+def _lookup(frame, name):
+    """Returns the value of variable name in frame, looking the symbol up once per PC."""
+    key = (frame.pc(), name)
+    if key in _symbols:
+        symbol = _symbols[key]
+    else:
+        try:
+            symbol = gdb.lookup_symbol(name, frame.block())[0]
+        except RuntimeError:
+            # No block at this PC (no debug info); globals can still be found
+            symbol = gdb.lookup_global_symbol(name)
+        _symbols[key] = symbol
+    if symbol is None:
+        raise NameError(f"no symbol {name} at this location")
+    return symbol.value(frame) if symbol.needs_frame else symbol.value()
+
+
+class WatchBreakpoint(gdb.Breakpoint):
+    """Breakpoint that stops only when a compiled condition is true."""
+
+    def __init__(self, location, description, condition, known_names=None):
+        code, names = compile_condition(condition, known_names)
+        super(WatchBreakpoint, self).__init__(location)
+        self.location_spec = location
+        self.description = description
+        self.condition_source = condition
+        self._code = code
+        self._names = names
+        self.hits = 0
+        self.stops = 0
+        self.errors = 0
+        self.last_error = None
+        self.eval_time = 0.0
+        WATCHES.append(self)
+
+    def stop(self):
+        start = time.perf_counter()
+        self.hits += 1
+        try:
+            frame = gdb.selected_frame()
+            namespace = {name: _lookup(frame, name) for name in self._names}
+            result = bool(eval(self._code, _GLOBALS, namespace))
+        except Exception as e:
+            # Like a failing GDB condition: stop, so the user can see why
+            self.errors += 1
+            self.last_error = str(e)
+            gdb.write(f"chat-watch {self.number}: error evaluating '{self.condition_source}': {e}\n")
+            result = True
+        self.eval_time += time.perf_counter() - start
+        if result:
+            self.stops += 1
+        return result
+
+
+def scope_symbols(location):
+    """Returns the local variables and arguments visible at location.
+
+    Returns: (list) (name, type name) pairs, empty if the location has no
+    debug info
+    Raises: gdb.error if the location cannot be resolved
+    """
+    sals = gdb.decode_line(location)[1] or []
+    for sal in sals:
+        try:
+            block = gdb.block_for_pc(sal.pc)
+        except RuntimeError:
+            continue
+        symbols = []
+        seen = set()
+        while block is not None and len(symbols) < MAX_SCOPE_SYMBOLS:
+            for symbol in block:
+                if (symbol.is_argument or symbol.is_variable) and symbol.name not in seen:
+                    seen.add(symbol.name)
+                    symbols.append((symbol.name, str(symbol.type)))
+                    if len(symbols) >= MAX_SCOPE_SYMBOLS:
+                        break
+            if block.function is not None:
+                break
+            block = block.superblock
+        return symbols
+    return []
+
+
+def generate_condition(location, description, symbols, print_callback):
+    """Asks the model for a condition expression matching description.
+
+    Params:
+    location (str): breakpoint location as given to the break command
+    description (str): when to stop, in the user's words
+    symbols (list): result of scope_symbols(location)
+    print_callback (callable): receives the streamed response
+
+    Returns: (str) the expression, or an "ERROR: ..." string
+    """
+    prompt = (f"Breakpoint location: {location}\n"
+              + ("Variables in scope:\n" + "\n".join(f"{type_name} {name}" for name, type_name in symbols) + "\n"
+                 if symbols else "")
+              + f"Stop when: {description}")
+    response = utils.get_llm_response(prompt, print_callback, stage="watch",
+                                      system_prompt=CONDITION_INSTRUCTIONS)
+    if response.startswith("ERROR:"):
+        return response
+    lines = [line.strip() for line in response.strip().strip("`").splitlines()]
+    lines = [line for line in lines if line and line.lower() != "python"]
+    return lines[0].strip("'\"") if lines else "ERROR: the model returned no condition"
+
+
+def format_watches():
+    """Returns one line per live watch breakpoint with its counters."""
+    WATCHES[:] = [bp for bp in WATCHES if bp.is_valid()]
+    if not WATCHES:
+        return "No chat-watch breakpoints.\n"
+    lines = []
+    for bp in WATCHES:
+        average = bp.eval_time / bp.hits * 1e6 if bp.hits else 0.0
+        lines.append(f"{bp.number}: {bp.location_spec} if {bp.condition_source}\n"
+                     f"    ({bp.description}) hits {bp.hits}, stops {bp.stops}, errors {bp.errors}, "
+                     f"{average:.1f}us per hit"
+                     + (f", last error: {bp.last_error}" if bp.last_error else ""))
+    return "\n".join(lines) + "\n"
+
+
+def _on_objfiles_changed(event):
+    _symbols.clear()
+
+
+gdb.events.new_objfile.connect(_on_objfiles_changed)
+if hasattr(gdb.events, "clear_objfiles"):
+    gdb.events.clear_objfiles.connect(_on_objfiles_changed)
@@ -0,0 +1,29 @@
+import sys
+import types
+
+# Modules that talk to the debugger import gdb, which only exists inside GDB.
+# Outside it the tests get a minimal module with the names used at import
+# time; tests that need more behaviour set it up themselves.
+try:
+    import gdb  # noqa: F401
+except ImportError:
+    gdb = types.ModuleType("gdb")
+
+    class _EventRegistry:
+        def connect(self, callback):
+            pass
+
+        def disconnect(self, callback):
+            pass
+
+    class Breakpoint:
+        def __init__(self, *args, **kwargs):
+            pass
+
+    gdb.error = type("error", (RuntimeError,), {})
+    gdb.Breakpoint = Breakpoint
+    gdb.TYPE_CODE_PTR = 1
+    gdb.events = types.SimpleNamespace(new_objfile=_EventRegistry(), clear_objfiles=_EventRegistry())
+    gdb.lookup_global_symbol = lambda name: None
+    gdb.write = sys.stdout.write
+    sys.modules["gdb"] = gdb
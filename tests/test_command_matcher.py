@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+from chatgdb import command_matcher
+
+HELP = """break, brea, bre, br, b -- Set breakpoint at specified location.
+tbreak -- Set a temporary breakpoint.
+watch -- Set a watchpoint for an expression.
+rwatch -- Set a read watchpoint for an expression.
+awatch -- Set an access watchpoint for an expression.
+delete, d -- Delete all or some breakpoints.
+condition -- Specify breakpoint number N to break only if COND is true."""
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch):
+    monkeypatch.setattr(command_matcher, "STATS", {"queries": 0, "skipped": 0, "llm": 0})
+    monkeypatch.setattr(command_matcher, "ENABLED", True)
+
+
+def test_parse_help_listing_splits_names_and_aliases():
+    entries = command_matcher.parse_help_listing(HELP + "\n  continuation line without separator")
+    assert [entry.name for entry in entries] == ["break", "tbreak", "watch", "rwatch", "awatch", "delete",
+                                                 "condition"]
+    assert entries[0].aliases == ["brea", "bre", "br", "b"]
+    assert entries[0].description == "Set breakpoint at specified location."
+
+
+def test_confident_unique_match_skips_the_llm():
+    selected, help_text = command_matcher.select_command("break at main", HELP)
+    assert selected == "break"
+    assert help_text == HELP
+    assert command_matcher.STATS == {"queries": 1, "skipped": 1, "llm": 0}
+
+
+def test_close_second_best_falls_through_to_the_llm():
+    ranked = command_matcher.rank_commands("set a watchpoint on an expression",
+                                           command_matcher.parse_help_listing(HELP))
+    assert ranked[0][0] - ranked[1][0] < command_matcher.CONFIDENT_MARGIN
+    selected, help_text = command_matcher.select_command("set a watchpoint on an expression", HELP)
+    assert selected is None
+    # The candidates the LLM chooses from are still in the listing it gets
+    assert "watch -- " in help_text and "rwatch -- " in help_text
+    assert command_matcher.STATS == {"queries": 1, "skipped": 0, "llm": 1}
+
+
+def test_disabled_matcher_always_asks_the_llm(monkeypatch):
+    monkeypatch.setattr(command_matcher, "ENABLED", False)
+    assert command_matcher.select_command("break at main", HELP) == (None, HELP)
+    assert command_matcher.STATS["llm"] == 1
+
+
+def test_is_confident_needs_both_score_and_margin():
+    score, margin = command_matcher.CONFIDENT_SCORE, command_matcher.CONFIDENT_MARGIN
+    assert command_matcher.is_confident([(score, "a")])
+    assert command_matcher.is_confident([(score, "a"), (score - margin, "b")])
+    assert not command_matcher.is_confident([(score - 0.01, "a")])
+    assert not command_matcher.is_confident([(1.0, "a"), (1.0 - margin + 0.01, "b")])
+    assert not command_matcher.is_confident([])
+
+
+def test_top_k_listing_keeps_listing_order(monkeypatch):
+    entries = command_matcher.parse_help_listing(HELP)
+    ranked = command_matcher.rank_commands("read watchpoint", entries)
+    listing = command_matcher.top_k_listing(entries, ranked, k=3)
+    names = [line.split(" -- ")[0] for line in listing.split("\n")]
+    assert len(names) == 3 and "rwatch" in names
+    assert names == [entry.name for entry in entries if entry.name in names]
+
+
+def _write_sessions(path, records):
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n" if record is not None else "\n")
+
+
+def _record(query, selected, selected_by="llm"):
+    return {"query": query, "summary": "", "command_class": "breakpoints", "help": HELP,
+            "selected": selected, "selected_by": selected_by}
+
+
+def test_evaluate_sessions_counts(tmp_path):
+    path = tmp_path / "sessions.jsonl"
+    _write_sessions(path, [
+        _record("break at main", "break"),                        # confident and right
+        _record("break at main", "tbreak"),                       # confident and wrong
+        _record("set a watchpoint on an expression", "watch"),    # left to the LLM
+        None,
+        _record("delete breakpoint 2", "delete", "matcher"),      # not a reference answer
+        _record("break at main", ""),                             # no answer
+    ])
+    result = command_matcher.evaluate_sessions(str(path))
+    assert result == {"records": 3, "skip_rate": pytest.approx(2 / 3), "accuracy": 0.5, "top_k_recall": 1.0}
+
+
+def test_evaluate_sessions_recall_uses_top_k_and_aliases(tmp_path, monkeypatch):
+    monkeypatch.setattr(command_matcher, "TOP_K", 1)
+    path = tmp_path / "sessions.jsonl"
+    _write_sessions(path, [
+        _record("set a watchpoint on an expression", "awatch"),   # outside the top 1
+        _record("break at main", "b"),                            # alias of the top command
+    ])
+    result = command_matcher.evaluate_sessions(str(path))
+    assert result["records"] == 2
+    assert result["top_k_recall"] == 0.5
+
+
+def test_evaluate_sessions_of_an_empty_file(tmp_path):
+    path = tmp_path / "sessions.jsonl"
+    path.write_text("")
+    assert command_matcher.evaluate_sessions(str(path)) == {"records": 0, "skip_rate": 0.0, "accuracy": 0.0,
+                                                            "top_k_recall": 0.0}
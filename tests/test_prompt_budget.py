@@ -0,0 +1,113 @@
+import pytest
+
+from chatgdb import prompt_budget
+
+
+def test_estimate_tokens_counts_words_digits_and_punctuation():
+    assert prompt_budget.estimate_tokens("") == 0
+    assert prompt_budget.estimate_tokens("hello world") == 2
+    assert prompt_budget.estimate_tokens("   \n\t") == 0
+    # Letter runs cost one token per started 6 characters
+    assert prompt_budget.estimate_tokens("abcdef") == 1
+    assert prompt_budget.estimate_tokens("abcdefg") == 2
+    # Digits go in groups of three, punctuation is one token each
+    assert prompt_budget.estimate_tokens("1234") == 2
+    assert prompt_budget.estimate_tokens("p->next") == 4
+
+
+def test_content_budget_subtracts_fixed_parts(monkeypatch):
+    monkeypatch.setitem(prompt_budget.STAGE_BUDGETS, "stage1", 1000)
+    assert prompt_budget.content_budget("stage1") == 1000
+    assert prompt_budget.content_budget("stage1", "word " * 100, "x " * 50) == 850
+
+
+def test_content_budget_never_goes_below_the_floor(monkeypatch):
+    monkeypatch.setitem(prompt_budget.STAGE_BUDGETS, "stage1", 1000)
+    assert prompt_budget.content_budget("stage1", "word " * 950) == prompt_budget.MIN_CONTENT_TOKENS
+    assert prompt_budget.content_budget("stage1", "word " * 5000) == 200
+
+
+def test_content_budget_falls_back_to_the_default_stage(monkeypatch):
+    monkeypatch.setitem(prompt_budget.STAGE_BUDGETS, "default", 3000)
+    assert prompt_budget.content_budget("no-such-stage", "word " * 10) == 2990
+
+
+def test_set_budget_rejects_non_positive_values():
+    with pytest.raises(ValueError):
+        prompt_budget.set_budget("stage1", 0)
+
+
+def test_bm25_ranks_the_matching_document_first():
+    documents = ["break -- Set breakpoint at specified location",
+                 "watch -- Set a watchpoint for an expression",
+                 "step -- Step program until it reaches a different source line"]
+    ranked = prompt_budget.bm25_rank("stop when the expression changes, watchpoint", documents)
+    assert ranked[0][1] == 1
+    assert ranked[0][0] > ranked[1][0]
+
+
+def test_bm25_prefers_rarer_terms():
+    documents = ["set value", "set value", "set breakpoint"]
+    ranked = prompt_budget.bm25_rank("set breakpoint", documents)
+    assert ranked[0][1] == 2
+
+
+def test_bm25_ties_keep_document_order():
+    ranked = prompt_budget.bm25_rank("nothing matches", ["alpha", "beta", "gamma"])
+    assert ranked == [(0.0, 0), (0.0, 1), (0.0, 2)]
+    assert prompt_budget.bm25_rank("query", []) == []
+
+
+def test_bm25_splits_hyphenated_names():
+    ranked = prompt_budget.bm25_rank("user interface", ["text-user-interface -- TUI", "list -- list lines"])
+    assert ranked[0][1] == 0 and ranked[0][0] > 0
+
+
+HELP = "\n".join(f"command{i} -- Does thing number {i}" for i in range(40)) + \
+       "\nwatch -- Set a watchpoint for an expression"
+
+
+def test_fit_help_lines_returns_text_that_fits_unchanged():
+    assert prompt_budget.fit_help_lines(HELP, "watchpoint", 10000) == (HELP, 0)
+
+
+def test_fit_help_lines_keeps_the_best_lines_in_listing_order():
+    fitted, dropped = prompt_budget.fit_help_lines(HELP, "watchpoint number 7", 30)
+    lines = fitted.split("\n")
+    assert "watch -- Set a watchpoint for an expression" in lines
+    assert "command7 -- Does thing number 7" in lines
+    assert prompt_budget.estimate_tokens(fitted) + len(lines) <= 30
+    assert dropped == 41 - len(lines)
+    listing = HELP.split("\n")
+    assert lines == sorted(lines, key=listing.index)
+
+
+def test_fit_help_lines_respects_top_k():
+    fitted, dropped = prompt_budget.fit_help_lines(HELP, "watchpoint", 10000, top_k=3)
+    assert len(fitted.split("\n")) == 3
+    assert dropped == 38
+
+
+TEXT = "\n".join(f"line {i}" for i in range(100))
+
+
+def test_truncate_to_budget_returns_text_that_fits_unchanged():
+    assert prompt_budget.truncate_to_budget(TEXT, 10000) is TEXT
+
+
+def test_truncate_to_budget_keeps_the_head():
+    result = prompt_budget.truncate_to_budget(TEXT, 50)
+    lines = result.split("\n")
+    assert lines[0] == "line 0"
+    assert lines[-1] == prompt_budget.ELISION_MARKER
+    assert lines[:-1] == [f"line {i}" for i in range(len(lines) - 1)]
+    assert prompt_budget.estimate_tokens(result) + len(lines) <= 50
+
+
+def test_truncate_to_budget_keeps_the_tail():
+    result = prompt_budget.truncate_to_budget(TEXT, 50, keep="tail")
+    lines = result.split("\n")
+    assert lines[0] == prompt_budget.ELISION_MARKER
+    assert lines[-1] == "line 99"
+    assert lines[1:] == [f"line {i}" for i in range(100 - len(lines) + 1, 100)]
+    assert prompt_budget.estimate_tokens(result) + len(lines) <= 50
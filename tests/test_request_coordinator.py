@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from chatgdb import async_client
+from chatgdb import utils
+
+URL = "http://127.0.0.1:9/v1/chat/completions"
+BODY = {"model": "m", "messages": [{"role": "user", "content": "explain bt"}], "stream": True}
+
+
+class FakeAPI:
+    """Stands in for the network: every request streams EVENTS once released."""
+
+    EVENTS = ["a", "b", "c"]
+
+    def __init__(self):
+        self.calls = 0
+        self.cancelled = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    async def stream_events(self, api_url, headers, data, on_event, pool=None):
+        self.calls += 1
+        self.started.set()
+        try:
+            while not self.release.is_set():
+                await asyncio.sleep(0.01)
+            for event in self.EVENTS:
+                on_event(event)
+                await asyncio.sleep(0.01)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+@pytest.fixture
+def api(monkeypatch):
+    fake = FakeAPI()
+    monkeypatch.setattr(async_client, "stream_events", fake.stream_events)
+    monkeypatch.setattr(async_client, "_client", async_client.AsyncLLMClient())
+    return fake
+
+
+def _stream_in_thread(coordinator, received, data=BODY, on_event=None):
+    result = {}
+
+    def run():
+        try:
+            coordinator.stream(URL, {}, data, on_event or received.append)
+        except BaseException as error:
+            result["error"] = error
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, result
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_identical_concurrent_requests_share_one_stream(api):
+    coordinator = utils.RequestCoordinator(None, None)
+    first, second = [], []
+    leader, _ = _stream_in_thread(coordinator, first)
+    assert api.started.wait(5)
+    follower, _ = _stream_in_thread(coordinator, second)
+    _wait_for(lambda: coordinator.stats()["coalesced"] == 1)
+    api.release.set()
+    leader.join(5)
+    follower.join(5)
+    assert api.calls == 1
+    assert first == second == FakeAPI.EVENTS
+    stats = coordinator.stats()
+    assert stats["requests"] == 1 and stats["in_flight"] == 0
+
+
+def test_different_bodies_are_separate_requests(api):
+    coordinator = utils.RequestCoordinator(None, None)
+    api.release.set()
+    other = dict(BODY, messages=[{"role": "user", "content": "explain next"}])
+    coordinator.stream(URL, {}, BODY, lambda event: None)
+    coordinator.stream(URL, {}, other, lambda event: None)
+    assert api.calls == 2
+    assert coordinator.stats()["coalesced"] == 0
+
+
+class _LeaveEarly(Exception):
+    pass
+
+
+def test_follower_leaving_early_keeps_the_leaders_request(api):
+    coordinator = utils.RequestCoordinator(None, None)
+    leader_events, follower_events = [], []
+
+    def leave_after_first(event):
+        follower_events.append(event)
+        raise _LeaveEarly()
+
+    leader, leader_result = _stream_in_thread(coordinator, leader_events)
+    assert api.started.wait(5)
+    follower, follower_result = _stream_in_thread(coordinator, follower_events, on_event=leave_after_first)
+    _wait_for(lambda: coordinator.stats()["coalesced"] == 1)
+    api.release.set()
+    follower.join(5)
+    leader.join(5)
+    assert isinstance(follower_result["error"], _LeaveEarly)
+    assert follower_events == ["a"]
+    assert "error" not in leader_result
+    assert leader_events == FakeAPI.EVENTS
+    assert api.cancelled == 0
+    assert coordinator.stats()["cancelled_upstream"] == 0
+
+
+def test_last_waiter_leaving_cancels_the_request(api):
+    coordinator = utils.RequestCoordinator(None, None)
+
+    def leave(event):
+        raise _LeaveEarly()
+
+    api.release.set()
+    with pytest.raises(_LeaveEarly):
+        coordinator.stream(URL, {}, BODY, leave)
+    _wait_for(lambda: api.cancelled == 1)
+    assert coordinator.stats()["cancelled_upstream"] == 1
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(utils.time, "monotonic", fake)
+    return fake
+
+
+def test_token_bucket_serves_the_burst_without_waiting(clock):
+    bucket = utils.TokenBucket(rate=2, capacity=5)
+    assert [bucket.reserve() for _ in range(5)] == [0.0] * 5
+
+
+def test_token_bucket_waits_once_the_burst_is_used(clock):
+    bucket = utils.TokenBucket(rate=2, capacity=5)
+    for _ in range(5):
+        bucket.reserve()
+    # Queued callers wait in order: one token every half second
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+    clock.now += 1.0
+    assert bucket.reserve() == pytest.approx(0.5)
+
+
+def test_token_bucket_refills_up_to_capacity(clock):
+    bucket = utils.TokenBucket(rate=2, capacity=5)
+    bucket.reserve(5)
+    clock.now += 60.0
+    assert bucket.reserve(5) == 0.0
+    assert bucket.reserve(1) == pytest.approx(0.5)
+
+
+def test_token_bucket_delays_requests_larger_than_the_burst(clock):
+    bucket = utils.TokenBucket(rate=1000, capacity=16000)
+    assert bucket.reserve(20000) == pytest.approx(4.0)
+
+
+def test_line_buffer_delivers_complete_lines_only():
+    lines = []
+    buffer = utils.LineBuffer(lines.append)
+    for chunk in ("break ma", "in\nrun\n", "\nprint x"):
+        buffer.feed(chunk)
+    assert lines == ["break main", "run", ""]
+    buffer.flush()
+    assert lines == ["break main", "run", "", "print x"]
+    buffer.flush()
+    assert len(lines) == 4
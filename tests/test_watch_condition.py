@@ -0,0 +1,112 @@
+import pytest
+
+import gdb
+from chatgdb import watch_condition
+
+
+class FakeType:
+    def __init__(self, code):
+        self.code = code
+
+    def strip_typedefs(self):
+        return self
+
+
+class FakeValue:
+    """A struct value, or a pointer to one when target is given."""
+
+    def __init__(self, fields=None, target=None):
+        self.fields = fields or {}
+        self.target = target
+        self.type = FakeType(gdb.TYPE_CODE_PTR if target is not None else 0)
+
+    def dereference(self):
+        return self.target
+
+    def __getitem__(self, name):
+        return self.fields[name]
+
+
+def _evaluate(source, **variables):
+    code, names = watch_condition.compile_condition(source)
+    return eval(code, watch_condition._GLOBALS, variables), names
+
+
+@pytest.mark.parametrize("source", [
+    "__import__('os').system('true')",
+    "x.__class__",
+    "x._private",
+    "_secret > 1",
+    "_field(x, 'a')",
+    "__builtins__",
+])
+def test_underscore_and_dunder_names_are_rejected(source):
+    with pytest.raises(ValueError):
+        watch_condition.compile_condition(source)
+
+
+@pytest.mark.parametrize("source", [
+    "len(x) > 3",
+    "open('/etc/passwd')",
+    "x.method()",
+    "(max if a else min)(b)",
+    "max(a, key=b)",
+    "string",
+    "min if a else max",
+])
+def test_calls_outside_the_helpers_are_rejected(source):
+    with pytest.raises(ValueError):
+        watch_condition.compile_condition(source)
+
+
+@pytest.mark.parametrize("source", [
+    "lambda: 1",
+    "(lambda a: a)(x)",
+    "[a for a in b]",
+    "{a for a in b}",
+    "{a: 1 for a in b}",
+    "any(a for a in b)",
+    "(y := 1)",
+    "x if None else y",
+    "[1, 2]",
+])
+def test_lambdas_comprehensions_and_other_syntax_are_rejected(source):
+    with pytest.raises(ValueError):
+        watch_condition.compile_condition(source)
+
+
+def test_empty_long_and_invalid_conditions_are_rejected():
+    for source in ("", "   ", "x > ", "x + " * watch_condition.MAX_CONDITION_CHARS + "1"):
+        with pytest.raises(ValueError):
+            watch_condition.compile_condition(source)
+
+
+def test_names_must_be_in_scope_when_known_names_are_given():
+    watch_condition.compile_condition("count > 3", known_names=["count"])
+    with pytest.raises(ValueError, match="not a variable in scope"):
+        watch_condition.compile_condition("missing > 3", known_names=["count"])
+
+
+def test_allowed_condition_reports_the_names_it_reads():
+    _, names = watch_condition.compile_condition("a[i] + 1 > max(b, 2) and not flag or abs(a[0]) == 3")
+    assert sorted(names) == ["a", "b", "flag", "i"]
+
+
+def test_field_access_is_rewritten():
+    code, names = watch_condition.compile_condition("s.len > 1000")
+    assert "_field" in code.co_names
+    assert names == ("s",)
+    assert _evaluate("s.len > 1000", s=FakeValue({"len": 1001}))[0] is True
+    assert _evaluate("s.len > 1000", s=FakeValue({"len": 10}))[0] is False
+
+
+def test_field_access_follows_pointers():
+    node = FakeValue({"next": FakeValue(target=FakeValue({"value": 7}))})
+    head = FakeValue(target=node)
+    assert _evaluate("head.next.value == 7", head=head) == (True, ("head",))
+
+
+def test_conditions_have_no_builtins():
+    code, _ = watch_condition.compile_condition("x > 1")
+    assert watch_condition._GLOBALS["__builtins__"] == {}
+    assert eval(code, watch_condition._GLOBALS, {"x": 2}) is True